@@ -0,0 +1,3 @@
+"""
+Benchmarks of the app, run against stand-ins for the database.
+"""
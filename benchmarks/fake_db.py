@@ -0,0 +1,280 @@
+"""
+A stand-in for a pymysql connection that serves synthetic rows.
+
+The rows are generated once per size and handed out again for every query,
+so the benchmarks measure the row mapping and serialization of the app
+rather than the generation of the data.
+"""
+
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Any, List, Optional, Sequence, Tuple
+
+from pymysql.cursors import DictCursorMixin
+
+# The tables in the order they are matched against a query, with the columns
+# the app selects from them.
+_TABLES: Tuple[Tuple[str, Tuple[str, ...]], ...] = (
+    (
+        "coa_data.event_items",
+        ("record_id", "event_id", "item_id", "quantity", "updated_by", "updated_tsp"),
+    ),
+    (
+        "coa_data.event",
+        (
+            "event_id",
+            "site_id",
+            "volunteer_date",
+            "volunteer_cnt",
+            "trash_items_cnt",
+            "trashbag_cnt",
+            "trash_weight",
+            "walking_distance",
+            "updated_by",
+            "updated_tsp",
+        ),
+    ),
+    (
+        "coa_data.site",
+        (
+            "site_id",
+            "site_name",
+            "state",
+            "county",
+            "town",
+            "street",
+            "zipcode",
+            "lat",
+            "long",
+        ),
+    ),
+    ("coa_data.item", ("item_id", "material", "category", "item_name")),
+)
+
+_START = datetime(2000, 1, 1, 9, 30)
+
+
+def _row(table: str, index: int) -> Tuple[Any, ...]:
+    """
+    Generates a synthetic row of a table.
+
+    Args:
+        table: The name of the table.
+        index: The position of the row, used to vary its values.
+
+    Returns:
+        The row in the order the app selects the columns.
+    """
+    tsp = _START + timedelta(minutes=index)
+    if table == "coa_data.item":
+        return (index, "Plastic", f"Category {index % 20}", f"Item {index}")
+    if table == "coa_data.site":
+        return (
+            index,
+            f"Site {index}",
+            "NJ",
+            f"County {index % 21}",
+            f"Town {index % 300}",
+            None if index % 3 else f"{index} Ocean Ave",
+            "07701",
+            Decimal("40.000000") + Decimal(index % 1000) / 10000,
+            Decimal("-74.000000") - Decimal(index % 1000) / 10000,
+        )
+    if table == "coa_data.event":
+        return (
+            index,
+            index % 500,
+            date(2000 + index % 20, 4 if index % 2 else 10, 1),
+            index % 80,
+            index * 7 % 1000,
+            float(index % 30),
+            index % 200 / 3,
+            index % 15 / 4,
+            "volunteer@example.com",
+            tsp,
+        )
+    return (index, index // 40, index % 300, index % 50, "volunteer@example.com", tsp)
+
+
+class FakeDatabase:
+    """
+    The synthetic contents of every table, with the same number of rows each.
+    """
+
+    def __init__(self, size: int) -> None:
+        """
+        The constructor of the FakeDatabase class.
+
+        Args:
+            size: The number of rows in every table.
+        """
+        self.size = size
+        self.tables = {
+            table: [_row(table, index) for index in range(1, size + 1)]
+            for table, _ in _TABLES
+        }
+
+    def connect(self) -> "FakeConnection":
+        """
+        Opens a connection, to be passed to db_accessor.set_connect.
+
+        Returns:
+            A new connection to the fake database.
+        """
+        return FakeConnection(self)
+
+
+class FakeCursor:
+    """
+    A cursor that answers every SELECT with all the rows of its table.
+    """
+
+    def __init__(self, database: FakeDatabase, as_dicts: bool) -> None:
+        """
+        The constructor of the FakeCursor class.
+
+        Args:
+            database: The database to read from.
+            as_dicts: Whether to return rows as dictionaries.
+        """
+        self.database = database
+        self.as_dicts = as_dicts
+        self.description: Optional[Tuple[Tuple[str, ...], ...]] = None
+        self.rowcount = 0
+        self.lastrowid = 0
+        self._rows: Sequence[Any] = ()
+        self._position = 0
+
+    def execute(self, query: str, args: Any = None) -> int:
+        """
+        Runs a query, reading the rows of the table it selects from.
+
+        Args:
+            query: The query to run.
+            args: The parameters of the query, which are ignored.
+
+        Returns:
+            The number of rows selected.
+        """
+        _ = args
+        self._position = 0
+        if not query.lstrip().upper().startswith("SELECT"):
+            self.description = None
+            self._rows = ()
+            self.rowcount = 1
+            return 1
+
+        for table, columns in _TABLES:
+            if table in query:
+                rows: Sequence[Any] = self.database.tables[table]
+                if self.as_dicts:
+                    rows = [dict(zip(columns, row)) for row in rows]
+                self.description = tuple((column,) for column in columns)
+                self._rows = rows
+                self.rowcount = len(rows)
+                return self.rowcount
+        raise ValueError(f"The fake database has no table for {query!r}.")
+
+    def executemany(self, query: str, args: Sequence[Any]) -> int:
+        """
+        Runs a query for every set of parameters.
+
+        Args:
+            query: The query to run.
+            args: The sets of parameters.
+
+        Returns:
+            The number of rows affected.
+        """
+        return sum(self.execute(query, params) for params in args)
+
+    def fetchone(self) -> Any:
+        """
+        Fetches the next row.
+
+        Returns:
+            The next row or None when there are no more.
+        """
+        if self._position >= len(self._rows):
+            return None
+        self._position += 1
+        return self._rows[self._position - 1]
+
+    def fetchall(self) -> List[Any]:
+        """
+        Fetches the remaining rows.
+
+        Returns:
+            The remaining rows.
+        """
+        rows = self._rows[self._position :]
+        self._position = len(self._rows)
+        return rows if isinstance(rows, list) else list(rows)
+
+    def __iter__(self):
+        """
+        Iterates over the remaining rows.
+
+        Returns:
+            An iterator of the rows.
+        """
+        return iter(self.fetchone, None)
+
+    def close(self) -> None:
+        """
+        Closes the cursor.
+        """
+        self._rows = ()
+
+
+class FakeConnection:
+    """
+    A connection to the fake database with the parts of pymysql's API used.
+    """
+
+    def __init__(self, database: FakeDatabase) -> None:
+        """
+        The constructor of the FakeConnection class.
+
+        Args:
+            database: The database to connect to.
+        """
+        self.database = database
+
+    def cursor(self, cursor_class: Any = None) -> FakeCursor:
+        """
+        Opens a cursor.
+
+        Args:
+            cursor_class: The pymysql cursor class asked for.
+
+        Returns:
+            A cursor returning dictionaries for the dictionary cursor classes.
+        """
+        as_dicts = cursor_class is not None and issubclass(
+            cursor_class, DictCursorMixin
+        )
+        return FakeCursor(self.database, as_dicts)
+
+    def ping(self, reconnect: bool = False) -> None:
+        """
+        Checks the connection, which is always alive.
+
+        Args:
+            reconnect: Whether to reconnect, which is ignored.
+        """
+
+    def commit(self) -> None:
+        """
+        Commits the transaction, which does nothing.
+        """
+
+    def rollback(self) -> None:
+        """
+        Rolls the transaction back, which does nothing.
+        """
+
+    def close(self) -> None:
+        """
+        Closes the connection, which does nothing.
+        """
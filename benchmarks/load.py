@@ -0,0 +1,452 @@
+"""
+A load test of the whole app against a seeded SQLite stand-in database.
+
+The app is served by several forked worker processes sharing one listening
+socket, each with its own connection pool and caches, the way uwsgi runs
+it. A number of client threads then replay a weighted mix of the read and
+write routes for a while and the throughput and latency percentiles of
+every route are reported.
+
+The pool, cache and hashing settings are read from the environment as
+usual, so different settings can be compared run to run.
+
+Usage:
+    python -m benchmarks.load [--database DIR] [--workers 4] [--concurrency 16]
+                              [--duration 30] [--mix events=35,items=10,...]
+"""
+
+import argparse
+from collections import defaultdict
+import http.client
+import json
+import logging
+import multiprocessing
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from werkzeug.serving import make_server
+
+from coa_flask_app import APP, db_accessor
+
+from benchmarks import sqlite_db
+
+# The method, path and JSON body of a request.
+Request = Tuple[str, str, Optional[Dict[str, Any]]]
+
+DEFAULT_MIX = (
+    "events=35,event_items=30,sites=10,items=10,"
+    "add_event_item=8,update_event_item=4,add_event=2,login=1"
+)
+
+
+class Dataset:
+    """
+    The ranges of the seeded rows, used to make up valid requests.
+    """
+
+    def __init__(self, directory: str) -> None:
+        """
+        The constructor of the Dataset class.
+
+        Args:
+            directory: The directory holding the seeded database.
+        """
+        connection = sqlite_db.SQLiteConnection(directory).connection
+        (
+            self.first_year,
+            self.last_year,
+            self.events,
+            self.records,
+            self.items,
+            self.sites,
+        ) = connection.execute(
+            """
+            SELECT
+                (SELECT MIN(strftime('%Y', volunteer_date)) FROM coa_data.event),
+                (SELECT MAX(strftime('%Y', volunteer_date)) FROM coa_data.event),
+                (SELECT MAX(event_id) FROM coa_data.event),
+                (SELECT MAX(record_id) FROM coa_data.event_items),
+                (SELECT MAX(item_id) FROM coa_data.item),
+                (SELECT MAX(site_id) FROM coa_data.site)
+            """
+        ).fetchone()
+        self.first_year = int(self.first_year)
+        self.last_year = int(self.last_year)
+        connection.close()
+
+
+def _routes(data: Dataset) -> Dict[str, Callable[[random.Random], Request]]:
+    """
+    Gets the request makers of every route in the mix.
+
+    Args:
+        data: The ranges of the seeded rows.
+
+    Returns:
+        A dictionary of the mix names to the functions making their requests.
+    """
+
+    def _season(rand: random.Random) -> Dict[str, Any]:
+        return {
+            "volunteer_year": rand.randint(data.first_year, data.last_year),
+            "volunteer_season": rand.choice(("Spring", "Fall")),
+        }
+
+    def _event_item(rand: random.Random) -> Dict[str, Any]:
+        return {
+            "event_id": rand.randint(1, data.events),
+            "item_id": rand.randint(1, data.items),
+            "quantity": rand.randint(1, 60),
+            "updated_by": sqlite_db.USERNAME,
+        }
+
+    return {
+        "events": lambda rand: (
+            "GET",
+            "/events?volunteer_year={volunteer_year}"
+            "&volunteer_season={volunteer_season}".format(**_season(rand)),
+            None,
+        ),
+        "event_items": lambda rand: (
+            "GET",
+            f"/event-items?event_id={rand.randint(1, data.events)}",
+            None,
+        ),
+        "sites": lambda rand: ("GET", "/sites", None),
+        "items": lambda rand: ("GET", "/items", None),
+        "add_event_item": lambda rand: ("POST", "/event-items/add", _event_item(rand)),
+        "update_event_item": lambda rand: (
+            "POST",
+            "/event-items/update",
+            dict(_event_item(rand), record_id=rand.randint(1, data.records)),
+        ),
+        "add_event": lambda rand: (
+            "POST",
+            "/events/add",
+            dict(
+                _season(rand),
+                updated_by=sqlite_db.USERNAME,
+                site_id=rand.randint(1, data.sites),
+                volunteer_cnt=rand.randint(2, 80),
+                trashbag_cnt=rand.randint(1, 30),
+                trash_weight=round(rand.random() * 200, 1),
+                walking_distance=round(rand.random() * 5, 2),
+            ),
+        ),
+        "login": lambda rand: (
+            "POST",
+            "/login",
+            {"username": sqlite_db.USERNAME, "password": sqlite_db.PASSWORD},
+        ),
+    }
+
+
+def _serve(listener: socket.socket, directory: str) -> None:
+    """
+    Serves the app from a worker process on the shared socket.
+
+    Args:
+        listener: The listening socket shared by the workers.
+        directory: The directory holding the seeded database.
+    """
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    db_accessor.set_connect(sqlite_db.connector(directory))
+    host, port = listener.getsockname()
+    make_server(host, port, APP, threaded=True, fd=listener.fileno()).serve_forever()
+
+
+def _send(port: int, request: Request, etags: Optional[Dict[str, str]]) -> int:
+    """
+    Sends one request to the app on a new connection.
+
+    Args:
+        port: The port the app is served on.
+        request: The method, path and JSON body of the request.
+        etags: The ETags of earlier responses by their path, to send back and
+            keep up to date, or None not to revalidate.
+
+    Returns:
+        The status of the response, 0 if the request failed to complete.
+    """
+    method, path, body = request
+    headers = {"Content-Type": "application/json"}
+    if etags is not None and path in etags:
+        headers["If-None-Match"] = etags[path]
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    try:
+        connection.request(
+            method,
+            path,
+            body=None if body is None else json.dumps(body),
+            headers=headers,
+        )
+        response = connection.getresponse()
+        response.read()
+        etag = response.getheader("ETag")
+        if etags is not None and etag:
+            etags[path] = etag
+        return response.status
+    except (OSError, http.client.HTTPException):
+        return 0
+    finally:
+        connection.close()
+
+
+def _client(
+    port: int,
+    routes: Dict[str, Callable[[random.Random], Request]],
+    weights: Dict[str, int],
+    revalidate: bool,
+    start: float,
+    stop: float,
+    seed: int,
+) -> List[Tuple[str, int, float]]:
+    """
+    Sends requests from one client thread until the run is over.
+
+    Args:
+        port: The port the app is served on.
+        routes: The request makers of every route in the mix.
+        weights: The relative frequency of every route in the mix.
+        revalidate: Whether to send back the ETags of earlier responses.
+        start: When to start recording, from time.monotonic.
+        stop: When to stop, from time.monotonic.
+        seed: The seed of the thread's random choices.
+
+    Returns:
+        The route, status and seconds taken of every recorded request,
+        with a status of 0 for requests that failed to complete.
+    """
+    rand = random.Random(seed)
+    names = list(weights)
+    etags: Optional[Dict[str, str]] = {} if revalidate else None
+    samples = []
+    while time.monotonic() < stop:
+        name = rand.choices(names, [weights[name] for name in names])[0]
+        request = routes[name](rand)
+        began = time.monotonic()
+        status = _send(port, request, etags)
+        if began >= start:
+            samples.append((name, status, time.monotonic() - began))
+    return samples
+
+
+def _percentile(ordered: List[float], percent: float) -> float:
+    """
+    Gets a percentile of some sorted values by the nearest rank.
+
+    Args:
+        ordered: The values in ascending order.
+        percent: The percentile to get, between 0 and 100.
+
+    Returns:
+        The value at the percentile.
+    """
+    rank = max(int(round(percent / 100 * len(ordered))), 1)
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize(
+    samples: List[Tuple[str, int, float]], duration: float
+) -> Dict[str, Dict[str, float]]:
+    """
+    Summarizes the recorded requests per route and overall.
+
+    Args:
+        samples: The route, status and seconds taken of every request.
+        duration: The number of seconds requests were recorded for.
+
+    Returns:
+        The count, errors, throughput and latency percentiles in
+        milliseconds, keyed by route with the overall numbers under "all".
+    """
+    grouped: Dict[str, List[Tuple[int, float]]] = defaultdict(list)
+    for name, status, seconds in samples:
+        grouped[name].append((status, seconds))
+        grouped["all"].append((status, seconds))
+
+    summary = {}
+    for name, results in sorted(grouped.items()):
+        ordered = sorted(seconds * 1000 for _, seconds in results)
+        summary[name] = {
+            "requests": len(results),
+            "errors": sum(1 for status, _ in results if not 0 < status < 400),
+            "rps": len(results) / duration,
+            "p50": _percentile(ordered, 50),
+            "p95": _percentile(ordered, 95),
+            "p99": _percentile(ordered, 99),
+        }
+    return summary
+
+
+def _mix(
+    mix: str, routes: Dict[str, Callable[[random.Random], Request]]
+) -> Dict[str, int]:
+    """
+    Parses the mix of routes given on the command line.
+
+    Args:
+        mix: The comma separated route=weight pairs.
+        routes: The request makers of every known route.
+
+    Returns:
+        The relative frequency of every route in the mix.
+
+    Raises:
+        SystemExit: If the mix names a route that is not known.
+    """
+    weights = {}
+    for part in mix.split(","):
+        name, weight = part.split("=")
+        weights[name.strip()] = int(weight)
+    unknown = set(weights) - set(routes)
+    if unknown:
+        raise SystemExit(f"Unknown routes in the mix: {', '.join(sorted(unknown))}")
+    return weights
+
+
+def _start_workers(
+    listener: socket.socket, directory: str, count: int
+) -> List[multiprocessing.process.BaseProcess]:
+    """
+    Forks the worker processes serving the app on the shared socket.
+
+    Args:
+        listener: The listening socket shared by the workers.
+        directory: The directory holding the seeded database.
+        count: The number of workers.
+
+    Returns:
+        The started workers.
+    """
+    context = multiprocessing.get_context("fork")
+    workers: List[multiprocessing.process.BaseProcess] = [
+        context.Process(target=_serve, args=(listener, directory), daemon=True)
+        for _ in range(count)
+    ]
+    for worker in workers:
+        worker.start()
+    return workers
+
+
+def run(args: argparse.Namespace) -> Dict[str, Dict[str, float]]:
+    """
+    Seeds the database if needed, serves the app and replays the mix.
+
+    Args:
+        args: The parsed command line arguments.
+
+    Returns:
+        The summary of the run.
+    """
+    directory = args.database
+    os.makedirs(directory, exist_ok=True)
+    if not os.path.exists(os.path.join(directory, "coa_data.db")):
+        print(f"Seeding {directory}")
+        sqlite_db.seed(directory, args.years, args.sites, args.items_per_event)
+    routes = _routes(Dataset(directory))
+    weights = _mix(args.mix, routes)
+
+    # The workers share the generation counters of this run only.
+    os.environ["COA_GENERATION_FILE"] = os.path.join(
+        tempfile.mkdtemp(prefix="coa_load_"), "generations"
+    )
+    os.environ.setdefault("SECRET_KEY", "coa-load-test-only-secret-key-0000")
+
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(("127.0.0.1", args.port))
+    listener.listen(1024)
+    port = listener.getsockname()[1]
+    workers = _start_workers(listener, directory, args.workers)
+
+    start = time.monotonic() + args.warmup
+    stop = start + args.duration
+    results: List[List[Tuple[str, int, float]]] = [[] for _ in range(args.concurrency)]
+
+    def _thread(index: int) -> None:
+        results[index] = _client(
+            port, routes, weights, args.revalidate, start, stop, index
+        )
+
+    try:
+        print(
+            f"Running {args.concurrency} clients against {args.workers} workers "
+            f"for {args.duration}s after a {args.warmup}s warmup"
+        )
+        threads = [
+            threading.Thread(target=_thread, args=(index,))
+            for index in range(args.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.join()
+        listener.close()
+
+    return summarize(
+        [sample for samples in results for sample in samples], args.duration
+    )
+
+
+def main() -> int:
+    """
+    Runs the load test from the command line.
+
+    Returns:
+        The exit code, 1 if any request failed.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument(
+        "--database",
+        default=os.path.join(tempfile.gettempdir(), "coa_load_db"),
+        help="The directory of the SQLite database, seeded when missing.",
+    )
+    parser.add_argument("--years", type=int, default=10)
+    parser.add_argument("--sites", type=int, default=300)
+    parser.add_argument("--items-per-event", type=int, default=12)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--warmup", type=float, default=3)
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument(
+        "--revalidate",
+        action="store_true",
+        help="Send the ETags of earlier responses back, as browsers do.",
+    )
+    parser.add_argument("--json", help="Also write the summary to this file.")
+    args = parser.parse_args()
+
+    summary = run(args)
+
+    print(
+        f"{'route':<20}{'requests':>10}{'errors':>8}{'req/s':>10}"
+        f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    )
+    for name, row in summary.items():
+        print(
+            f"{name:<20}{row['requests']:>10}{row['errors']:>8}{row['rps']:>10.1f}"
+            f"{row['p50']:>10.2f}{row['p95']:>10.2f}{row['p99']:>10.2f}"
+        )
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as json_file:
+            json.dump(summary, json_file, indent=2, sort_keys=True)
+
+    return 1 if summary.get("all", {}).get("errors") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+"""
+Microbenchmarks of the data access modules and the read routes.
+
+The database is replaced with a fake one serving synthetic rows, so the
+timings cover the app's own work: checking out a connection, mapping rows
+and serializing responses. Caches are bypassed so every run does that work.
+
+The results can be saved as a JSON baseline and later runs compared with
+it, failing when any benchmark got slower by more than the threshold.
+
+Usage:
+    python -m benchmarks.micro [--sizes 10,10000,1000000] [--repeat 3]
+                               [--baseline FILE] [--save] [--threshold 0.2]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Callable, Dict, List
+
+from coa_flask_app import APP, cache, db_accessor, event_items, events, items, sites
+
+from benchmarks.fake_db import FakeDatabase
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+Results = Dict[str, Dict[str, Dict[str, float]]]
+
+
+def _route(path: str, table: str) -> Callable[[], None]:
+    """
+    Makes a benchmark of a read route through the flask test client.
+
+    Args:
+        path: The path to request.
+        table: The table whose cached results to drop before the request.
+
+    Returns:
+        The benchmark function.
+    """
+    client = APP.test_client()
+
+    def _run() -> None:
+        cache.QUERY_CACHE.invalidate(table)
+        response = client.get(path)
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} answered {response.status_code}.")
+        response.get_data()
+
+    return _run
+
+
+def benchmarks() -> Dict[str, Callable[[], object]]:
+    """
+    Gets every benchmark to run.
+
+    Returns:
+        A dictionary of the benchmark names to the functions they time.
+    """
+    season = "/events?volunteer_year=2020&volunteer_season=Fall"
+    return {
+        "items.get": items.get.__wrapped__,
+        "sites.get": sites.get.__wrapped__,
+        "events.get": lambda: events.get(2020, "Fall"),
+        "event_items.get": lambda: event_items.get(1),
+        "GET /items": _route("/items", "item"),
+        "GET /sites": _route("/sites", "site"),
+        "GET /events": _route(season, "event"),
+        "GET /events?stream=1": _route(season + "&stream=1", "event"),
+        "GET /event-items": _route("/event-items?event_id=1", "event_items"),
+    }
+
+
+def run(sizes: List[int], repeat: int) -> Results:
+    """
+    Runs every benchmark against fake databases of each size.
+
+    Args:
+        sizes: The number of rows in every table of each run.
+        repeat: The number of times to time each benchmark.
+
+    Returns:
+        The minimum and median seconds of each benchmark, keyed by size.
+    """
+    results: Results = {}
+    for size in sizes:
+        db_accessor.set_connect(FakeDatabase(size).connect)
+        results[str(size)] = {}
+        for name, func in benchmarks().items():
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                func()
+                timings.append(time.perf_counter() - start)
+            results[str(size)][name] = {
+                "min": min(timings),
+                "median": statistics.median(timings),
+            }
+            print(f"{size:>9} rows  {name:<22} {min(timings) * 1000:>12.3f} ms")
+    return results
+
+
+def compare(results: Results, baseline: Results, threshold: float) -> List[str]:
+    """
+    Finds the benchmarks that got slower than their baseline.
+
+    Args:
+        results: The results of this run.
+        baseline: The results of the baseline run.
+        threshold: The allowed slowdown, 0.2 allows 20% slower.
+
+    Returns:
+        A description of every regression.
+    """
+    regressions = []
+    for size, named in results.items():
+        for name, timing in named.items():
+            before = baseline.get(size, {}).get(name)
+            if before is None:
+                continue
+            if timing["min"] > before["min"] * (1 + threshold):
+                regressions.append(
+                    f"{name} at {size} rows: {before['min'] * 1000:.3f} ms -> "
+                    f"{timing['min'] * 1000:.3f} ms"
+                )
+    return regressions
+
+
+def main() -> int:
+    """
+    Runs the benchmarks from the command line.
+
+    Returns:
+        The exit code, 1 if any benchmark regressed against the baseline.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("--sizes", default="10,10000,1000000")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save", action="store_true", help="Save as the baseline.")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    args = parser.parse_args()
+
+    results = run([int(size) for size in args.sizes.split(",")], args.repeat)
+
+    if args.save:
+        with open(args.baseline, "w", encoding="utf-8") as baseline_file:
+            json.dump(results, baseline_file, indent=2, sort_keys=True)
+        print(f"Saved the baseline to {args.baseline}.")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        return 0
+    with open(args.baseline, encoding="utf-8") as baseline_file:
+        regressions = compare(results, json.load(baseline_file), args.threshold)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
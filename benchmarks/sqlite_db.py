@@ -0,0 +1,468 @@
+"""
+A stand-in for the MySQL database backed by SQLite files.
+
+The coa and coa_data schemas are separate SQLite files attached under those
+names, so the queries of the app run unchanged apart from the placeholders,
+the MySQL only locking clauses and ON DUPLICATE KEY UPDATE. The few MySQL
+functions the queries call are defined on every connection. Every process
+opens its own connections, so the files can be shared by forked workers the
+same way a server would be.
+"""
+
+from datetime import date, timedelta
+import os
+import random
+import re
+import sqlite3
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from pymysql.cursors import DictCursorMixin
+from werkzeug.security import generate_password_hash
+
+from coa_flask_app.rollups import _REBUILD_QUERY
+
+SCHEMAS = ("coa", "coa_data")
+
+# The tables and indexes of the database, with only the indexes the
+# migrations create, so queries are measured against the schema they run on.
+SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS coa.ab_user(
+        id INTEGER PRIMARY KEY,
+        username TEXT NOT NULL UNIQUE,
+        password TEXT NOT NULL,
+        active INTEGER NOT NULL DEFAULT 1
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS coa_data.item(
+        item_id INTEGER PRIMARY KEY,
+        material TEXT NOT NULL,
+        category TEXT NOT NULL,
+        item_name TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS coa_data.site(
+        site_id INTEGER PRIMARY KEY,
+        site_name TEXT NOT NULL,
+        state TEXT NOT NULL,
+        county TEXT NOT NULL,
+        town TEXT NOT NULL,
+        street TEXT,
+        zipcode TEXT,
+        lat REAL,
+        `long` REAL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS coa_data.event(
+        event_id INTEGER PRIMARY KEY,
+        site_id INTEGER NOT NULL,
+        volunteer_date DATE NOT NULL,
+        volunteer_cnt INTEGER,
+        trash_items_cnt INTEGER NOT NULL DEFAULT 0,
+        trashbag_cnt REAL,
+        trash_weight REAL,
+        walking_distance REAL,
+        updated_by TEXT,
+        updated_tsp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS coa_data.event_volunteer_date_site_idx
+        ON event(volunteer_date, site_id)
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS coa_data.event_items(
+        record_id INTEGER PRIMARY KEY,
+        event_id INTEGER NOT NULL,
+        item_id INTEGER NOT NULL,
+        quantity INTEGER NOT NULL,
+        updated_by TEXT,
+        updated_tsp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS coa_data.item_rollup(
+        volunteer_year INTEGER NOT NULL,
+        volunteer_season TEXT NOT NULL,
+        site_id INTEGER NOT NULL,
+        material TEXT NOT NULL,
+        category TEXT NOT NULL,
+        quantity INTEGER NOT NULL DEFAULT 0,
+        event_items_cnt INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (volunteer_year, volunteer_season, site_id, material, category)
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS coa_data.item_rollup_site_idx
+        ON item_rollup(site_id, volunteer_year)
+    """,
+)
+
+USERNAME = "loadtest"
+PASSWORD = "loadtest"
+
+_MATERIALS = {
+    "Plastic": ("Food", "Bags", "Bottles", "Smoking", "Packaging"),
+    "Glass": ("Bottles", "Pieces"),
+    "Metal": ("Cans", "Bottle Caps", "Fishing"),
+    "Paper": ("Food", "Packaging", "Bags"),
+    "Wood": ("Construction", "Food"),
+    "Other": ("Clothing", "Toys", "Medical"),
+}
+_COUNTIES = ("Monmouth", "Ocean", "Atlantic", "Cape May", "Middlesex", "Union")
+
+_PLACEHOLDER = re.compile(r"%s")
+_LOCKING = re.compile(r"\b(?:FOR\s+UPDATE|LOCK\s+IN\s+SHARE\s+MODE)\b", re.IGNORECASE)
+_UPSERT = re.compile(r"\bON\s+DUPLICATE\s+KEY\s+UPDATE\b", re.IGNORECASE)
+_INSERTED = re.compile(r"\bVALUES\((\w+)\)", re.IGNORECASE)
+
+# The MySQL functions the queries of the app call, by their name and arity.
+_FUNCTIONS: Dict[Tuple[str, int], Callable[..., Any]] = {
+    ("YEAR", 1): lambda value: None if value is None else int(str(value)[:4]),
+    ("MONTH", 1): lambda value: None if value is None else int(str(value)[5:7]),
+    ("IF", 3): lambda condition, then, otherwise: then if condition else otherwise,
+}
+
+
+def _translate(query: str, args: Optional[Sequence[Any]]) -> Tuple[str, List[Any]]:
+    """
+    Rewrites a pymysql query and its parameters for SQLite.
+
+    Sequence parameters are expanded into one placeholder per value, the
+    way pymysql renders them for IN clauses, and upserts are rewritten with
+    SQLite's ON CONFLICT clause.
+
+    Args:
+        query: The query in pymysql's format.
+        args: The parameters of the query.
+
+    Returns:
+        The query and the flattened parameters.
+    """
+    params: List[Any] = []
+    values = iter(args or ())
+
+    def _placeholder(_) -> str:
+        value = next(values)
+        if isinstance(value, (list, tuple)):
+            params.extend(value)
+            return "(" + ", ".join("?" * len(value)) + ")"
+        params.append(value)
+        return "?"
+
+    query = _LOCKING.sub("", _PLACEHOLDER.sub(_placeholder, query))
+    parts = _UPSERT.split(query, 1)
+    if len(parts) == 2:
+        query = (
+            parts[0]
+            + "ON CONFLICT DO UPDATE SET"
+            + _INSERTED.sub(r"excluded.\1", parts[1])
+        )
+    return query, params
+
+
+class SQLiteCursor:
+    """
+    A cursor with the parts of pymysql's API used by the app.
+    """
+
+    def __init__(self, cursor: sqlite3.Cursor, as_dicts: bool) -> None:
+        """
+        The constructor of the SQLiteCursor class.
+
+        Args:
+            cursor: The SQLite cursor to run the queries on.
+            as_dicts: Whether to return rows as dictionaries.
+        """
+        self.cursor = cursor
+        self.as_dicts = as_dicts
+        self.description: Optional[Tuple[Tuple[Any, ...], ...]] = None
+        self.rowcount = 0
+        self.lastrowid: Optional[int] = None
+
+    def _row(self, row: Optional[Tuple[Any, ...]]) -> Any:
+        """
+        Converts a row to the form of the cursor class asked for.
+
+        Args:
+            row: The row read from SQLite.
+
+        Returns:
+            The row, or None when there are no more.
+        """
+        if row is None or not self.as_dicts or self.description is None:
+            return row
+        return {column[0]: value for column, value in zip(self.description, row)}
+
+    def execute(self, query: str, args: Any = None) -> int:
+        """
+        Executes a query.
+
+        Args:
+            query: The query to execute.
+            args: The parameters of the query.
+
+        Returns:
+            The number of affected rows, -1 for SELECTs.
+        """
+        self.cursor.execute(*_translate(query, args))
+        self.description = self.cursor.description
+        self.rowcount = self.cursor.rowcount
+        self.lastrowid = self.cursor.lastrowid
+        if self.lastrowid and query.lstrip().upper().startswith("INSERT"):
+            # MySQL reports the ID of the first row of a multi-row insert,
+            # SQLite that of the last.
+            self.lastrowid -= self.rowcount - 1
+        return self.rowcount
+
+    def executemany(self, query: str, args: Sequence[Any]) -> int:
+        """
+        Executes a query for every set of parameters.
+
+        Args:
+            query: The query to execute.
+            args: The sets of parameters of the query.
+
+        Returns:
+            The number of affected rows.
+        """
+        return sum(self.execute(query, params) for params in args)
+
+    def fetchone(self) -> Any:
+        """
+        Fetches the next row.
+
+        Returns:
+            The next row or None when there are no more.
+        """
+        return self._row(self.cursor.fetchone())
+
+    def fetchmany(self, size: Optional[int] = None) -> List[Any]:
+        """
+        Fetches the next rows.
+
+        Args:
+            size: The number of rows to fetch.
+
+        Returns:
+            The next rows.
+        """
+        rows = self.cursor.fetchmany(size or self.cursor.arraysize)
+        return [self._row(row) for row in rows]
+
+    def fetchall(self) -> List[Any]:
+        """
+        Fetches the remaining rows.
+
+        Returns:
+            The remaining rows.
+        """
+        return [self._row(row) for row in self.cursor.fetchall()]
+
+    def __iter__(self):
+        """
+        Iterates over the remaining rows.
+
+        Returns:
+            An iterator of the rows.
+        """
+        return iter(self.fetchone, None)
+
+    def close(self) -> None:
+        """
+        Closes the cursor.
+        """
+        self.cursor.close()
+
+
+class SQLiteConnection:
+    """
+    A connection with the parts of pymysql's API used by the app.
+    """
+
+    def __init__(self, directory: str) -> None:
+        """
+        The constructor of the SQLiteConnection class.
+
+        Args:
+            directory: The directory holding a file per schema.
+        """
+        self.connection = sqlite3.connect(
+            ":memory:",
+            timeout=30,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            check_same_thread=False,
+        )
+        for schema in SCHEMAS:
+            self.connection.execute(
+                f"ATTACH DATABASE ? AS {schema}",
+                (os.path.join(directory, f"{schema}.db"),),
+            )
+        for (name, arity), function in _FUNCTIONS.items():
+            self.connection.create_function(name, arity, function, deterministic=True)
+
+    def cursor(self, cursor_class: Any = None) -> SQLiteCursor:
+        """
+        Opens a cursor.
+
+        Args:
+            cursor_class: The pymysql cursor class asked for.
+
+        Returns:
+            A cursor returning dictionaries for the dictionary cursor classes.
+        """
+        as_dicts = cursor_class is not None and issubclass(
+            cursor_class, DictCursorMixin
+        )
+        return SQLiteCursor(self.connection.cursor(), as_dicts)
+
+    def ping(self, reconnect: bool = False) -> None:
+        """
+        Checks the connection, which is always alive.
+
+        Args:
+            reconnect: Whether to reconnect, which is ignored.
+        """
+
+    def commit(self) -> None:
+        """
+        Commits the transaction.
+        """
+        self.connection.commit()
+
+    def rollback(self) -> None:
+        """
+        Rolls the transaction back.
+        """
+        self.connection.rollback()
+
+    def close(self) -> None:
+        """
+        Closes the connection.
+        """
+        self.connection.close()
+
+
+def connector(directory: str):
+    """
+    Makes a connection factory for db_accessor.set_connect.
+
+    Args:
+        directory: The directory holding the seeded database.
+
+    Returns:
+        A function opening a new connection to the database.
+    """
+    return lambda: SQLiteConnection(directory)
+
+
+def seed(directory: str, years: int, sites: int, items_per_event: int) -> None:
+    """
+    Creates and fills a database with a realistic spread of cleanups.
+
+    Every season of every year has a cleanup at most of the sites, and each
+    cleanup records a handful of counts of the items found there.
+
+    Args:
+        directory: The directory to create the schema files in.
+        years: The number of years of events, ending with the current one.
+        sites: The number of sites.
+        items_per_event: The average number of item counts per event.
+    """
+    rand = random.Random(0)
+    connection = SQLiteConnection(directory).connection
+    for schema in SCHEMAS:
+        connection.execute(f"PRAGMA {schema}.journal_mode = WAL")
+    for statement in SCHEMA:
+        connection.execute(statement)
+
+    connection.execute(
+        "INSERT INTO coa.ab_user(username, password) VALUES(?, ?)",
+        (USERNAME, generate_password_hash(PASSWORD, method="pbkdf2:sha256")),
+    )
+    item_rows = [
+        (material, category, f"{material} {category} {number}")
+        for material, categories in _MATERIALS.items()
+        for category in categories
+        for number in range(1, 9)
+    ]
+    connection.executemany(
+        "INSERT INTO coa_data.item(material, category, item_name) VALUES(?, ?, ?)",
+        item_rows,
+    )
+    connection.executemany(
+        """
+        INSERT INTO coa_data.site(
+            site_name, state, county, town, street, zipcode, lat, `long`
+        )
+        VALUES(?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        [
+            (
+                f"Beach {site_id}",
+                "NJ",
+                rand.choice(_COUNTIES),
+                f"Town {site_id % 60}",
+                None if rand.random() < 0.3 else f"{site_id} Ocean Ave",
+                f"08{rand.randint(0, 999):03d}",
+                None if rand.random() < 0.05 else 39 + rand.random() * 1.5,
+                None if rand.random() < 0.05 else -74.9 + rand.random(),
+            )
+            for site_id in range(1, sites + 1)
+        ],
+    )
+
+    first_year = date.today().year - years + 1
+    event_id = 0
+    for year in range(first_year, first_year + years):
+        for month in (4, 10):
+            for site_id in range(1, sites + 1):
+                if rand.random() < 0.3:
+                    continue
+                event_id += 1
+                counts = [
+                    (
+                        event_id,
+                        rand.randint(1, len(item_rows)),
+                        rand.randint(1, 60),
+                        "volunteer@example.com",
+                    )
+                    for _ in range(rand.randint(1, items_per_event * 2))
+                ]
+                connection.execute(
+                    """
+                    INSERT INTO coa_data.event(
+                        event_id, site_id, volunteer_date, volunteer_cnt,
+                        trash_items_cnt, trashbag_cnt, trash_weight,
+                        walking_distance, updated_by
+                    )
+                    VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (
+                        event_id,
+                        site_id,
+                        date(year, month, 1) + timedelta(days=rand.randint(0, 20)),
+                        rand.randint(2, 80),
+                        sum(count[2] for count in counts),
+                        rand.randint(1, 30),
+                        round(rand.random() * 200, 1),
+                        round(rand.random() * 5, 2),
+                        "volunteer@example.com",
+                    ),
+                )
+                connection.executemany(
+                    """
+                    INSERT INTO coa_data.event_items(
+                        event_id, item_id, quantity, updated_by
+                    )
+                    VALUES(?, ?, ?, ?)
+                    """,
+                    counts,
+                )
+    # The rollups are built by the same query as flask rebuild-rollups.
+    connection.execute(*_translate(_REBUILD_QUERY, None))
+    connection.commit()
+    connection.close()
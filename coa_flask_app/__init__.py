@@ -5,17 +5,167 @@ This includes the setting up of flask as well as all of the routes for
 the application.
 """
 
+from datetime import date
 import json
+import time
+from typing import Any, Iterable, List, Optional, Tuple
 
-from flask import Flask, jsonify, request
+import click
+from flask import Flask, Response, g, request, stream_with_context
 from flask_cors import CORS
-
-from coa_flask_app import auth, items, sites, events, event_items
+from werkzeug.exceptions import BadRequest
+
+from coa_flask_app import (
+    analytics,
+    auth,
+    cache,
+    compression,
+    conditional,
+    db_accessor,
+    generations,
+    items,
+    metrics,
+    pagination,
+    query_plans,
+    response_cache,
+    rollups,
+    routes,
+    serialization,
+    sites,
+    top_items,
+    events,
+    event_items,
+)
 
 
 APP = Flask(__name__)
 CORS(APP)
 
+jsonify = metrics.serialization_timer(serialization.jsonify)
+metrics.register_worker_exit()
+
+
+@APP.before_request
+def _start_timer():
+    """
+    Notes when the request started for the request latency metric.
+    """
+    g.request_start = time.perf_counter()
+
+
+@APP.after_request
+def _observe_request(response: Response) -> Response:
+    """
+    Records the latency of the request.
+
+    Args:
+        response: The response being sent.
+
+    Returns:
+        The unchanged response.
+    """
+    metrics.observe_request(g.request_start, response.status_code)
+    return response
+
+
+@APP.after_request
+def _finish_unit_of_work(response: Response) -> Response:
+    """
+    Commits the changes of the request, or rolls them back if it failed.
+
+    A client that wrote reads from the primary database for a while after.
+
+    Args:
+        response: The response being sent.
+
+    Returns:
+        The response, marked to read from the primary if it wrote.
+    """
+    if db_accessor.finish_request(response.status_code < 400):
+        db_accessor.stick_to_primary(response)
+    return response
+
+
+@APP.teardown_request
+def _abort_unit_of_work(error: Optional[BaseException]) -> None:
+    """
+    Rolls back the changes of a request that raised before it was finished.
+
+    Args:
+        error: The exception the request raised, if any.
+    """
+    _ = error
+    db_accessor.finish_request(False)
+
+
+def _stream_response(key: str, records: Iterable[Any]) -> Response:
+    """
+    Builds a response that serializes records as they are read.
+
+    Args:
+        key: The name of the key holding the list.
+        records: The records to send.
+
+    Returns:
+        The streamed json response.
+    """
+    return Response(
+        stream_with_context(pagination.stream_json(key, records)),
+        mimetype="application/json",
+    )
+
+
+@APP.cli.command("reconcile-trash-counts")
+def reconcile_trash_counts():
+    """
+    Recounts the trash item totals of the events from their event items.
+    """
+    repaired = events.reconcile_trash_items_cnt()
+    click.echo(f"Repaired the trash item totals of {repaired} events.")
+
+
+@APP.cli.command("rebuild-rollups")
+def rebuild_rollups():
+    """
+    Builds the rollups of the items collected again from the event items.
+    """
+    rebuilt = rollups.rebuild()
+    click.echo(f"Rebuilt {rebuilt} rollup rows.")
+
+
+@APP.cli.command("check-query-plans")
+@click.option(
+    "--baseline",
+    default=query_plans.BASELINE,
+    show_default=True,
+    help="The JSON file of the baseline plans.",
+)
+@click.option("--save", is_flag=True, help="Store the current plans as the baseline.")
+def check_query_plans(baseline: str, save: bool):
+    """
+    Explains every query of the app and checks the plans against a baseline.
+
+    Exits with 1 if any query is planned worse than in the baseline.
+    """
+    reports, regressed = query_plans.check(baseline, save)
+    for name, report in reports.items():
+        click.echo(name)
+        for row in report["plan"]:
+            click.echo(
+                f"    {row['table']}: {row['type']} on {row['key'] or 'no index'}, "
+                f"~{row['rows']} rows {' '.join(row['flags'])}".rstrip()
+            )
+        for problem in report["problems"]:
+            click.echo(f"  ! {problem}")
+        for suggestion in report["suggestions"]:
+            click.echo(f"  + {suggestion}")
+        for regression in report["regressions"]:
+            click.echo(f"  REGRESSED {regression}")
+    if save:
+        click.echo(f"Saved the plans to {baseline}.")
+    if regressed:
+        raise SystemExit(1)
+
 
 @APP.route("/")
 def index():
@@ -30,6 +180,31 @@ def index():
     return jsonify([str(rule) for rule in APP.url_map.iter_rules()])
 
 
+@APP.route("/status")
+def status():
+    """
+    The status route reports the internal counters of the worker serving it.
+
+    Returns:
+        A json object of the worker statistics.
+    """
+    return jsonify(
+        routes.worker_status(db_accessor.pool_stats(), db_accessor.replica_stats())
+    )
+
+
+@APP.route("/metrics")
+def get_metrics():
+    """
+    The metrics route reports the metrics of every worker.
+
+    Returns:
+        The metrics in the Prometheus text format.
+    """
+    body, content_type = metrics.exposition()
+    return Response(body, content_type=content_type)
+
+
 @APP.route("/login", methods=["POST"])
 def login():
     """
@@ -50,6 +225,8 @@ def login():
 
 
 @APP.route("/items")
+@conditional.conditional("item")
+@compression.precompressed("item")
 def get_items():
     """
     The items route returns all the items.
@@ -119,6 +296,8 @@ def remove_item():
 
 
 @APP.route("/sites")
+@conditional.conditional("site")
+@compression.precompressed("site")
 def get_sites():
     """
     The sites route returns all the sites.
@@ -207,22 +386,90 @@ def remove_site():
     return jsonify()
 
 
+@APP.route("/sites/near")
+@conditional.conditional("site")
+def get_sites_near():
+    """
+    The sites near route returns the sites closest to a coordinate.
+
+    The app route itself contains:
+        lat  - The latitude to search from.
+        long - The longitude to search from.
+        k    - The number of sites to return, 5 by default.
+
+    Returns:
+        A json list of the sites with their distance in kilometers, the
+        closest first.
+    """
+    lat, long_f = routes.coordinate(request.args)
+    return jsonify(
+        sites=sites.near(sites.index(), lat, long_f, request.args.get("k", 5, type=int))
+    )
+
+
+@APP.route("/sites/within")
+@conditional.conditional("site")
+def get_sites_within():
+    """
+    The sites within route returns the sites inside a bounding box.
+
+    The app route itself contains:
+        bbox - The box as min_long,min_lat,max_long,max_lat.
+
+    Returns:
+        A json list of the sites inside the box, ordered by their ID.
+    """
+    bbox = request.args.get("bbox", type=sites.parse_bbox)
+    if bbox is None:
+        raise BadRequest("A valid bounding box is needed.")
+
+    return jsonify(sites=sites.within(sites.index(), bbox))
+
+
 @APP.route("/events")
+@conditional.conditional("event", "event_items")
+@response_cache.shared(
+    "event", "event_items", params=("volunteer_year", "volunteer_season")
+)
 def get_events():
     """
     The events route returns all the events for a given year and season.
 
     The app route itself contains:
         volunteer_year   - The year in question.
-        volunteer_season - The season in question.
+        volunteer_season - The season in question, Spring or Fall.
+        start_date       - The optional first date of a range to use instead.
+        end_date         - The optional first date after the range.
+        limit            - The optional maximum number of events to return.
+        cursor           - The optional cursor of the page to return.
+        stream           - Whether to stream every event as it is read.
+        include          - Set to items to add the event items of every
+                           event under its event_items key.
 
     Returns:
-        A json list of all the events.
-    """
-    volunteer_year = request.args.get("volunteer_year", type=int)
-    volunteer_season = request.args.get("volunteer_season", type=str)
-
-    return jsonify(events=events.get(volunteer_year, volunteer_season))
+        A json list of all the events, along with the cursor of the next
+        page when a limit is given.
+    """
+    start_date, end_date = routes.event_range(request.args)
+    limit = request.args.get("limit", type=int)
+    after = pagination.decode_cursor(request.args.get("cursor"))
+
+    with_items = routes.includes(request.args, "items")
+    if routes.wants_stream(request.args):
+        if with_items:
+            raise BadRequest("Events with their items cannot be streamed.")
+        return _stream_response("events", events.stream(start_date, end_date, after))
+    if limit is None:
+        records = events.get_range(start_date, end_date, after)
+        return jsonify(events=event_items.attach(records) if with_items else records)
+
+    page = events.get_range(start_date, end_date, after, limit + 1)
+    next_cursor = routes.next_cursor(page, limit, "event_id")
+    page = page[:limit]
+    return jsonify(
+        events=event_items.attach(page) if with_items else page,
+        next_cursor=next_cursor,
+    )
 
 
 @APP.route("/events/add", methods=["POST"])
@@ -323,19 +570,48 @@ def remove_event():
 
 
 @APP.route("/event-items")
+@conditional.conditional("event_items")
+@response_cache.shared("event_items", params=("event_id",))
 def get_event_items():
     """
     The event items route returns all the event items for a given event.
 
     The app route itself contains:
-        event_id - The ID of the event to look up items for.
+        event_id  - The ID of the event to look up items for.
+        event_ids - The IDs of many events to look up items for instead,
+                    comma separated.
+        limit     - The optional maximum number of event items to return.
+        cursor    - The optional cursor of the page to return.
+        stream    - Whether to stream every event item as it is read.
 
     Returns:
-        A json list of all the event items.
-    """
-    event_id = request.args.get("event_id", type=int)
+        A json list of all the event items, along with the cursor of the next
+        page when a limit is given. For many events, a json object of the
+        lists of event items keyed by event ID.
+    """
+    event_ids = routes.id_list(request.args, "event_ids")
+    if event_ids:
+        grouped = event_items.get_many(event_ids)
+        return jsonify(
+            event_items={
+                str(event_id): records for event_id, records in grouped.items()
+            }
+        )
 
-    return jsonify(event_items=event_items.get(event_id))
+    event_id = request.args.get("event_id", type=int)
+    limit = request.args.get("limit", type=int)
+    after = pagination.decode_cursor(request.args.get("cursor"))
+
+    if routes.wants_stream(request.args):
+        return _stream_response("event_items", event_items.stream(event_id, after))
+    if limit is None:
+        return jsonify(event_items=event_items.get(event_id, after))
+
+    page = event_items.get(event_id, after, limit + 1)
+    return jsonify(
+        event_items=page[:limit],
+        next_cursor=routes.next_cursor(page, limit, "record_id"),
+    )
 
 
 @APP.route("/event-items/add", methods=["POST"])
@@ -398,3 +674,149 @@ def remove_event_item():
 
     event_items.remove(record_id)
     return jsonify()
+
+
+@APP.route("/event-items/bulk", methods=["POST"])
+# @auth.verify_token
+def bulk_event_items():
+    """
+    The bulk event items route applies many event item changes at once.
+
+    All of the changes are made in a single transaction, so either all of
+    them are saved or none are.
+
+    The app route itself contains:
+        operations - A list of changes. Each has an op of "add", "update" or
+                     "remove" and the same fields as the matching route.
+
+    Returns:
+        A json list of the result of each change, with its record_id and a
+        status of "applied", or "not_found" if the record does not exist.
+    """
+    args = json.loads(request.data.decode())
+    operations = args["operations"]
+
+    return jsonify(results=event_items.bulk(operations))
+
+
+@APP.route("/stats/seasons")
+@conditional.conditional("item_rollup")
+def get_season_stats():
+    """
+    The season stats route returns the items collected in every season.
+
+    The app route itself contains these optional filters:
+        volunteer_year   - The year in question.
+        site_id          - The ID of the site in question.
+        material         - The material in question.
+        category         - The category in question.
+
+    Returns:
+        A json list of the quantity and count of the event items of every
+        year and season.
+    """
+    return jsonify(stats=rollups.totals("seasons", routes.rollup_filters(request.args)))
+
+
+@APP.route("/stats/sites")
+@conditional.conditional("item_rollup")
+def get_site_stats():
+    """
+    The site stats route returns the items collected at every site.
+
+    The app route itself contains these optional filters:
+        volunteer_year   - The year in question.
+        volunteer_season - The season in question.
+        material         - The material in question.
+        category         - The category in question.
+
+    Returns:
+        A json list of the quantity and count of the event items of every
+        site.
+    """
+    return jsonify(stats=rollups.totals("sites", routes.rollup_filters(request.args)))
+
+
+@APP.route("/stats/materials")
+@conditional.conditional("item_rollup")
+def get_material_stats():
+    """
+    The material stats route returns the items collected of every material
+    and category.
+
+    The app route itself contains these optional filters:
+        volunteer_year   - The year in question.
+        volunteer_season - The season in question.
+        site_id          - The ID of the site in question.
+
+    Returns:
+        A json list of the quantity and count of the event items of every
+        material and category.
+    """
+    return jsonify(
+        stats=rollups.totals("materials", routes.rollup_filters(request.args))
+    )
+
+
+@APP.route("/stats/trends")
+@conditional.conditional(*analytics.TABLES)
+def get_trends():
+    """
+    The trends route returns the yearly totals and rates of the cleanups.
+
+    The app route itself contains:
+        by               - Either site, the default, or item.
+        site_id          - The optional ID of the site in question.
+        item_id          - The optional ID of the item in question.
+        volunteer_season - The optional season in question, Spring or Fall.
+
+    Returns:
+        A json list of the totals, items per volunteer, items per mile and,
+        by site, weight per bag of every site or item and year.
+    """
+    grouping = request.args.get("by", "site")
+    if grouping not in analytics.GROUPINGS:
+        raise BadRequest("by must be either site or item.")
+
+    return jsonify(
+        trends=analytics.trends(
+            grouping,
+            request.args.get("site_id", type=int),
+            routes.season(request.args),
+            request.args.get("item_id", type=int),
+        )
+    )
+
+
+@APP.route("/stats/top-items")
+@conditional.conditional(*top_items.TABLES)
+def get_top_items():
+    """
+    The top items route returns the items collected the most in a season.
+
+    The app route itself contains:
+        volunteer_year   - The year in question.
+        volunteer_season - The season in question, Spring or Fall.
+        county           - The optional county to rank the items within.
+        site_id          - The optional ID of the site to rank the items
+                           within, which takes precedence over county.
+        n                - The number of items to return, 12 by default.
+
+    Returns:
+        A json list of the items with their quantity, the largest first.
+    """
+    volunteer_year = request.args.get("volunteer_year", type=int)
+    volunteer_season = routes.season(request.args)
+    if volunteer_year is None or volunteer_season is None:
+        raise BadRequest("A year and season are needed.")
+
+    return jsonify(
+        top_items=top_items.top(
+            top_items.load(),
+            volunteer_year,
+            volunteer_season,
+            request.args.get("county", type=str),
+            request.args.get("site_id", type=int),
+            request.args.get("n", 12, type=int),
+        )
+    )
@@ -0,0 +1,533 @@
+"""
+The module designed to contain the database access logic of the ASGI app.
+
+This mirrors db_accessor for asyncio. Every process serving the ASGI app
+runs a single event loop, so it gets one aiomysql pool created lazily on
+that loop, configured by the same environment variables as the uwsgi pool.
+
+Within a request every AsyncAccessor shares one connection through the
+request's unit of work, and read only blocks may be sent to the replicas in
+DB_REPLICAS, the same as with db_accessor. aiomysql is only imported once a
+pool is first needed, so the uwsgi app never depends on it.
+"""
+
+import asyncio
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import pymysql
+
+from coa_flask_app import db_accessor, metrics
+from coa_flask_app.pool import PoolTimeout
+
+_POOL: Optional[Any] = None
+_POOL_LOCK: Optional[asyncio.Lock] = None
+
+# The aiomysql pools of the read replicas, by their address.
+_REPLICA_POOLS: Dict[str, Any] = {}
+
+# The names of the aiomysql cursor classes matching the pymysql ones, which
+# the data modules pass to both accessors.
+_CURSORS = {
+    pymysql.cursors.Cursor: "Cursor",
+    pymysql.cursors.DictCursor: "DictCursor",
+    pymysql.cursors.SSCursor: "SSCursor",
+    pymysql.cursors.SSDictCursor: "SSDictCursor",
+}
+
+
+def _driver() -> Any:
+    """
+    Imports aiomysql on first use.
+
+    Returns:
+        The aiomysql module.
+    """
+    # Only the ASGI app needs aiomysql, so it is not imported with the module.
+    import aiomysql  # pylint: disable=import-outside-toplevel
+
+    return aiomysql
+
+
+async def _create_pool(host: Optional[str] = None, port: Optional[int] = None) -> Any:
+    """
+    Opens a new connection pool.
+
+    Args:
+        host: The server to connect to, DB_SERVER by default.
+        port: The port to connect to, DB_PORT by default.
+
+    Returns:
+        The aiomysql pool.
+    """
+    start = time.perf_counter()
+    pool = await _driver().create_pool(
+        host=host or os.environ["DB_SERVER"],
+        user=os.environ["DB_USERNAME"],
+        password=os.environ["DB_PASSWORD"],
+        db=os.environ["DB_DATABASE"],
+        port=port or int(os.environ["DB_PORT"]),
+        minsize=int(os.environ.get("DB_POOL_MIN_SIZE", "1")),
+        maxsize=int(os.environ.get("DB_POOL_MAX_SIZE", "4")),
+        pool_recycle=int(float(os.environ.get("DB_POOL_MAX_AGE", "3600"))),
+        autocommit=False,
+    )
+    metrics.CONNECT_SECONDS.observe(time.perf_counter() - start)
+    return pool
+
+
+def _lock() -> asyncio.Lock:
+    """
+    Gets the lock guarding the creation of the pools.
+
+    Returns:
+        The lock, created on the running loop on first use.
+    """
+    global _POOL_LOCK  # pylint: disable=global-statement
+    if _POOL_LOCK is None:
+        _POOL_LOCK = asyncio.Lock()
+    return _POOL_LOCK
+
+
+async def get_pool() -> Any:
+    """
+    Gets the connection pool of the current process, creating it if needed.
+
+    Returns:
+        The connection pool of this process.
+    """
+    global _POOL  # pylint: disable=global-statement
+    if _POOL is not None:
+        return _POOL
+
+    async with _lock():
+        if _POOL is None:
+            _POOL = await _create_pool()
+        return _POOL
+
+
+async def _get_replica_pool(replica: db_accessor.Replica) -> Any:
+    """
+    Gets the connection pool of a replica, creating it if needed.
+
+    Args:
+        replica: The replica.
+
+    Returns:
+        The replica's connection pool of this process.
+    """
+    pool = _REPLICA_POOLS.get(replica.address)
+    if pool is not None:
+        return pool
+
+    async with _lock():
+        if replica.address not in _REPLICA_POOLS:
+            _REPLICA_POOLS[replica.address] = await _create_pool(
+                replica.host, replica.port
+            )
+        return _REPLICA_POOLS[replica.address]
+
+
+async def close_pool() -> None:
+    """
+    Closes the connection pools of the current process, if they were opened.
+    """
+    global _POOL  # pylint: disable=global-statement
+    pools = [_POOL] + list(_REPLICA_POOLS.values())
+    _POOL = None
+    _REPLICA_POOLS.clear()
+    for pool in pools:
+        if pool is not None:
+            pool.close()
+            await pool.wait_closed()
+
+
+def _stats(pool: Any) -> Dict[str, Any]:
+    """
+    Gets the statistics of a connection pool.
+
+    Args:
+        pool: The aiomysql pool.
+
+    Returns:
+        The pool statistics.
+    """
+    return {
+        "size": pool.size,
+        "idle": pool.freesize,
+        "in_use": pool.size - pool.freesize,
+        "min_size": pool.minsize,
+        "max_size": pool.maxsize,
+    }
+
+
+def pool_stats() -> Optional[Dict[str, Any]]:
+    """
+    Gets the statistics of the connection pool of the current process.
+
+    Returns:
+        The pool statistics or None if this process has not used the database.
+    """
+    return None if _POOL is None else _stats(_POOL)
+
+
+def replica_stats() -> List[Dict[str, Any]]:
+    """
+    Gets the statistics of the read replicas in the current process.
+
+    Returns:
+        The statistics of every replica.
+    """
+    stats = []
+    for replica in db_accessor.get_replicas():
+        pool = _REPLICA_POOLS.get(replica.address)
+        stats.append(
+            {
+                "address": replica.address,
+                **replica.health.stats(),
+                "pool": None if pool is None else _stats(pool),
+            }
+        )
+    return stats
+
+
+async def _checkout(pool: Any) -> Any:
+    """
+    Checks a connection out of a pool, waiting up to DB_POOL_TIMEOUT.
+
+    Args:
+        pool: The aiomysql pool.
+
+    Returns:
+        The connection.
+
+    Raises:
+        This can raise PoolTimeout errors if no connection is free in time.
+    """
+    start = time.perf_counter()
+    metrics.POOL_IN_USE.inc()
+    try:
+        return await asyncio.wait_for(
+            pool.acquire(), float(os.environ.get("DB_POOL_TIMEOUT", "10"))
+        )
+    except asyncio.TimeoutError as err:
+        metrics.POOL_IN_USE.dec()
+        metrics.POOL_TIMEOUTS.inc()
+        raise PoolTimeout("Timed out waiting for a database connection.") from err
+    except BaseException:
+        metrics.POOL_IN_USE.dec()
+        raise
+    finally:
+        metrics.POOL_WAIT_SECONDS.observe(time.perf_counter() - start)
+
+
+def _checkin(pool: Any, connection: Any, discard: bool = False) -> None:
+    """
+    Returns a connection to its pool, closing it first if it is broken.
+
+    Args:
+        pool: The aiomysql pool the connection was checked out of.
+        connection: The connection.
+        discard: Whether to close the connection.
+    """
+    if discard:
+        connection.close()
+    pool.release(connection)
+    metrics.POOL_IN_USE.dec()
+
+
+async def _replication_lag(connection: Any) -> Optional[float]:
+    """
+    Gets how many seconds a replica is behind the primary.
+
+    Args:
+        connection: A connection to the replica.
+
+    Returns:
+        The lag in seconds, infinite if replication has stopped, or None if
+        the server does not report it.
+    """
+    cursor = await connection.cursor(_driver().DictCursor)
+    try:
+        for query, column in db_accessor.LAG_QUERIES:
+            try:
+                await cursor.execute(query)
+            except pymysql.err.ProgrammingError:
+                continue
+            except pymysql.err.OperationalError as err:
+                if err.args[0] != db_accessor.ACCESS_DENIED:
+                    raise
+                return None
+            return db_accessor.lag_of(await cursor.fetchone(), column)
+        return None
+    finally:
+        await cursor.close()
+
+
+async def _acquire_from(replica: db_accessor.Replica) -> Optional[Any]:
+    """
+    Checks a connection out of a replica's pool if it is fit for reads.
+
+    The replica's health is shared with db_accessor, so it is marked down and
+    its lag is checked the same way.
+
+    Args:
+        replica: The replica.
+
+    Returns:
+        A connection, or None if the replica is down, too far behind or has
+        no connection free.
+    """
+    if not replica.health.is_up():
+        return None
+    try:
+        pool = await _get_replica_pool(replica)
+        connection = await _checkout(pool)
+    except PoolTimeout:
+        return None
+    except pymysql.err.Error:
+        replica.mark_down()
+        return None
+    if not replica.health.check_due():
+        return connection
+
+    try:
+        fit = replica.health.record_lag(await _replication_lag(connection))
+    except pymysql.err.Error:
+        fit = False
+    if not fit:
+        _checkin(pool, connection, discard=True)
+        replica.mark_down()
+        return None
+    return connection
+
+
+async def _acquire_replica(
+    unit: Optional["AsyncUnitOfWork"],
+) -> Optional[Tuple[db_accessor.Replica, Any]]:
+    """
+    Checks a connection out of the next healthy replica in turn.
+
+    Args:
+        unit: The unit of work of the request, if any.
+
+    Returns:
+        The replica and the connection, or None to read from the primary.
+    """
+    if not db_accessor.get_replicas():
+        return None
+    if unit is not None and (unit.wrote or unit.sticky):
+        metrics.DB_READS.labels("primary_sticky").inc()
+        return None
+
+    for replica in db_accessor.replica_order():
+        acquired = await _acquire_from(replica)
+        if acquired is not None:
+            metrics.DB_READS.labels("replica").inc()
+            return replica, acquired
+    metrics.DB_READS.labels("primary_fallback").inc()
+    return None
+
+
+class AsyncUnitOfWork(db_accessor.BaseUnitOfWork):
+    """
+    The connection and transaction shared by the AsyncAccessors of a request.
+
+    This is the counterpart of db_accessor.UnitOfWork for the ASGI app.
+    """
+
+    def __init__(self, sticky: bool) -> None:
+        """
+        The constructor of the AsyncUnitOfWork class.
+
+        The pool is only set once a connection is needed, as getting it may
+        have to be awaited.
+
+        Args:
+            sticky: Whether the client reads from the primary after an
+                earlier write.
+        """
+        super().__init__(None)
+        self.sticky = sticky
+
+    async def get_connection(self) -> Any:
+        """
+        Gets the connection of the request, checking it out on first use.
+
+        Returns:
+            The connection shared by the request.
+        """
+        if self.connection is None:
+            self.pool = await get_pool()
+            self.connection = await _checkout(self.pool)
+        return self.connection
+
+    async def finish(self, success: bool) -> bool:
+        """
+        Commits or rolls back the transaction and returns the connection.
+
+        Args:
+            success: Whether the request succeeded. The transaction is only
+                committed if it did and no AsyncAccessor block in it failed.
+
+        Returns:
+            Whether writes were committed.
+        """
+        connection, commit = self._detach(success)
+        if connection is not None:
+            try:
+                if not self.discard:
+                    await (connection.commit() if commit else connection.rollback())
+            except pymysql.err.Error:
+                self.discard = True
+                raise
+            finally:
+                _checkin(self.pool, connection, self.discard)
+        return self._settle(commit)
+
+
+def begin_request(sticky_cookie: Optional[str]) -> None:
+    """
+    Starts the unit of work of the request the current task is serving.
+
+    Args:
+        sticky_cookie: The value of the client's db_accessor.STICKY_COOKIE.
+    """
+    unit = AsyncUnitOfWork(db_accessor.within_sticky_window(sticky_cookie))
+    db_accessor.TASK_UNIT_OF_WORK.set(unit)
+
+
+async def finish_request(success: bool) -> bool:
+    """
+    Ends the unit of work of the request the current task is serving, if it
+    has not been ended yet.
+
+    Args:
+        success: Whether to commit the request's changes.
+
+    Returns:
+        Whether the request's writes were committed.
+    """
+    unit = db_accessor.TASK_UNIT_OF_WORK.get()
+    if unit is None:
+        return False
+    db_accessor.TASK_UNIT_OF_WORK.set(None)
+    return await unit.finish(success)
+
+
+class AsyncAccessor:
+    """
+    The asyncio counterpart of Accessor, used as an async context manager.
+    """
+
+    def __init__(
+        self, cursor_class=pymysql.cursors.DictCursor, join=True, read_only=False
+    ) -> None:
+        """
+        The constructor of the AsyncAccessor class.
+
+        The connection is only checked out once the block is entered, as
+        that has to be awaited.
+
+        Args:
+            cursor_class: The pymysql type of cursor to hand out, for which
+                the matching aiomysql cursor is used. An unbuffered cursor
+                such as SSCursor streams rows from the server.
+            join: Whether to join the request's unit of work.
+            read_only: Whether the block only runs SELECTs, so it may be
+                sent to a replica.
+        """
+        self.label = metrics.caller_label()
+        self.cursor_class = cursor_class
+        self.read_only = read_only
+        self.unit: Optional[AsyncUnitOfWork] = (
+            db_accessor.TASK_UNIT_OF_WORK.get() if join else None
+        )
+        self.replica: Optional[db_accessor.Replica] = None
+        self.connection: Any = None
+        self.cursor: Any = None
+
+    def _pool(self) -> Any:
+        """
+        Gets the pool the connection of the block was checked out of.
+
+        Returns:
+            The pool of the replica, or of the primary.
+        """
+        if self.replica is not None:
+            return _REPLICA_POOLS[self.replica.address]
+        return _POOL
+
+    async def __aenter__(self):
+        """
+        The enter of the AsyncAccessor class for an async context manager.
+
+        Returns:
+            A cursor to execute queries on, instrumented to record them.
+
+        Raises:
+            This can raise PoolTimeout errors if no connection is free in time.
+        """
+        acquired = await _acquire_replica(self.unit) if self.read_only else None
+        if acquired is not None:
+            self.unit = None
+            self.replica, self.connection = acquired
+        elif self.unit is not None:
+            self.unit.wrote |= not self.read_only
+            self.connection = await self.unit.get_connection()
+        else:
+            self.connection = await _checkout(await get_pool())
+
+        try:
+            self.cursor = await self.connection.cursor(
+                getattr(_driver(), _CURSORS[self.cursor_class])
+            )
+        except BaseException as err:
+            await self.__aexit__(type(err), err, err.__traceback__)
+            raise
+        return metrics.AsyncInstrumentedCursor(self.cursor, self.label)
+
+    async def __aexit__(self, ex_type, ex_value, traceback) -> None:
+        """
+        The exit of the AsyncAccessor class for an async context manager.
+
+        The block is committed as one transaction, or rolled back if it
+        raised. A connection that failed at the network level is closed
+        rather than returned to the pool, and the replica it was reading
+        from, if any, is marked down the same as with Accessor. A block
+        joined to a unit of work leaves all of that to the unit, only marking
+        it to be rolled back if the block raised.
+
+        Args:
+            ex_type: The exception type.
+            ex_value: The exception value.
+            traceback: The traceback for the exception.
+        """
+        _ = traceback
+        discard = isinstance(
+            ex_value, (pymysql.err.OperationalError, pymysql.err.InterfaceError)
+        )
+        try:
+            if self.cursor is not None:
+                await self.cursor.close()
+        except pymysql.err.Error:
+            discard = True
+        if self.unit is not None:
+            self.unit.leave(ex_type is not None, discard)
+            return
+
+        try:
+            if not discard:
+                await (
+                    self.connection.commit()
+                    if ex_type is None
+                    else self.connection.rollback()
+                )
+        except pymysql.err.Error:
+            discard = True
+            raise
+        finally:
+            _checkin(self._pool(), self.connection, discard)
+            if discard and self.replica is not None:
+                self.replica.mark_down()
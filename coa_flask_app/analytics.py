@@ -0,0 +1,539 @@
+"""
+The module designed to contain the trend analytics of the cleanups.
+
+The events and event items are read in bulk into columnar NumPy arrays once
+per version of their tables, and every trend is computed from them with
+grouped, vectorized operations rather than row by row. The arrays are kept
+in each worker until a write to either table bumps its generation, and the
+trends computed from them are cached under the same version.
+"""
+
+import asyncio
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from pymysql.cursors import Cursor
+
+from coa_flask_app import cache, generations
+from coa_flask_app.aio_accessor import AsyncAccessor
+from coa_flask_app.db_accessor import Accessor
+
+# The tables the trends are computed from.
+TABLES = ("event", "event_items")
+
+# The groupings the trends can be computed by.
+GROUPINGS = ("site", "item")
+
+_EVENTS_QUERY = """
+            SELECT
+                event_id,
+                site_id,
+                volunteer_date,
+                volunteer_cnt,
+                walking_distance,
+                trash_weight,
+                trashbag_cnt
+            FROM coa_data.event
+            ORDER BY event_id
+            """
+
+_EVENT_ITEMS_QUERY = """
+            SELECT
+                event_id,
+                item_id,
+                quantity
+            FROM coa_data.event_items
+            """
+
+
+# The measures of the events, by the position of their column in the rows
+# of _EVENTS_QUERY.
+MEASURES = {"volunteers": 3, "distances": 4, "weights": 5, "bags": 6}
+
+
+class Events:
+    """
+    The events as columns of NumPy arrays, ordered by event ID.
+
+    Unknown measures are NaN.
+    """
+
+    def __init__(self, rows: Sequence[Sequence[Any]]) -> None:
+        """
+        The constructor of the Events class.
+
+        Args:
+            rows: The rows of _EVENTS_QUERY.
+        """
+        columns = list(zip(*rows)) or [()] * 7
+        self.ids = np.array(columns[0], dtype=np.int64)
+        self.site_ids = np.array(columns[1], dtype=np.int64)
+        dates = np.array(columns[2], dtype="datetime64[D]")
+        self.years = dates.astype("datetime64[Y]").astype(np.int64) + 1970
+        self.spring = dates.astype("datetime64[M]").astype(np.int64) % 12 < 6
+        self.measures = {
+            name: np.array(columns[column], dtype=np.float64)
+            for name, column in MEASURES.items()
+        }
+        # The total quantity of the items found at every event.
+        self.quantities: np.ndarray = np.zeros(len(self.ids))
+
+
+class Tallies:
+    """
+    The event items as columns of NumPy arrays.
+
+    Every tally holds the position of its event in the event columns rather
+    than its ID, and the tallies of events that no longer exist are left out.
+    """
+
+    def __init__(self, rows: Sequence[Sequence[Any]], events: Events) -> None:
+        """
+        The constructor of the Tallies class.
+
+        Args:
+            rows: The rows of _EVENT_ITEMS_QUERY.
+            events: The events the tallies belong to.
+        """
+        tallies = np.array(rows, dtype=np.int64).reshape(-1, 3)
+        positions = np.searchsorted(events.ids, tallies[:, 0])
+        positions = np.minimum(positions, max(len(events.ids) - 1, 0))
+        known = (
+            events.ids[positions] == tallies[:, 0]
+            if len(events.ids)
+            else np.zeros(len(tallies), dtype=bool)
+        )
+        self.events = positions[known]
+        self.item_ids = tallies[known, 1]
+        self.quantities = tallies[known, 2].astype(np.float64)
+
+
+class Dataset:
+    """
+    The events and event items as columns of NumPy arrays.
+    """
+
+    def __init__(
+        self, events: Sequence[Sequence[Any]], event_items: Sequence[Sequence[Any]]
+    ) -> None:
+        """
+        The constructor of the Dataset class.
+
+        Args:
+            events: The rows of _EVENTS_QUERY.
+            event_items: The rows of _EVENT_ITEMS_QUERY.
+        """
+        self.events = Events(events)
+        self.tallies = Tallies(event_items, self.events)
+        self.events.quantities = np.bincount(
+            self.tallies.events,
+            weights=self.tallies.quantities,
+            minlength=len(self.events.ids),
+        )
+
+
+_LOCK = threading.Lock()
+_DATASET: Optional[Tuple[Tuple[int, ...], Dataset]] = None
+
+
+def version() -> Tuple[int, ...]:
+    """
+    Gets the current version of the tables the trends are computed from.
+
+    Returns:
+        The epoch and the generations of the tables.
+    """
+    return (generations.epoch(),) + tuple(
+        generations.current(table) for table in TABLES
+    )
+
+
+def cached(current: Tuple[int, ...]) -> Optional[Dataset]:
+    """
+    Gets the dataset of a version if it has been read already.
+
+    Args:
+        current: The version of the tables.
+
+    Returns:
+        The dataset, or None if it has to be read.
+    """
+    with _LOCK:
+        if _DATASET is None or _DATASET[0] != current:
+            return None
+        return _DATASET[1]
+
+
+def keep(current: Tuple[int, ...], dataset: Dataset) -> Dataset:
+    """
+    Keeps a dataset read at a version for the next calls.
+
+    Args:
+        current: The version of the tables the dataset was read at.
+        dataset: The dataset.
+
+    Returns:
+        The dataset.
+    """
+    global _DATASET  # pylint: disable=global-statement
+    with _LOCK:
+        _DATASET = (current, dataset)
+    return dataset
+
+
+def load() -> Dataset:
+    """
+    Gets the dataset of the current version, reading it if needed.
+
+    The tables are read without holding the lock, so a slow read does not
+    hold up the threads that only want the dataset already kept, at the cost
+    of threads missing at the same time each reading it.
+
+    Returns:
+        The dataset.
+    """
+    current = version()
+    dataset = cached(current)
+    if dataset is None:
+        with Accessor(Cursor, read_only=True) as db_handle:
+            db_handle.execute(_EVENTS_QUERY)
+            events = db_handle.fetchall()
+            db_handle.execute(_EVENT_ITEMS_QUERY)
+            event_items = db_handle.fetchall()
+        dataset = keep(current, Dataset(events, event_items))
+    return dataset
+
+
+async def load_async() -> Dataset:
+    """
+    Gets the dataset of the current version on the async connection pool.
+
+    Returns:
+        The dataset.
+    """
+    current = version()
+    dataset = cached(current)
+    if dataset is None:
+        async with AsyncAccessor(Cursor, read_only=True) as db_handle:
+            await db_handle.execute(_EVENTS_QUERY)
+            events = await db_handle.fetchall()
+            await db_handle.execute(_EVENT_ITEMS_QUERY)
+            event_items = await db_handle.fetchall()
+        # Building the arrays is CPU bound, so it is kept off the event loop.
+        dataset = keep(
+            current,
+            await asyncio.get_running_loop().run_in_executor(
+                None, Dataset, events, event_items
+            ),
+        )
+    return dataset
+
+
+def group_by(*keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Groups rows by the values of their key columns.
+
+    Args:
+        keys: The key columns of the rows.
+
+    Returns:
+        The keys of every group in sorted order, one row each, and the group
+        of every row.
+    """
+    unique, inverse = np.unique(
+        np.stack(keys, axis=1).reshape(-1, len(keys)), axis=0, return_inverse=True
+    )
+    return unique, inverse.reshape(-1)
+
+
+def _sums(groups: np.ndarray, size: int, values: np.ndarray) -> np.ndarray:
+    """
+    Sums the known values of every group.
+
+    Args:
+        groups: The group of every row.
+        size: The number of groups.
+        values: The value of every row, NaN when unknown.
+
+    Returns:
+        The sum of every group.
+    """
+    return np.bincount(groups, weights=np.nan_to_num(values), minlength=size)
+
+
+def _ratios(
+    groups: np.ndarray,
+    size: int,
+    numerators: np.ndarray,
+    denominators: np.ndarray,
+) -> np.ndarray:
+    """
+    Divides the sums of two columns of every group.
+
+    Only the rows where both values are known are counted, so a missing
+    measure does not skew the ratio.
+
+    Args:
+        groups: The group of every row.
+        size: The number of groups.
+        numerators: The dividend of every row.
+        denominators: The divisor of every row.
+
+    Returns:
+        The ratio of every group, NaN when nothing was known to divide by.
+    """
+    known = ~(np.isnan(numerators) | np.isnan(denominators))
+    above = np.bincount(groups, weights=np.where(known, numerators, 0), minlength=size)
+    below = np.bincount(
+        groups, weights=np.where(known, denominators, 0), minlength=size
+    )
+    return np.divide(above, below, out=np.full(size, np.nan), where=below > 0)
+
+
+def _records(columns: Dict[str, np.ndarray]) -> List[Dict[str, Any]]:
+    """
+    Turns result columns into records.
+
+    Args:
+        columns: The values of every column by its name.
+
+    Returns:
+        A record for every row, with NaN given as None and measures rounded
+        to four decimals.
+    """
+    values = []
+    for column in columns.values():
+        if column.dtype.kind == "f":
+            rounded = np.round(column, 4).astype(object)
+            rounded[np.isnan(column)] = None
+            column = rounded
+        values.append(column.tolist())
+    return [dict(zip(columns, row)) for row in zip(*values)]
+
+
+def _event_mask(
+    events: Events, site_id: Optional[int], volunteer_season: Optional[str]
+) -> np.ndarray:
+    """
+    Selects the events of a site and season.
+
+    Args:
+        events: The events.
+        site_id: The ID of the site, or None for every site.
+        volunteer_season: The season, or None for both.
+
+    Returns:
+        Whether every event is selected.
+    """
+    mask = np.ones(len(events.ids), dtype=bool)
+    if site_id is not None:
+        mask &= events.site_ids == site_id
+    if volunteer_season is not None:
+        mask &= events.spring == (volunteer_season == "Spring")
+    return mask
+
+
+def site_trends(
+    dataset: Dataset,
+    site_id: Optional[int],
+    volunteer_season: Optional[str],
+    item_id: Optional[int],
+) -> List[Dict[str, Any]]:
+    """
+    Computes the yearly trends of every site.
+
+    Args:
+        dataset: The dataset.
+        site_id: The ID of the site, or None for every site.
+        volunteer_season: The season, or None for both.
+        item_id: The ID of the item to count, or None for every item.
+
+    Returns:
+        The totals and rates of every site and year, ordered by both.
+    """
+    events = dataset.events
+    mask = _event_mask(events, site_id, volunteer_season)
+    quantities: np.ndarray = events.quantities
+    if item_id is not None:
+        tallied = dataset.tallies.item_ids == item_id
+        quantities = np.bincount(
+            dataset.tallies.events[tallied],
+            weights=dataset.tallies.quantities[tallied],
+            minlength=len(events.ids),
+        )
+
+    keys, groups = group_by(events.site_ids[mask], events.years[mask])
+    size = len(keys)
+    quantities = quantities[mask]
+    measures = {name: column[mask] for name, column in events.measures.items()}
+    return _records(
+        {
+            "site_id": keys[:, 0],
+            "year": keys[:, 1],
+            "events_cnt": np.bincount(groups, minlength=size),
+            "quantity": _sums(groups, size, quantities).astype(np.int64),
+            "volunteer_cnt": _sums(groups, size, measures["volunteers"]).astype(
+                np.int64
+            ),
+            "walking_distance": _sums(groups, size, measures["distances"]),
+            "trash_weight": _sums(groups, size, measures["weights"]),
+            "trashbag_cnt": _sums(groups, size, measures["bags"]),
+            "per_volunteer": _ratios(groups, size, quantities, measures["volunteers"]),
+            "per_mile": _ratios(groups, size, quantities, measures["distances"]),
+            "weight_per_bag": _ratios(
+                groups, size, measures["weights"], measures["bags"]
+            ),
+        }
+    )
+
+
+def _yearly_rates(
+    events: Events,
+    selected: np.ndarray,
+    tally_events: np.ndarray,
+    keys: np.ndarray,
+    groups: np.ndarray,
+    quantities: np.ndarray,
+) -> Dict[str, np.ndarray]:
+    """
+    Divides the quantities of every item and year by the volunteers and
+    distance walked of the selected events of that year.
+
+    A tally only counts towards a rate if the measure of its event is known.
+
+    Args:
+        events: The events.
+        selected: Whether every event is selected.
+        tally_events: The event position of every selected tally.
+        keys: The item and year of every group.
+        groups: The group of every selected tally.
+        quantities: The quantity of every selected tally.
+
+    Returns:
+        The rates of every group, by the name of the measure.
+    """
+    size = len(keys)
+    # The years of the selected events, offset from the first one.
+    years = events.years[selected]
+    first = int(years.min()) if len(years) else 0
+    rates = {}
+    for name in ("volunteers", "distances"):
+        measures = events.measures[name]
+        known = ~np.isnan(measures[tally_events])
+        below = np.bincount(years - first, weights=np.nan_to_num(measures[selected]))[
+            keys[:, 1] - first
+        ]
+        above = _sums(groups, size, np.where(known, quantities, 0))
+        rates[name] = np.divide(
+            above, below, out=np.full(size, np.nan), where=below > 0
+        )
+    return rates
+
+
+def item_trends(
+    dataset: Dataset,
+    site_id: Optional[int],
+    volunteer_season: Optional[str],
+    item_id: Optional[int],
+) -> List[Dict[str, Any]]:
+    """
+    Computes the yearly trends of every item.
+
+    The rates of an item are taken over every selected event of the year
+    with the measure known, including those where none of it was found.
+
+    Args:
+        dataset: The dataset.
+        site_id: The ID of the site, or None for every site.
+        volunteer_season: The season, or None for both.
+        item_id: The ID of the item, or None for every item.
+
+    Returns:
+        The totals and rates of every item and year, ordered by both.
+    """
+    events, tallies = dataset.events, dataset.tallies
+    selected = _event_mask(events, site_id, volunteer_season)
+    mask = selected[tallies.events]
+    if item_id is not None:
+        mask &= tallies.item_ids == item_id
+    tally_events = tallies.events[mask]
+    keys, groups = group_by(tallies.item_ids[mask], events.years[tally_events])
+    size = len(keys)
+    quantities = tallies.quantities[mask]
+
+    # Every event counts once per item and year, however many tallies it has.
+    counted = np.unique(np.stack([groups, tally_events], axis=1), axis=0)[:, 0]
+    rates = _yearly_rates(events, selected, tally_events, keys, groups, quantities)
+    return _records(
+        {
+            "item_id": keys[:, 0],
+            "year": keys[:, 1],
+            "events_cnt": np.bincount(counted, minlength=size),
+            "quantity": _sums(groups, size, quantities).astype(np.int64),
+            "per_volunteer": rates["volunteers"],
+            "per_mile": rates["distances"],
+        }
+    )
+
+
+_TRENDS = {"site": site_trends, "item": item_trends}
+
+
+def trends(
+    grouping: str,
+    site_id: Optional[int] = None,
+    volunteer_season: Optional[str] = None,
+    item_id: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Gets the yearly trends of every site or item.
+
+    Args:
+        grouping: Either site or item.
+        site_id: The ID of the site to count, or None for every site.
+        volunteer_season: The season to count, or None for both.
+        item_id: The ID of the item to count, or None for every item.
+
+    Returns:
+        The totals and rates of every site or item and year.
+    """
+    return cache.QUERY_CACHE.get_or_load(
+        ("trends", grouping, site_id, volunteer_season, item_id),
+        lambda: _TRENDS[grouping](load(), site_id, volunteer_season, item_id),
+        version(),
+    )
+
+
+async def trends_async(
+    grouping: str,
+    site_id: Optional[int] = None,
+    volunteer_season: Optional[str] = None,
+    item_id: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Gets the yearly trends of every site or item on the async connection pool.
+
+    Args:
+        grouping: Either site or item.
+        site_id: The ID of the site to count, or None for every site.
+        volunteer_season: The season to count, or None for both.
+        item_id: The ID of the item to count, or None for every item.
+
+    Returns:
+        The totals and rates of every site or item and year.
+    """
+    key = ("trends", grouping, site_id, volunteer_season, item_id)
+    current = version()
+    hit, value = cache.QUERY_CACHE.lookup(key, current)
+    if not hit:
+        value = await asyncio.get_running_loop().run_in_executor(
+            None,
+            _TRENDS[grouping],
+            await load_async(),
+            site_id,
+            volunteer_season,
+            item_id,
+        )
+        cache.QUERY_CACHE.store(key, value, current)
+    return value
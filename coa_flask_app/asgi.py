@@ -0,0 +1,755 @@
+"""
+The ASGI entrance to the app, an alternative to serving APP under uwsgi.
+
+The same routes are served with starlette, backed by the aiomysql pool of
+aio_accessor. The queries, row mapping, caches and ETags are shared with the
+flask app, so both produce the same responses. Run it with
+`uvicorn coa_flask_app.asgi:APP`.
+"""
+
+from contextlib import asynccontextmanager
+from functools import wraps
+import json
+import os
+import time
+from typing import Any, AsyncIterable, Callable, Dict, List, Optional, Tuple
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route
+from werkzeug.exceptions import BadRequest, HTTPException
+from werkzeug.http import parse_etags
+
+from coa_flask_app import (
+    aio_accessor,
+    analytics,
+    auth,
+    compression,
+    conditional,
+    db_accessor,
+    events,
+    event_items,
+    items,
+    metrics,
+    pagination,
+    response_cache,
+    rollups,
+    routes,
+    serialization,
+    sites,
+    top_items,
+)
+
+ROUTES: List[Route] = []
+
+
+def _route(path: str, methods: Optional[List[str]] = None):
+    """
+    A decorator used to register a route and record its latency.
+
+    The route is named after the function, the same as the flask endpoint,
+    so the metrics of both apps share their labels. Every request runs in a
+    unit of work of aio_accessor, committed if it succeeded and rolled back
+    otherwise, and a client that wrote reads from the primary for a while
+    after, the same as with the flask app.
+
+    Args:
+        path: The path of the route.
+        methods: The methods the route answers, GET by default.
+    """
+
+    def _decorator(func):
+        @wraps(func)
+        async def _inner(request: Request) -> Response:
+            start = time.perf_counter()
+            code = 500
+            aio_accessor.begin_request(request.cookies.get(db_accessor.STICKY_COOKIE))
+            try:
+                response = await func(request)
+                code = response.status_code
+                if await aio_accessor.finish_request(code < 400):
+                    db_accessor.stick_to_primary(response)
+                return response
+            except HTTPException as err:
+                code = err.code or 500
+                raise
+            finally:
+                await aio_accessor.finish_request(False)
+                metrics.REQUEST_SECONDS.labels(
+                    func.__name__, request.method, code
+                ).observe(time.perf_counter() - start)
+
+        ROUTES.append(Route(path, _inner, methods=methods or ["GET"]))
+        return _inner
+
+    return _decorator
+
+
+def _conditional(*tables: str):
+    """
+    A decorator used for the routes to answer conditional GETs.
+
+    This is the counterpart of conditional.conditional, giving the same
+    ETags for the same requests.
+
+    Args:
+        tables: The names of the tables the route reads from.
+    """
+
+    def _decorator(func):
+        @wraps(func)
+        async def _inner(request: Request) -> Response:
+            current = conditional.etag_for(
+                f"{request.url.path}?{request.url.query}", *tables
+            )
+            tag = conditional.matching(
+                current,
+                parse_etags(request.headers.get("if-none-match")),
+                request.headers.get("accept-encoding"),
+            )
+            if tag is not None:
+                response = Response(status_code=304)
+            else:
+                response = await func(request)
+                tag = compression.tagged(
+                    current, response.headers.get("content-encoding")
+                )
+            response.headers["ETag"] = f'"{tag}"'
+            response.headers["Cache-Control"] = "no-cache"
+            return response
+
+        return _inner
+
+    return _decorator
+
+
+def _precompressed(*tables: str):
+    """
+    A decorator used for the JSON routes to serve precompressed bodies.
+
+    This is the counterpart of compression.precompressed.
+
+    Args:
+        tables: The names of the tables the route reads from.
+    """
+
+    def _decorator(func):
+        @wraps(func)
+        async def _inner(request: Request) -> Response:
+            key = compression.payload_key(
+                request.url.path, request.query_params.multi_items(), *tables
+            )
+            encodings = compression.lookup(key)
+            if encodings is None:
+                encodings = compression.store(key, (await func(request)).body)
+
+            encoding = compression.negotiate(
+                request.headers.get("accept-encoding"), encodings
+            )
+            response = Response(
+                bytes(encodings[encoding]), media_type="application/json"
+            )
+            if encoding != "identity":
+                response.headers["Content-Encoding"] = encoding
+            response.headers["Vary"] = "Accept-Encoding"
+            return response
+
+        return _inner
+
+    return _decorator
+
+
+def _shared(*tables: str, params: Tuple[str, ...] = ()):
+    """
+    A decorator used for the JSON routes to share their responses.
+
+    This is the counterpart of response_cache.shared.
+
+    Args:
+        tables: The names of the tables the route reads from.
+        params: The names of the query arguments the route is cached by.
+    """
+
+    def _decorator(func):
+        @wraps(func)
+        async def _inner(request: Request) -> Response:
+            if set(request.query_params) != set(params):
+                return await func(request)
+
+            key = response_cache.key_for(
+                request.url.path, request.query_params.multi_items(), *tables
+            )
+            body = response_cache.lookup(key)
+            if body is None:
+                response = await func(request)
+                if response.status_code != 200:
+                    return response
+                body = response.body
+                response_cache.store(key, body)
+            return Response(body, media_type="application/json")
+
+        return _inner
+
+    return _decorator
+
+
+def _jsonify(request: Request, *args: Any, **kwargs: Any) -> Response:
+    """
+    Builds a JSON response with the same body as serialization.jsonify.
+
+    Args:
+        request: The request being answered.
+        args: A single object to serialize.
+        kwargs: The keys of an object to serialize.
+
+    Returns:
+        The JSON response.
+    """
+    start = time.perf_counter()
+    data = args[0] if len(args) == 1 else (args or kwargs)
+    body = serialization.dumps(data) + b"\n"
+    metrics.SERIALIZATION_SECONDS.labels(request.scope["endpoint"].__name__).observe(
+        time.perf_counter() - start
+    )
+    return Response(body, media_type="application/json")
+
+
+async def _body(request: Request) -> Any:
+    """
+    Reads the JSON body of a request.
+
+    Args:
+        request: The request to read from.
+
+    Returns:
+        The decoded body.
+    """
+    return json.loads((await request.body()).decode())
+
+
+def _stream_response(key: str, records: AsyncIterable[Any]) -> Response:
+    """
+    Builds a response that serializes records as they are read.
+
+    Args:
+        key: The name of the key holding the list.
+        records: The records to send.
+
+    Returns:
+        The streamed json response.
+    """
+    return StreamingResponse(
+        pagination.stream_json_async(key, records), media_type="application/json"
+    )
+
+
+@_route("/")
+async def index(request: Request) -> Response:
+    """
+    Index holds the main page for the REST API.
+
+    Returns:
+        The json list of valid routes.
+    """
+    return _jsonify(request, [route.path for route in ROUTES])
+
+
+@_route("/status")
+async def status(request: Request) -> Response:
+    """
+    The status route reports the internal counters of the worker serving it.
+
+    Returns:
+        A json object of the worker statistics.
+    """
+    return _jsonify(
+        request,
+        routes.worker_status(aio_accessor.pool_stats(), aio_accessor.replica_stats()),
+    )
+
+
+@_route("/metrics")
+async def get_metrics(request: Request) -> Response:
+    """
+    The metrics route reports the metrics of every worker.
+
+    Returns:
+        The metrics in the Prometheus text format.
+    """
+    _ = request
+    body, content_type = metrics.exposition()
+    return Response(body, headers={"Content-Type": content_type})
+
+
+@_route("/login", methods=["POST"])
+async def login(request: Request) -> Response:
+    """
+    A route for logging in.
+
+    Returns:
+        A JWT to be used for further authentication.
+    """
+    args = await _body(request)
+    token = await auth.login_async(args["username"], args["password"])
+    return _jsonify(request, token=token)
+
+
+@_route("/items")
+@_conditional("item")
+@_precompressed("item")
+async def get_items(request: Request) -> Response:
+    """
+    The items route returns all the items.
+
+    Returns:
+        A json list of all the items.
+    """
+    return _jsonify(request, items=await items.get_async())
+
+
+@_route("/items/add", methods=["POST"])
+async def add_item(request: Request) -> Response:
+    """
+    The add items route adds an item.
+    """
+    args = await _body(request)
+    await items.add_async(args["material"], args["category"], args["item_name"])
+    return _jsonify(request)
+
+
+@_route("/items/update", methods=["POST"])
+async def update_item(request: Request) -> Response:
+    """
+    The update items route updates an existing item.
+    """
+    args = await _body(request)
+    await items.update_async(
+        args["item_id"], args["material"], args["category"], args["item_name"]
+    )
+    return _jsonify(request)
+
+
+@_route("/items/remove", methods=["POST"])
+async def remove_item(request: Request) -> Response:
+    """
+    The remove items route removes an existing item.
+    """
+    args = await _body(request)
+    await items.remove_async(args["item_id"])
+    return _jsonify(request)
+
+
+@_route("/sites")
+@_conditional("site")
+@_precompressed("site")
+async def get_sites(request: Request) -> Response:
+    """
+    The sites route returns all the sites.
+
+    Returns:
+        A json list of all the sites.
+    """
+    return _jsonify(request, sites=await sites.get_async())
+
+
+@_route("/sites/add", methods=["POST"])
+async def add_site(request: Request) -> Response:
+    """
+    The add sites route adds an site.
+    """
+    args = await _body(request)
+    await sites.add_async(
+        args["site_name"],
+        args["state"],
+        args["county"],
+        args["town"],
+        args.get("street"),
+        args.get("zipcode"),
+        args.get("lat"),
+        args.get("long"),
+    )
+    return _jsonify(request)
+
+
+@_route("/sites/update", methods=["POST"])
+async def update_site(request: Request) -> Response:
+    """
+    The update sites route updates an existing site.
+    """
+    args = await _body(request)
+    await sites.update_async(
+        args["site_id"],
+        args["site_name"],
+        args["state"],
+        args["county"],
+        args["town"],
+        args.get("street"),
+        args.get("zipcode"),
+        args.get("lat"),
+        args.get("long"),
+    )
+    return _jsonify(request)
+
+
+@_route("/sites/remove", methods=["POST"])
+async def remove_site(request: Request) -> Response:
+    """
+    The remove sites route removes an existing site.
+    """
+    args = await _body(request)
+    await sites.remove_async(args["site_id"])
+    return _jsonify(request)
+
+
+@_route("/sites/near")
+@_conditional("site")
+async def get_sites_near(request: Request) -> Response:
+    """
+    The sites near route returns the sites closest to a coordinate.
+
+    It takes the same arguments as the flask route.
+    """
+    lat, long_f = routes.coordinate(request.query_params)
+    limit = routes.arg(request.query_params, "k", int)
+    nearest = sites.near(
+        await sites.index_async(), lat, long_f, 5 if limit is None else limit
+    )
+    return _jsonify(request, sites=nearest)
+
+
+@_route("/sites/within")
+@_conditional("site")
+async def get_sites_within(request: Request) -> Response:
+    """
+    The sites within route returns the sites inside a bounding box.
+
+    It takes the same arguments as the flask route.
+    """
+    bbox = routes.arg(request.query_params, "bbox", sites.parse_bbox)
+    if bbox is None:
+        raise BadRequest("A valid bounding box is needed.")
+
+    return _jsonify(request, sites=sites.within(await sites.index_async(), bbox))
+
+
+@_route("/events")
+@_conditional("event", "event_items")
+@_shared("event", "event_items", params=("volunteer_year", "volunteer_season"))
+async def get_events(request: Request) -> Response:
+    """
+    The events route returns all the events for a given year and season.
+
+    It takes the same arguments as the flask route.
+
+    Returns:
+        A json list of all the events, along with the cursor of the next
+        page when a limit is given.
+    """
+    start_date, end_date = routes.event_range(request.query_params)
+    limit = routes.arg(request.query_params, "limit", int)
+    after = pagination.decode_cursor(request.query_params.get("cursor"))
+
+    with_items = routes.includes(request.query_params, "items")
+    if routes.wants_stream(request.query_params):
+        if with_items:
+            raise BadRequest("Events with their items cannot be streamed.")
+        return _stream_response(
+            "events", events.stream_async(start_date, end_date, after)
+        )
+    if limit is None:
+        records = await events.get_range_async(start_date, end_date, after)
+        return _jsonify(
+            request,
+            events=await event_items.attach_async(records) if with_items else records,
+        )
+
+    page = await events.get_range_async(start_date, end_date, after, limit + 1)
+    next_cursor = routes.next_cursor(page, limit, "event_id")
+    page = page[:limit]
+    return _jsonify(
+        request,
+        events=await event_items.attach_async(page) if with_items else page,
+        next_cursor=next_cursor,
+    )
+
+
+@_route("/events/add", methods=["POST"])
+async def add_event(request: Request) -> Response:
+    """
+    The add events route adds an event.
+    """
+    args = await _body(request)
+    await events.add_async(
+        args["updated_by"],
+        args["site_id"],
+        args["volunteer_year"],
+        args["volunteer_season"],
+        args.get("volunteer_cnt"),
+        args.get("trashbag_cnt"),
+        args.get("trash_weight"),
+        args.get("walking_distance"),
+    )
+    return _jsonify(request)
+
+
+@_route("/events/update", methods=["POST"])
+async def update_event(request: Request) -> Response:
+    """
+    The update events route updates an existing event.
+    """
+    args = await _body(request)
+    await events.update_async(
+        args["event_id"],
+        args["updated_by"],
+        args["site_id"],
+        args["volunteer_year"],
+        args["volunteer_season"],
+        args.get("volunteer_cnt"),
+        args.get("trashbag_cnt"),
+        args.get("trash_weight"),
+        args.get("walking_distance"),
+    )
+    return _jsonify(request)
+
+
+@_route("/events/remove", methods=["POST"])
+async def remove_event(request: Request) -> Response:
+    """
+    The remove events route removes an existing event.
+    """
+    args = await _body(request)
+    await events.remove_async(args["event_id"])
+    return _jsonify(request)
+
+
+@_route("/event-items")
+@_conditional("event_items")
+@_shared("event_items", params=("event_id",))
+async def get_event_items(request: Request) -> Response:
+    """
+    The event items route returns all the event items for a given event.
+
+    It takes the same arguments as the flask route.
+
+    Returns:
+        A json list of all the event items, along with the cursor of the next
+        page when a limit is given. For many events, a json object of the
+        lists of event items keyed by event ID.
+    """
+    event_ids = routes.id_list(request.query_params, "event_ids")
+    if event_ids:
+        grouped = await event_items.get_many_async(event_ids)
+        return _jsonify(
+            request,
+            event_items={
+                str(event_id): records for event_id, records in grouped.items()
+            },
+        )
+
+    event_id = routes.arg(request.query_params, "event_id", int)
+    limit = routes.arg(request.query_params, "limit", int)
+    after = pagination.decode_cursor(request.query_params.get("cursor"))
+
+    if routes.wants_stream(request.query_params):
+        return _stream_response(
+            "event_items", event_items.stream_async(event_id, after)
+        )
+    if limit is None:
+        return _jsonify(
+            request, event_items=await event_items.get_async(event_id, after)
+        )
+
+    page = await event_items.get_async(event_id, after, limit + 1)
+    return _jsonify(
+        request,
+        event_items=page[:limit],
+        next_cursor=routes.next_cursor(page, limit, "record_id"),
+    )
+
+
+@_route("/event-items/add", methods=["POST"])
+async def add_event_item(request: Request) -> Response:
+    """
+    The add event items route adds an event item.
+    """
+    args = await _body(request)
+    await event_items.add_async(
+        args["event_id"], args["item_id"], args["quantity"], args["updated_by"]
+    )
+    return _jsonify(request)
+
+
+@_route("/event-items/update", methods=["POST"])
+async def update_event_item(request: Request) -> Response:
+    """
+    The update event items route updates an existing event item.
+    """
+    args = await _body(request)
+    await event_items.update_async(
+        args["record_id"],
+        args["event_id"],
+        args["item_id"],
+        args["quantity"],
+        args["updated_by"],
+    )
+    return _jsonify(request)
+
+
+@_route("/event-items/remove", methods=["POST"])
+async def remove_event_item(request: Request) -> Response:
+    """
+    The remove event items route removes an existing event item.
+    """
+    args = await _body(request)
+    await event_items.remove_async(args["record_id"])
+    return _jsonify(request)
+
+
+@_route("/event-items/bulk", methods=["POST"])
+async def bulk_event_items(request: Request) -> Response:
+    """
+    The bulk event items route applies many event item changes at once.
+
+    Returns:
+        A json list of the result of each change.
+    """
+    args = await _body(request)
+    return _jsonify(request, results=await event_items.bulk_async(args["operations"]))
+
+
+@_route("/stats/seasons")
+@_conditional("item_rollup")
+async def get_season_stats(request: Request) -> Response:
+    """
+    The season stats route returns the items collected in every season.
+
+    It takes the same arguments as the flask route.
+    """
+    stats = await rollups.totals_async(
+        "seasons", routes.rollup_filters(request.query_params)
+    )
+    return _jsonify(request, stats=stats)
+
+
+@_route("/stats/sites")
+@_conditional("item_rollup")
+async def get_site_stats(request: Request) -> Response:
+    """
+    The site stats route returns the items collected at every site.
+
+    It takes the same arguments as the flask route.
+    """
+    stats = await rollups.totals_async(
+        "sites", routes.rollup_filters(request.query_params)
+    )
+    return _jsonify(request, stats=stats)
+
+
+@_route("/stats/materials")
+@_conditional("item_rollup")
+async def get_material_stats(request: Request) -> Response:
+    """
+    The material stats route returns the items collected of every material
+    and category.
+
+    It takes the same arguments as the flask route.
+    """
+    stats = await rollups.totals_async(
+        "materials", routes.rollup_filters(request.query_params)
+    )
+    return _jsonify(request, stats=stats)
+
+
+@_route("/stats/trends")
+@_conditional(*analytics.TABLES)
+async def get_trends(request: Request) -> Response:
+    """
+    The trends route returns the yearly totals and rates of the cleanups.
+
+    It takes the same arguments as the flask route.
+    """
+    grouping = request.query_params.get("by", "site")
+    if grouping not in analytics.GROUPINGS:
+        raise BadRequest("by must be either site or item.")
+
+    trends = await analytics.trends_async(
+        grouping,
+        routes.arg(request.query_params, "site_id", int),
+        routes.season(request.query_params),
+        routes.arg(request.query_params, "item_id", int),
+    )
+    return _jsonify(request, trends=trends)
+
+
+@_route("/stats/top-items")
+@_conditional(*top_items.TABLES)
+async def get_top_items(request: Request) -> Response:
+    """
+    The top items route returns the items collected the most in a season.
+
+    It takes the same arguments as the flask route.
+    """
+    volunteer_year = routes.arg(request.query_params, "volunteer_year", int)
+    volunteer_season = routes.season(request.query_params)
+    if volunteer_year is None or volunteer_season is None:
+        raise BadRequest("A year and season are needed.")
+
+    limit = routes.arg(request.query_params, "n", int)
+    ranked = top_items.top(
+        await top_items.load_async(),
+        volunteer_year,
+        volunteer_season,
+        routes.arg(request.query_params, "county"),
+        routes.arg(request.query_params, "site_id", int),
+        12 if limit is None else limit,
+    )
+    return _jsonify(request, top_items=ranked)
+
+
+async def _http_error(request: Request, err: HTTPException) -> Response:
+    """
+    Answers with the same error page flask gives for an HTTP error.
+
+    Args:
+        request: The request that failed.
+        err: The error raised while handling it.
+
+    Returns:
+        The error response.
+    """
+    _ = request
+    return Response(err.get_body(), status_code=err.code or 500, media_type="text/html")
+
+
+@asynccontextmanager
+async def _lifespan(app: Starlette):
+    """
+    Closes the connection pool and drops the live gauges of a worker on exit.
+
+    Args:
+        app: The app being served.
+    """
+    _ = app
+    yield
+    await aio_accessor.close_pool()
+    metrics.mark_process_dead(os.getpid())
+
+
+_EXCEPTION_HANDLERS: Dict[Any, Callable[..., Any]] = {HTTPException: _http_error}
+
+APP = Starlette(
+    routes=ROUTES,
+    middleware=[
+        Middleware(
+            CORSMiddleware,
+            allow_origins=["*"],
+            allow_methods=["*"],
+            allow_headers=["*"],
+        )
+    ],
+    exception_handlers=_EXCEPTION_HANDLERS,
+    lifespan=_lifespan,
+)
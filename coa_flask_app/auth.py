@@ -2,22 +2,247 @@
 The module designed to contain all logic related to authentication.
 """
 
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass
 import datetime
+import fcntl
 from functools import wraps
 import os
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Optional, Set
 
-from flask import request
+from flask import g, request
 import jwt
-from werkzeug.exceptions import Unauthorized
+from werkzeug.exceptions import ServiceUnavailable, Unauthorized
 from werkzeug.security import check_password_hash
 
+from coa_flask_app import metrics
+from coa_flask_app.aio_accessor import AsyncAccessor
 from coa_flask_app.db_accessor import Accessor
 
 
+@dataclass
+class HashSettings:
+    """
+    How many password hashes are checked at once and how long checks wait.
+
+    Attributes:
+        max_workers: The number of hashes checked at once by all processes.
+        max_queue: The number of checks allowed to wait for their turn.
+        timeout: The number of seconds a check may wait for its turn.
+        path: The file whose locks are shared by the processes.
+    """
+
+    max_workers: int
+    max_queue: int
+    timeout: float
+    path: str
+
+
+# How often a check waiting for a place tries to take one again, in seconds.
+_POLL_SECONDS = 0.01
+
+
+class HashLimiter:
+    """
+    Limits the password hashes checked at once across every process.
+
+    Hashing is deliberately slow, so only a few checks run at once and only
+    a few more may wait for their turn, however many workers serve the app.
+    Every place is a byte of a file shared by the workers, held with an fcntl
+    lock, which the system releases if a worker dies holding it. A check that
+    cannot get a place in time is turned away rather than tying up the worker
+    any longer.
+
+    The first max_workers + max_queue bytes are the places of the checks
+    running or waiting, and the max_workers bytes after them the turns of the
+    ones running. fcntl locks are held by a process rather than a thread, so
+    the places held by the threads of this process are tracked as well.
+    """
+
+    def __init__(self, settings: HashSettings) -> None:
+        """
+        The constructor of the HashLimiter class.
+
+        Args:
+            settings: How many hashes are checked at once and how long
+                checks wait.
+        """
+        self.settings = settings
+
+        self._lock = threading.Lock()
+        self._fd: Optional[int] = None
+        self._pid = 0
+        self._held: Set[int] = set()
+        self._pending = 0
+        self._rejected = 0
+
+    def _get_fd(self) -> int:
+        """
+        Gets the descriptor of the shared file in the current process.
+
+        The locks of a parent process are not inherited over a fork, so the
+        file is opened again the first time a forked worker checks a hash.
+        This must be called holding the lock.
+
+        Returns:
+            The file descriptor.
+        """
+        if self._fd is None or self._pid != os.getpid():
+            self._fd = os.open(self.settings.path, os.O_RDWR | os.O_CREAT, 0o600)
+            self._pid = os.getpid()
+            self._held = set()
+        return self._fd
+
+    def _take(self, first: int, count: int) -> Optional[int]:
+        """
+        Takes a free place out of a range of them, without waiting.
+
+        Args:
+            first: The first place of the range.
+            count: The number of places in the range.
+
+        Returns:
+            The place taken, or None if every one is held.
+        """
+        with self._lock:
+            fd = self._get_fd()
+            for place in range(first, first + count):
+                if place in self._held:
+                    continue
+                try:
+                    fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, place)
+                except OSError:
+                    continue
+                self._held.add(place)
+                return place
+        return None
+
+    def _wait_for(self, first: int, count: int, deadline: float) -> int:
+        """
+        Takes a free place out of a range of them, waiting for one if needed.
+
+        Args:
+            first: The first place of the range.
+            count: The number of places in the range.
+            deadline: Until when, from time.monotonic, to wait.
+
+        Returns:
+            The place taken.
+
+        Raises:
+            This can raise ServiceUnavailable errors if no place is freed
+            in time.
+        """
+        while True:
+            place = self._take(first, count)
+            if place is not None:
+                return place
+            if time.monotonic() >= deadline:
+                with self._lock:
+                    self._rejected += 1
+                raise ServiceUnavailable("Too many logins at once. Please try again.")
+            time.sleep(_POLL_SECONDS)
+
+    def _release(self, place: int) -> None:
+        """
+        Gives a place back.
+
+        Args:
+            place: The place taken.
+        """
+        with self._lock:
+            fcntl.lockf(self._get_fd(), fcntl.LOCK_UN, 1, place)
+            self._held.discard(place)
+
+    def check(self, pwhash: str, password: str) -> bool:
+        """
+        Checks a password against its hash once it is its turn.
+
+        The hash is checked on the calling thread, which blocks until then.
+
+        Args:
+            pwhash: The stored hash of the password.
+            password: The password to check.
+
+        Returns:
+            Whether the password matches.
+
+        Raises:
+            This can raise ServiceUnavailable errors if too many checks
+            are already running or waiting.
+        """
+        start = time.perf_counter()
+        deadline = time.monotonic() + self.settings.timeout
+        places = self.settings.max_workers + self.settings.max_queue
+        place = self._wait_for(0, places, deadline)
+
+        with self._lock:
+            self._pending += 1
+        metrics.PASSWORD_HASH_PENDING.inc()
+        try:
+            turn = self._wait_for(places, self.settings.max_workers, deadline)
+            try:
+                return check_password_hash(pwhash, password)
+            finally:
+                self._release(turn)
+        finally:
+            with self._lock:
+                self._pending -= 1
+            metrics.PASSWORD_HASH_PENDING.dec()
+            self._release(place)
+            metrics.PASSWORD_HASH_SECONDS.observe(time.perf_counter() - start)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Gets the usage counters of the limiter in the current process.
+
+        Returns:
+            A dictionary of the limiter statistics.
+        """
+        with self._lock:
+            return {
+                "max_workers": self.settings.max_workers,
+                "max_queue": self.settings.max_queue,
+                "pending": self._pending,
+                "rejected": self._rejected,
+            }
+
+
+HASH_LIMITER = HashLimiter(
+    HashSettings(
+        max_workers=int(os.environ.get("COA_HASH_WORKERS", "2")),
+        max_queue=int(os.environ.get("COA_HASH_QUEUE", "8")),
+        timeout=float(os.environ.get("COA_HASH_TIMEOUT", "5")),
+        path=os.environ.get(
+            "COA_HASH_LOCK_FILE",
+            os.path.join(tempfile.gettempdir(), "coa_hash_places"),
+        ),
+    )
+)
+
+
+_LOGIN_QUERY = """
+            SELECT
+                password
+            FROM coa.ab_user AS cau
+            WHERE
+                cau.username = %s AND
+                cau.active = 1
+            """
+
+
 def login(username: str, password: str) -> str:
     """
     A login function to handle authentication.
 
+    The user is looked up on a connection of its own rather than the one
+    of the request, returned to the pool before the password hash is
+    checked, so no connection is held while hashing.
+
     Args:
         username: The username of person trying to login.
         password: The password of the person trying to login.
@@ -28,38 +253,156 @@ def login(username: str, password: str) -> str:
     Raises:
         This can raise Unauthorized errors if the login attempt fails.
     """
-    query = """
-            SELECT
-                password
-            FROM coa.ab_user AS cau
-            WHERE
-                cau.username = %s AND
-                cau.active = 1
-            """
-    with Accessor() as db_handle:
-        db_handle.execute(query, (username,))
+    with Accessor(join=False) as db_handle:
+        db_handle.execute(_LOGIN_QUERY, (username,))
         record = db_handle.fetchone()
 
-        if record is None or not check_password_hash(record["password"], password):
-            raise Unauthorized()
-
-        return str(
-            jwt.encode(
-                {
-                    "exp": datetime.datetime.utcnow()
-                    + datetime.timedelta(days=0, hours=6),
-                    "iat": datetime.datetime.utcnow(),
-                    "sub": username,
-                },
-                os.environ["SECRET_KEY"],
-                algorithm="HS256",
-            )
+    if record is None or not HASH_LIMITER.check(record["password"], password):
+        raise Unauthorized()
+
+    return _issue_token(username)
+
+
+async def login_async(username: str, password: str) -> str:
+    """
+    Logs a user in on the async connection pool.
+
+    The hash is checked under the same limit as login, on a thread of the
+    loop's default executor so the event loop is never blocked.
+
+    Args:
+        username: The username of person trying to login.
+        password: The password of the person trying to login.
+
+    Returns:
+        The JWT if there are authorized.
+
+    Raises:
+        This can raise Unauthorized errors if the login attempt fails.
+    """
+    async with AsyncAccessor(join=False) as db_handle:
+        await db_handle.execute(_LOGIN_QUERY, (username,))
+        record = await db_handle.fetchone()
+
+    if record is None:
+        raise Unauthorized()
+    matches = await asyncio.get_running_loop().run_in_executor(
+        None, HASH_LIMITER.check, record["password"], password
+    )
+    if not matches:
+        raise Unauthorized()
+
+    return _issue_token(username)
+
+
+def _issue_token(username: str) -> str:
+    """
+    Issues the JWT of a user that has logged in.
+
+    Args:
+        username: The username of the person that logged in.
+
+    Returns:
+        The JWT, valid for six hours.
+    """
+    return str(
+        jwt.encode(
+            {
+                "exp": datetime.datetime.utcnow() + datetime.timedelta(days=0, hours=6),
+                "iat": datetime.datetime.utcnow(),
+                "sub": username,
+            },
+            os.environ["SECRET_KEY"],
+            algorithm="HS256",
         )
+    )
+
+
+class TokenCache:
+    """
+    A size bounded least recently used cache of verified tokens.
+
+    Each token is only kept until its own expiry, so a cached token is
+    never accepted for longer than verifying it again would allow.
+    """
+
+    def __init__(self, max_size: int) -> None:
+        """
+        The constructor of the TokenCache class.
+
+        Args:
+            max_size: The maximum number of tokens to hold.
+        """
+        self.max_size = max_size
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        """
+        Gets the claims of a token that has already been verified.
+
+        Args:
+            token: The encoded token.
+
+        Returns:
+            The claims of the token or None if it has to be verified.
+        """
+        with self._lock:
+            claims = self._entries.get(token)
+            if claims is not None and claims["exp"] > time.time():
+                self._entries.move_to_end(token)
+                self._hits += 1
+                metrics.TOKEN_CACHE_LOOKUPS.labels("hit").inc()
+                return claims
+            if claims is not None:
+                del self._entries[token]
+            self._misses += 1
+            metrics.TOKEN_CACHE_LOOKUPS.labels("miss").inc()
+            return None
+
+    def put(self, token: str, claims: Dict[str, Any]) -> None:
+        """
+        Remembers a token that has been verified.
+
+        Args:
+            token: The encoded token.
+            claims: The verified claims of the token.
+        """
+        if "exp" not in claims:
+            return
+        with self._lock:
+            self._entries[token] = claims
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Gets the usage counters of the cache.
+
+        Returns:
+            A dictionary of the cache statistics.
+        """
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self._hits,
+                "misses": self._misses,
+            }
+
+
+TOKEN_CACHE = TokenCache(int(os.environ.get("COA_TOKEN_CACHE_SIZE", "1024")))
 
 
 def verify_token(func):
     """
     A decorator used for the flask routes to add authentication checks.
+
+    The verified claims of the token are put on flask.g as token_claims.
     """
 
     @wraps(func)
@@ -69,13 +412,19 @@ def verify_token(func):
             raise Unauthorized("No provided token. Please login.")
 
         auth_token = auth_header.split(" ")[1]
-        try:
-            jwt.decode(auth_token, os.environ["SECRET_KEY"])
-        except jwt.ExpiredSignatureError as err:
-            raise Unauthorized("Signature expired. Please log in again.") from err
-        except jwt.InvalidTokenError as err:
-            raise Unauthorized("Invalid token. Please log in again.") from err
+        claims = TOKEN_CACHE.get(auth_token)
+        if claims is None:
+            try:
+                claims = jwt.decode(
+                    auth_token, os.environ["SECRET_KEY"], algorithms=["HS256"]
+                )
+            except jwt.ExpiredSignatureError as err:
+                raise Unauthorized("Signature expired. Please log in again.") from err
+            except jwt.InvalidTokenError as err:
+                raise Unauthorized("Invalid token. Please log in again.") from err
+            TOKEN_CACHE.put(auth_token, claims)
 
+        g.token_claims = claims
         return func()
 
     return _inner
@@ -0,0 +1,299 @@
+"""
+The module designed to contain the in-process caching of query results.
+
+Results are cached per table so that a write to a table only has to drop
+the entries that were read from it. Every entry also remembers the shared
+generation of its table, so a write made by another worker makes it stale.
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import partial, wraps
+import inspect
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from coa_flask_app import db_accessor, generations
+
+# The expiry time, generation and value of a cache entry.
+_Entry = Tuple[float, Any, Any]
+
+
+@dataclass
+class CacheCounters:
+    """
+    The usage counters of a cache.
+
+    Attributes:
+        hits: The number of lookups answered from the cache.
+        misses: The number of lookups that had to load the value.
+        evictions: The number of entries dropped to make room.
+        invalidations: The number of times a write dropped a table.
+    """
+
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    invalidations: int = 0
+
+
+class TTLCache:
+    """
+    A size bounded least recently used cache whose entries also expire.
+    """
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+        """
+        The constructor of the TTLCache class.
+
+        Args:
+            max_size: The maximum number of entries to hold.
+            ttl: The number of seconds an entry stays valid for.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[Hashable, ...], _Entry]" = OrderedDict()
+        self._counters = CacheCounters()
+
+    def lookup(
+        self, key: Tuple[Hashable, ...], generation: Optional[Any] = None
+    ) -> Tuple[bool, Any]:
+        """
+        Looks an entry up in the cache.
+
+        Args:
+            key: The key of the entry, starting with the table it came from.
+            generation: The version of the data an entry must have been
+                loaded at to be used.
+
+        Returns:
+            Whether there was a usable entry and its value.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now and entry[1] == generation:
+                self._entries.move_to_end(key)
+                self._counters.hits += 1
+                return True, entry[2]
+            self._counters.misses += 1
+            return False, None
+
+    def store(
+        self, key: Tuple[Hashable, ...], value: Any, generation: Optional[Any] = None
+    ) -> None:
+        """
+        Stores an entry in the cache, evicting the least recently used ones.
+
+        Args:
+            key: The key of the entry, starting with the table it came from.
+            value: The value to cache.
+            generation: The version of the data the value was loaded at.
+        """
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, generation, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._counters.evictions += 1
+
+    def get_or_load(
+        self,
+        key: Tuple[Hashable, ...],
+        loader: Callable[[], Any],
+        generation: Optional[Any] = None,
+    ) -> Any:
+        """
+        Gets an entry from the cache, loading it on a miss.
+
+        Args:
+            key: The key of the entry, starting with the table it came from.
+            loader: The function called to produce the value on a miss.
+            generation: The version of the data an entry must have been
+                loaded at to be used.
+
+        Returns:
+            The cached or freshly loaded value.
+        """
+        hit, value = self.lookup(key, generation)
+        if not hit:
+            value = loader()
+            self.store(key, value, generation)
+        return value
+
+    def invalidate(self, table: str) -> None:
+        """
+        Drops every entry that was read from a table.
+
+        Args:
+            table: The name of the table that changed.
+        """
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == table]:
+                del self._entries[key]
+            self._counters.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Gets the usage counters of the cache.
+
+        Returns:
+            A dictionary of the cache statistics.
+        """
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self._counters.hits,
+                "misses": self._counters.misses,
+                "evictions": self._counters.evictions,
+                "invalidations": self._counters.invalidations,
+            }
+
+
+QUERY_CACHE = TTLCache(
+    max_size=int(os.environ.get("COA_CACHE_MAX_SIZE", "256")),
+    ttl=float(os.environ.get("COA_CACHE_TTL", "300")),
+)
+
+
+def cached(table: str):
+    """
+    A decorator used for the data getters to cache their results.
+
+    Coroutine getters are supported too, sharing the entries of the plain
+    getters with the same table and arguments.
+
+    Args:
+        table: The name of the table the getter reads from.
+    """
+
+    def _decorator(func):
+        if inspect.iscoroutinefunction(func):
+
+            @wraps(func)
+            async def _async_inner(*args):
+                key = (table,) + args
+                generation = generations.current(table)
+                hit, value = QUERY_CACHE.lookup(key, generation)
+                if not hit:
+                    value = await func(*args)
+                    QUERY_CACHE.store(key, value, generation)
+                return value
+
+            return _async_inner
+
+        @wraps(func)
+        def _inner(*args):
+            return QUERY_CACHE.get_or_load(
+                (table,) + args, lambda: func(*args), generations.current(table)
+            )
+
+        return _inner
+
+    return _decorator
+
+
+def _invalidate(table: str) -> None:
+    """
+    Drops the cached results read from a table in every worker now.
+
+    Args:
+        table: The name of the table that changed.
+    """
+    generations.bump(table)
+    QUERY_CACHE.invalidate(table)
+
+
+class _Reinvalidator:
+    """
+    A single thread per process invalidating tables again after a delay.
+
+    Every table has at most one deadline pending, so many writes to a table
+    within the delay are invalidated again once, after the last of them.
+    """
+
+    def __init__(self) -> None:
+        """
+        The constructor of the _Reinvalidator class.
+        """
+        self._cond = threading.Condition()
+        self._deadlines: Dict[str, float] = {}
+        self._pid: Optional[int] = None
+
+    def schedule(self, table: str, delay: float) -> None:
+        """
+        Invalidates a table again once a delay has passed.
+
+        The thread is started on first use in every process, as it does not
+        survive a fork.
+
+        Args:
+            table: The name of the table that changed.
+            delay: The number of seconds to wait for.
+        """
+        with self._cond:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._deadlines = {}
+                threading.Thread(target=self._run, daemon=True).start()
+            self._deadlines[table] = time.monotonic() + delay
+            self._cond.notify()
+
+    def _run(self) -> None:
+        """
+        Invalidates the tables whose deadline has passed, forever.
+        """
+        while True:
+            with self._cond:
+                now = time.monotonic()
+                due = [table for table, at in self._deadlines.items() if at <= now]
+                for table in due:
+                    del self._deadlines[table]
+                if not due:
+                    self._cond.wait(
+                        min(self._deadlines.values(), default=now + 60) - now
+                    )
+                    continue
+            for table in due:
+                _invalidate(table)
+
+
+_REINVALIDATOR = _Reinvalidator()
+
+
+def invalidate(table: str) -> None:
+    """
+    Drops the cached results read from a table in every worker.
+
+    This should be called after writing to the table. Within a request it
+    takes effect once the request's transaction has been committed, so no
+    worker can cache the data from before the write under the new
+    generation.
+
+    With read replicas a worker could still read the old rows from a
+    replica that has not caught up yet, so the table is invalidated once
+    more after the replicas' maximum lag.
+
+    Args:
+        table: The name of the table that changed.
+    """
+    db_accessor.on_commit(partial(_invalidate, table))
+    if db_accessor.get_replicas():
+        db_accessor.on_commit(
+            partial(_REINVALIDATOR.schedule, table, db_accessor.replica_max_lag())
+        )
+
+
+def stats() -> Dict[str, Any]:
+    """
+    Gets the usage counters of the query cache.
+
+    Returns:
+        A dictionary of the cache statistics.
+    """
+    return QUERY_CACHE.stats()
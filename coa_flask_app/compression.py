@@ -0,0 +1,228 @@
+"""
+The module designed to contain the precompressed responses of the routes.
+
+The item and site listings are the same bytes for nearly every caller, so
+their serialized body is kept along with its gzip and brotli compressions in
+the shared response cache, keyed by the generations of the tables they are
+read from. A write to one of the tables bumps its generation and the next
+request builds them again. Every other request is answered with the stored
+bytes of the best encoding the client accepts.
+"""
+
+from functools import wraps
+import gzip
+import os
+from typing import (
+    Callable,
+    Container,
+    Dict,
+    Iterable,
+    Mapping,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from flask import current_app, request
+from werkzeug.http import parse_accept_header
+
+from coa_flask_app import response_cache
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+# The encodings of a payload by the name used in Accept-Encoding.
+Encodings = Mapping[str, Union[bytes, memoryview]]
+
+# The encoders of every supported encoding, in order of preference. Payloads
+# are only compressed once per version, so the highest levels are used.
+_ENCODERS: Dict[str, Callable[[bytes], bytes]] = {}
+if brotli is not None:
+    _ENCODERS["br"] = lambda body: brotli.compress(body, quality=11)
+_ENCODERS["gzip"] = lambda body: gzip.compress(body, compresslevel=9, mtime=0)
+
+
+def encode(body: bytes) -> Encodings:
+    """
+    Compresses a body with every supported encoding.
+
+    Bodies shorter than COA_COMPRESS_MIN_SIZE bytes are not compressed, as
+    the headers would outweigh the savings.
+
+    Args:
+        body: The uncompressed body.
+
+    Returns:
+        The body under identity along with every compression of it.
+    """
+    encodings = {"identity": body}
+    if len(body) >= int(os.environ.get("COA_COMPRESS_MIN_SIZE", "512")):
+        for name, encoder in _ENCODERS.items():
+            encodings[name] = encoder(body)
+    return encodings
+
+
+def negotiate(accept_encoding: Optional[str], encodings: Container[str]) -> str:
+    """
+    Picks the encoding of a payload to send to a client.
+
+    Args:
+        accept_encoding: The Accept-Encoding header of the request.
+        encodings: The names of the encodings the payload is available in.
+
+    Returns:
+        The most preferred encoding the client accepts, identity when it
+        accepts none of the compressed ones.
+    """
+    offered = [name for name in _ENCODERS if name in encodings] + ["identity"]
+    return parse_accept_header(accept_encoding).best_match(offered, default="identity")
+
+
+def preferred(accept_encoding: Optional[str]) -> str:
+    """
+    Picks the encoding a client gets of a payload large enough to compress.
+
+    Args:
+        accept_encoding: The Accept-Encoding header of the request.
+
+    Returns:
+        The most preferred supported encoding the client accepts.
+    """
+    return negotiate(accept_encoding, _ENCODERS)
+
+
+def tagged(etag: str, encoding: Optional[str]) -> str:
+    """
+    Gets the ETag of one encoding of a response.
+
+    Every encoding is a different representation, so caches must not swap
+    one for another on a matching tag.
+
+    Args:
+        etag: The ETag of the response.
+        encoding: The Content-Encoding of the response, if any.
+
+    Returns:
+        The ETag with the encoding appended, unchanged for identity.
+    """
+    if encoding is None or encoding == "identity":
+        return etag
+    return f"{etag}-{encoding}"
+
+
+def _pack(encodings: Encodings) -> bytes:
+    """
+    Packs the encodings of a payload into one value for the shared cache.
+
+    Args:
+        encodings: The encodings of the payload.
+
+    Returns:
+        A header of the names and lengths followed by the bodies.
+    """
+    header = ",".join(f"{name}={len(body)}" for name, body in encodings.items())
+    return header.encode() + b"\n" + b"".join(encodings.values())
+
+
+def _unpack(value: bytes) -> Encodings:
+    """
+    Unpacks the encodings of a payload read from the shared cache.
+
+    Args:
+        value: The packed encodings.
+
+    Returns:
+        Views of every encoding, so only the one sent is copied.
+    """
+    header, _, _ = value.partition(b"\n")
+    view = memoryview(value)
+    offset = len(header) + 1
+    encodings = {}
+    for part in header.decode().split(","):
+        name, length = part.split("=")
+        encodings[name] = view[offset : offset + int(length)]
+        offset += int(length)
+    return encodings
+
+
+def lookup(key: str) -> Optional[Encodings]:
+    """
+    Gets the encodings of a payload from the shared response cache.
+
+    Args:
+        key: The key of the payload, including the version of its tables.
+
+    Returns:
+        The encodings or None if they have to be built.
+    """
+    value = response_cache.lookup(key)
+    return None if value is None else _unpack(value)
+
+
+def store(key: str, body: bytes) -> Encodings:
+    """
+    Compresses a body and puts it in the shared response cache.
+
+    Args:
+        key: The key of the payload, including the version of its tables.
+        body: The uncompressed body.
+
+    Returns:
+        The encodings of the body.
+    """
+    encodings = encode(body)
+    response_cache.store(key, _pack(encodings))
+    return encodings
+
+
+def payload_key(path: str, params: Iterable[Tuple[str, str]], *tables: str) -> str:
+    """
+    Builds the key of a precompressed payload at the current version.
+
+    Args:
+        path: The path of the request.
+        params: The query arguments of the request, in any order.
+        tables: The names of the tables the payload is built from.
+
+    Returns:
+        The key of the payload in the shared response cache.
+    """
+    return response_cache.key_for(path, params, *tables) + "|encoded"
+
+
+def precompressed(*tables: str):
+    """
+    A decorator used for the flask JSON routes to serve precompressed bodies.
+
+    The route is only run when the tables have changed since its body was
+    last built by any worker.
+
+    Args:
+        tables: The names of the tables the route reads from.
+    """
+
+    def _decorator(func):
+        @wraps(func)
+        def _inner(*args, **kwargs):
+            # The key is taken before the body is built, so a write landing
+            # in between leaves the body under an older version.
+            key = payload_key(request.path, request.args.items(multi=True), *tables)
+            encodings = lookup(key)
+            if encodings is None:
+                body = current_app.make_response(func(*args, **kwargs)).get_data()
+                encodings = store(key, body)
+
+            encoding = negotiate(request.headers.get("Accept-Encoding"), encodings)
+            response = current_app.response_class(
+                bytes(encodings[encoding]), mimetype="application/json"
+            )
+            if encoding != "identity":
+                response.headers["Content-Encoding"] = encoding
+            response.vary.add("Accept-Encoding")
+            return response
+
+        return _inner
+
+    return _decorator
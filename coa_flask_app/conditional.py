@@ -0,0 +1,110 @@
+"""
+The module designed to contain the conditional GET handling of the routes.
+
+The ETag of a response is derived from the shared generations of the tables
+it is built from, so checking whether a client's copy is current costs a
+couple of memory reads instead of a query. A compressed response gets the
+encoding appended to its ETag, so the tag names exactly one representation.
+"""
+
+from functools import wraps
+import hashlib
+from typing import Optional
+
+from flask import make_response, request
+from werkzeug.datastructures import ETags
+
+from coa_flask_app import compression, generations
+
+
+def etag(*tables: str) -> str:
+    """
+    Computes the ETag of the current request.
+
+    Args:
+        tables: The names of the tables the response is built from.
+
+    Returns:
+        The ETag for the current version of the response.
+    """
+    return etag_for(request.full_path, *tables)
+
+
+def etag_for(full_path: str, *tables: str) -> str:
+    """
+    Computes the ETag of a request by its path, for use outside of flask.
+
+    Args:
+        full_path: The path of the request along with its query string,
+            in the form flask's request.full_path gives.
+        tables: The names of the tables the response is built from.
+
+    Returns:
+        The ETag for the current version of the response.
+    """
+    version = ":".join(
+        [str(generations.epoch()), full_path]
+        + [f"{table}={generations.current(table)}" for table in tables]
+    )
+    return hashlib.sha1(version.encode()).hexdigest()
+
+
+def matching(
+    current: str, if_none_match: ETags, accept_encoding: Optional[str]
+) -> Optional[str]:
+    """
+    Finds the tag of the client's copy of a response, if it is current.
+
+    The copy is current if it is uncompressed, or compressed with the
+    encoding the client would get now.
+
+    Args:
+        current: The ETag for the current version of the response.
+        if_none_match: The tags the client sent in If-None-Match.
+        accept_encoding: The Accept-Encoding header of the request.
+
+    Returns:
+        The matching tag or None if the response has to be sent.
+    """
+    encoded = compression.tagged(current, compression.preferred(accept_encoding))
+    for tag in (current, encoded):
+        if if_none_match.contains_weak(tag):
+            return tag
+    return None
+
+
+def conditional(*tables: str):
+    """
+    A decorator used for the flask routes to answer conditional GETs.
+
+    The route is only run when the client does not already have the current
+    version of the response, otherwise an empty 304 is returned.
+
+    Args:
+        tables: The names of the tables the route reads from.
+    """
+
+    def _decorator(func):
+        @wraps(func)
+        def _inner(*args, **kwargs):
+            # The ETag is taken before the body is built, so a write landing
+            # in between leaves the client with an older tag rather than a
+            # newer tag for an older body.
+            current = etag(*tables)
+            tag = matching(
+                current, request.if_none_match, request.headers.get("Accept-Encoding")
+            )
+            if tag is not None:
+                response = make_response("", 304)
+            else:
+                response = make_response(func(*args, **kwargs))
+                tag = compression.tagged(
+                    current, response.headers.get("Content-Encoding")
+                )
+            response.set_etag(tag)
+            response.headers["Cache-Control"] = "no-cache"
+            return response
+
+        return _inner
+
+    return _decorator
@@ -1,60 +1,813 @@
 """
 The module designed to contain all the database access logic.
+
+Connections are handed out from a per-worker pool so that a request does not
+pay for a fresh TCP handshake and authentication every time. The pool is
+created lazily inside each process, which keeps it safe to use with uwsgi
+forking workers off of the master after the app has been imported.
+
+Within a request every Accessor shares one connection through the request's
+unit of work, so the whole request is committed or rolled back together.
+
+Read only blocks may instead be sent to read replicas, listed in DB_REPLICAS.
+A client that has just written reads from the primary for a short while, so
+it always sees its own changes.
 """
 
+from contextvars import ContextVar
+from dataclasses import dataclass
+from functools import partial
+import itertools
+import math
 import os
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
+from flask import g, has_request_context, request
 import pymysql
 
+from coa_flask_app import metrics
+from coa_flask_app.pool import ConnectionPool, PoolSettings, PoolTimeout
+
+
+def _connect(
+    host: Optional[str] = None, port: Optional[int] = None
+) -> pymysql.connections.Connection:
+    """
+    Opens a brand new connection to the database.
+
+    Args:
+        host: The server to connect to, DB_SERVER by default.
+        port: The port to connect to, DB_PORT by default.
+
+    Returns:
+        A new database connection.
+    """
+    return pymysql.connect(
+        host=host or os.environ["DB_SERVER"],
+        user=os.environ["DB_USERNAME"],
+        password=os.environ["DB_PASSWORD"],
+        database=os.environ["DB_DATABASE"],
+        port=port or int(os.environ["DB_PORT"]),
+    )
+
+
+_CONNECT: Callable[[], Any] = _connect
+_POOL: Optional[ConnectionPool] = None
+_POOL_LOCK = threading.Lock()
+
+
+def set_connect(connect: Callable[[], Any]) -> None:
+    """
+    Replaces how new connections are opened.
+
+    This is used to run the app against a stand-in database, such as in the
+    benchmarks. The current pool is dropped so every later checkout uses it.
+
+    Args:
+        connect: The function used to open a new connection.
+    """
+    global _CONNECT, _POOL  # pylint: disable=global-statement
+    with _POOL_LOCK:
+        _CONNECT = connect
+        _POOL = None
+
+
+def _new_pool(connect: Callable[[], Any]) -> ConnectionPool:
+    """
+    Creates a connection pool sized by the DB_POOL_* environment variables.
+
+    Args:
+        connect: The function used to open a new connection.
+
+    Returns:
+        The new connection pool.
+    """
+    return ConnectionPool(
+        PoolSettings(
+            connect,
+            min_size=int(os.environ.get("DB_POOL_MIN_SIZE", "1")),
+            max_size=int(os.environ.get("DB_POOL_MAX_SIZE", "4")),
+            max_age=float(os.environ.get("DB_POOL_MAX_AGE", "3600")),
+            timeout=float(os.environ.get("DB_POOL_TIMEOUT", "10")),
+        ),
+    )
+
+
+def get_pool() -> ConnectionPool:
+    """
+    Gets the connection pool of the current process.
+
+    A pool inherited from a parent process is abandoned rather than closed,
+    as closing it would shut down the sockets the parent is still using.
+
+    Returns:
+        The connection pool of this process.
+    """
+    global _POOL  # pylint: disable=global-statement
+    pool = _POOL
+    if pool is not None and pool.pid == os.getpid():
+        return pool
+
+    with _POOL_LOCK:
+        if _POOL is None or _POOL.pid != os.getpid():
+            _POOL = _new_pool(_CONNECT)
+        return _POOL
+
+
+def pool_stats() -> Optional[Dict[str, Any]]:
+    """
+    Gets the statistics of the connection pool of the current process.
+
+    Returns:
+        The pool statistics or None if this process has not used the database.
+    """
+    pool = _POOL
+    if pool is None or pool.pid != os.getpid():
+        return None
+    return pool.stats()
+
+
+# The statements reporting how far behind a replica is, for MySQL 8.0.22 and
+# later and for older servers, with the column holding the number of seconds.
+LAG_QUERIES = (
+    ("SHOW REPLICA STATUS", "Seconds_Behind_Source"),
+    ("SHOW SLAVE STATUS", "Seconds_Behind_Master"),
+)
+ACCESS_DENIED = 1227
+
+
+def lag_of(record: Optional[Dict[str, Any]], column: str) -> Optional[float]:
+    """
+    Gets the lag of a replica from the row of one of LAG_QUERIES.
+
+    Args:
+        record: The row, or None if the server is not a replica.
+        column: The column holding the number of seconds.
+
+    Returns:
+        The lag in seconds, infinite if replication has stopped, or None if
+        the server does not report it.
+    """
+    if record is None:
+        return None
+    lag = record.get(column)
+    return math.inf if lag is None else float(lag)
+
+
+def _replication_lag(connection: Any) -> Optional[float]:
+    """
+    Gets how many seconds a replica is behind the primary.
+
+    Args:
+        connection: A connection to the replica.
+
+    Returns:
+        The lag in seconds, infinite if replication has stopped, or None if
+        the server does not report it, such as when the user lacks the
+        REPLICATION CLIENT privilege.
+    """
+    cursor = connection.cursor(pymysql.cursors.DictCursor)
+    try:
+        for query, column in LAG_QUERIES:
+            try:
+                cursor.execute(query)
+            except pymysql.err.ProgrammingError:
+                continue
+            except pymysql.err.OperationalError as err:
+                if err.args[0] == ACCESS_DENIED:
+                    return None
+                raise
+            return lag_of(cursor.fetchone(), column)
+        return None
+    finally:
+        cursor.close()
+
+
+@dataclass
+class ReplicaHealth:
+    """
+    How a read replica has been doing, shared by every pool reading from it.
+
+    Attributes:
+        down_until: Until when, from time.monotonic, the replica is left
+            alone.
+        checked: When its lag was last checked, from time.monotonic.
+        lag: The number of seconds it was last behind the primary, if known.
+        failures: The number of times it has been marked down.
+    """
+
+    down_until: float = 0.0
+    checked: float = 0.0
+    lag: Optional[float] = None
+    failures: int = 0
+
+    def is_up(self) -> bool:
+        """
+        Checks whether the replica may be sent reads.
+
+        Returns:
+            Whether it is not marked down.
+        """
+        return time.monotonic() >= self.down_until
+
+    def mark_down(self) -> None:
+        """
+        Stops sending reads to the replica for DB_REPLICA_RETRY seconds.
+        """
+        self.down_until = time.monotonic() + float(
+            os.environ.get("DB_REPLICA_RETRY", "30")
+        )
+        self.failures += 1
+
+    def check_due(self) -> bool:
+        """
+        Checks whether the lag of the replica should be checked again.
+
+        It is checked at most once every DB_REPLICA_CHECK_INTERVAL seconds,
+        and the check counts as done once this returns True.
+
+        Returns:
+            Whether to check the lag now.
+        """
+        now = time.monotonic()
+        if now - self.checked < float(os.environ.get("DB_REPLICA_CHECK_INTERVAL", "5")):
+            return False
+        self.checked = now
+        return True
+
+    def record_lag(self, lag: Optional[float]) -> bool:
+        """
+        Records the lag of the replica.
+
+        Args:
+            lag: The number of seconds it is behind, or None if unknown.
+
+        Returns:
+            Whether the replica is close enough to the primary for reads.
+        """
+        self.lag = lag
+        return lag is None or lag <= replica_max_lag()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Gets the health counters of the replica.
+
+        Returns:
+            A dictionary of the replica health.
+        """
+        return {"healthy": self.is_up(), "lag": self.lag, "failures": self.failures}
+
+
+class Replica:
+    """
+    A read replica of the database with a connection pool of its own.
+
+    A replica that cannot be reached, or that has fallen further behind the
+    primary than DB_REPLICA_MAX_LAG, is left alone for DB_REPLICA_RETRY
+    seconds and its reads go to the other replicas or the primary.
+    """
+
+    def __init__(self, address: str) -> None:
+        """
+        The constructor of the Replica class.
+
+        Args:
+            address: The host of the replica, optionally followed by a colon
+                and the port, which is DB_PORT by default.
+        """
+        host, _, port = address.strip().partition(":")
+        self.address = address.strip()
+        self.host = host
+        self.port = int(port) if port else None
+        self.health = ReplicaHealth()
+        self._lock = threading.Lock()
+        self._pool: Optional[ConnectionPool] = None
+
+    def get_pool(self) -> ConnectionPool:
+        """
+        Gets the replica's connection pool of the current process.
+
+        Returns:
+            The connection pool of this process.
+        """
+        pool = self._pool
+        if pool is not None and pool.pid == os.getpid():
+            return pool
+
+        with self._lock:
+            if self._pool is None or self._pool.pid != os.getpid():
+                self._pool = _new_pool(partial(_connect, self.host, self.port))
+            return self._pool
+
+    def mark_down(self) -> None:
+        """
+        Stops sending reads to the replica for a while.
+        """
+        with self._lock:
+            self.health.mark_down()
+
+    def acquire(self) -> Optional[Any]:
+        """
+        Checks a connection out of the replica's pool if it is fit for reads.
+
+        Returns:
+            A connection, or None if the replica is down, too far behind or
+            has no connection free.
+        """
+        if not self.health.is_up():
+            return None
+        try:
+            pool = self.get_pool()
+            connection = pool.acquire()
+        except PoolTimeout:
+            return None
+        except pymysql.err.Error:
+            self.mark_down()
+            return None
+        return self._checked(pool, connection)
+
+    def _checked(self, pool: ConnectionPool, connection: Any) -> Optional[Any]:
+        """
+        Checks the lag of the replica on a checkout, when it is due.
+
+        Args:
+            pool: The pool the connection was checked out of.
+            connection: The connection checked out.
+
+        Returns:
+            The connection, or None once it has been returned to the pool
+            because the replica is too far behind or failed.
+        """
+        if not self.health.check_due():
+            return connection
+        try:
+            fit = self.health.record_lag(_replication_lag(connection))
+        except pymysql.err.Error:
+            pool.release(connection, discard=True)
+            self.mark_down()
+            return None
+        if not fit:
+            pool.release(connection)
+            self.mark_down()
+            return None
+        return connection
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Gets the health and pool counters of the replica.
+
+        Returns:
+            A dictionary of the replica statistics.
+        """
+        pool = self._pool
+        return {
+            "address": self.address,
+            **self.health.stats(),
+            "pool": pool.stats() if pool is not None else None,
+        }
+
+
+_REPLICAS: Optional[List[Replica]] = None
+_REPLICA_TURN = itertools.count()
+
+# The cookie holding until when, as a unix time, a client reads from the
+# primary after a write.
+STICKY_COOKIE = "coa_read_primary_until"
+
+
+def get_replicas() -> List[Replica]:
+    """
+    Gets the read replicas listed in DB_REPLICAS.
+
+    Returns:
+        The replicas, empty when every query goes to the primary.
+    """
+    global _REPLICAS  # pylint: disable=global-statement
+    if _REPLICAS is None:
+        with _POOL_LOCK:
+            if _REPLICAS is None:
+                _REPLICAS = [
+                    Replica(address)
+                    for address in os.environ.get("DB_REPLICAS", "").split(",")
+                    if address.strip()
+                ]
+    return _REPLICAS
+
+
+def replica_max_lag() -> float:
+    """
+    Gets how many seconds a replica may be behind and still serve reads.
+
+    Returns:
+        The maximum lag in seconds.
+    """
+    return float(os.environ.get("DB_REPLICA_MAX_LAG", "5"))
+
+
+def replica_stats() -> List[Dict[str, Any]]:
+    """
+    Gets the statistics of the read replicas in the current process.
+
+    Returns:
+        The statistics of every replica.
+    """
+    return [replica.stats() for replica in get_replicas()]
+
+
+def within_sticky_window(cookie: Optional[str]) -> bool:
+    """
+    Checks whether a client is still reading from the primary after a write.
+
+    Args:
+        cookie: The value of the client's STICKY_COOKIE, if it sent one.
+
+    Returns:
+        Whether the cookie holds a time still to come.
+    """
+    try:
+        return float(cookie or "0") > time.time()
+    except ValueError:
+        return False
+
+
+def _reads_from_primary() -> bool:
+    """
+    Checks whether the reads of the current request must see its writes.
+
+    That is the case once the request itself has written, or while the
+    client is within the sticky window of an earlier write.
+
+    Returns:
+        Whether to read from the primary.
+    """
+    if not has_request_context():
+        return False
+    unit = g.get("unit_of_work")
+    if unit is not None and unit.wrote:
+        return True
+    return within_sticky_window(request.cookies.get(STICKY_COOKIE))
+
+
+def replica_order() -> List[Replica]:
+    """
+    Gets the read replicas in the order to try them in for the next read.
+
+    Every read starts from the next replica in turn, so reads are spread
+    over all of them.
+
+    Returns:
+        The replicas, empty when every query goes to the primary.
+    """
+    replicas = get_replicas()
+    if not replicas:
+        return []
+    turn = next(_REPLICA_TURN) % len(replicas)
+    return replicas[turn:] + replicas[:turn]
+
+
+def _acquire_replica() -> Optional[Tuple[Replica, Any]]:
+    """
+    Checks a connection out of the next healthy replica in turn.
+
+    Returns:
+        The replica and the connection, or None to read from the primary.
+    """
+    if not get_replicas():
+        return None
+    if _reads_from_primary():
+        metrics.DB_READS.labels("primary_sticky").inc()
+        return None
+
+    for replica in replica_order():
+        connection = replica.acquire()
+        if connection is not None:
+            metrics.DB_READS.labels("replica").inc()
+            return replica, connection
+    metrics.DB_READS.labels("primary_fallback").inc()
+    return None
+
+
+def stick_to_primary(response: Any) -> None:
+    """
+    Sends the client's reads to the primary for DB_REPLICA_STICKY_SECONDS.
+
+    This should be called on the response of a request that wrote, so the
+    client's next reads see the change even if the replicas lag behind.
+
+    Args:
+        response: The flask or starlette response to set the cookie on.
+    """
+    seconds = float(os.environ.get("DB_REPLICA_STICKY_SECONDS", "10"))
+    if not get_replicas() or seconds <= 0:
+        return
+    response.set_cookie(
+        STICKY_COOKIE,
+        f"{time.time() + seconds:.3f}",
+        max_age=math.ceil(seconds),
+        httponly=True,
+    )
+
+
+class BaseUnitOfWork:
+    """
+    The state of a request's transaction, shared by the units of work of the
+    flask and the ASGI app.
+    """
+
+    def __init__(self, pool: Any) -> None:
+        """
+        The constructor of the BaseUnitOfWork class.
+
+        Args:
+            pool: The pool to check the connection out of.
+        """
+        self.pool = pool
+        self.connection: Any = None
+        self.rollback_only = False
+        self.discard = False
+        self.wrote = False
+        self._callbacks: List[Callable[[], None]] = []
+
+    def on_commit(self, callback: Callable[[], None]) -> None:
+        """
+        Defers a callback until the transaction has been committed.
+
+        Args:
+            callback: The function to call after the commit, it is dropped
+                if the transaction is rolled back instead.
+        """
+        self._callbacks.append(callback)
+
+    def leave(self, failed: bool, discard: bool) -> None:
+        """
+        Notes how a block joined to the unit of work ended.
+
+        Args:
+            failed: Whether the block raised, so the transaction must be
+                rolled back.
+            discard: Whether the connection failed, so it must be closed.
+        """
+        self.rollback_only |= failed
+        self.discard |= discard
+
+    def _detach(self, success: bool) -> Tuple[Any, bool]:
+        """
+        Takes the connection off the unit of work to finish it.
+
+        Args:
+            success: Whether the request succeeded.
+
+        Returns:
+            The connection, if one was checked out, and whether to commit.
+        """
+        connection, self.connection = self.connection, None
+        return connection, success and not self.rollback_only and not self.discard
+
+    def _settle(self, commit: bool) -> bool:
+        """
+        Runs the deferred callbacks if the transaction was committed.
+
+        Args:
+            commit: Whether the transaction was committed.
+
+        Returns:
+            Whether writes were committed.
+        """
+        callbacks, self._callbacks = self._callbacks, []
+        if commit:
+            for callback in callbacks:
+                callback()
+        return commit and self.wrote
+
+
+class UnitOfWork(BaseUnitOfWork):
+    """
+    The connection and transaction shared by the Accessors of a request.
+
+    The connection is checked out by the first Accessor of the request and
+    held until the request finishes, when everything done with it is
+    committed at once, or rolled back if the request failed.
+    """
+
+    def get_connection(self) -> Any:
+        """
+        Gets the connection of the request, checking it out on first use.
+
+        Returns:
+            The connection shared by the request.
+        """
+        if self.connection is None:
+            self.connection = self.pool.acquire()
+        return self.connection
+
+    def finish(self, success: bool) -> bool:
+        """
+        Commits or rolls back the transaction and returns the connection.
+
+        Args:
+            success: Whether the request succeeded. The transaction is only
+                committed if it did and no Accessor block in it failed.
+
+        Returns:
+            Whether writes were committed.
+        """
+        connection, commit = self._detach(success)
+        if connection is not None:
+            try:
+                if commit:
+                    connection.commit()
+                elif not self.discard:
+                    connection.rollback()
+            except pymysql.err.Error:
+                self.discard = True
+                raise
+            finally:
+                self.pool.release(connection, discard=self.discard)
+        return self._settle(commit)
+
+
+def _unit_of_work() -> Optional[UnitOfWork]:
+    """
+    Gets the unit of work of the current request, starting it if needed.
+
+    Returns:
+        The unit of work or None when not handling a request.
+    """
+    if not has_request_context():
+        return None
+    unit = g.get("unit_of_work")
+    if unit is None:
+        unit = g.unit_of_work = UnitOfWork(get_pool())
+    return unit
+
+
+# The unit of work of the request an ASGI task is serving, which has the same
+# on_commit method as UnitOfWork, or None outside of one.
+TASK_UNIT_OF_WORK: ContextVar[Any] = ContextVar("task_unit_of_work", default=None)
+
+
+def on_commit(callback: Callable[[], None]) -> None:
+    """
+    Runs a callback once the changes made so far have been committed.
+
+    Within a request, of the flask or the ASGI app, the callback waits for
+    the request's transaction, otherwise the changes have already been
+    committed and it runs now.
+
+    Args:
+        callback: The function to call.
+    """
+    if has_request_context():
+        unit = g.get("unit_of_work")
+    else:
+        unit = TASK_UNIT_OF_WORK.get()
+    if unit is None:
+        callback()
+    else:
+        unit.on_commit(callback)
+
+
+def finish_request(success: bool) -> bool:
+    """
+    Ends the unit of work of the current request, if it started one.
+
+    Args:
+        success: Whether to commit the request's changes.
+
+    Returns:
+        Whether the request's writes were committed.
+    """
+    unit = g.pop("unit_of_work", None)
+    if unit is None:
+        return False
+    return unit.finish(success)
+
 
 class Accessor:
     """
     This class is designed to contain all the database access logic.
     """
 
-    def __init__(self) -> None:
+    def __init__(
+        self, cursor_class=pymysql.cursors.DictCursor, join=True, read_only=False
+    ) -> None:
         """
         The constructor of the Accessor class.
 
-        We create a database connection to be used.
+        Within a request the connection of the request's unit of work is
+        used, so every block in the request is one transaction. Otherwise
+        a database connection is checked out from the pool for this block.
+        Read only blocks use a connection of their own to a healthy replica
+        instead, if there is one and the request need not see its writes.
+        Nothing is checked out until the block is entered.
+
+        Args:
+            cursor_class: The type of cursor to hand out, an unbuffered
+                cursor such as SSDictCursor streams rows from the server.
+            join: Whether to join the request's unit of work. Reads that
+                should not hold the request's connection, or that outlive
+                the request like streams, pass False to use their own.
+            read_only: Whether the block only runs SELECTs, so it may be
+                sent to a replica.
         """
-        self.connection = pymysql.connect(
-            host=os.environ["DB_SERVER"],
-            user=os.environ["DB_USERNAME"],
-            password=os.environ["DB_PASSWORD"],
-            database=os.environ["DB_DATABASE"],
-            port=int(os.environ["DB_PORT"]),
-        )
+        self.cursor_class = cursor_class
+        self.join = join
+        self.read_only = read_only
+        self.replica: Optional[Replica] = None
+        self.unit: Optional[UnitOfWork] = None
+        self.connection: Any = None
         self.cursor = None
 
+    def _pool(self) -> ConnectionPool:
+        """
+        Gets the pool the connection of a block not joined to a unit of work
+        was checked out of.
+
+        Returns:
+            The pool of the replica, or of the primary.
+        """
+        if self.replica is not None:
+            return self.replica.get_pool()
+        return get_pool()
+
     def __enter__(self):
         """
         The enter of the Accessor class for a context manager.
 
-        This is designed to be used as a context manager and returns
-        the underlying cursor.
+        This is designed to be used as a context manager, it checks out the
+        connection and returns the underlying cursor, instrumented to record
+        its queries.
 
         Returns:
             A cursor to execute queries on.
         """
-        self.cursor = self.connection.cursor(pymysql.cursors.DictCursor)
-        return self.cursor
+        label = metrics.caller_label()
+        acquired = _acquire_replica() if self.read_only else None
+        if acquired is not None:
+            self.replica, self.connection = acquired
+        else:
+            self.unit = _unit_of_work() if self.join else None
+        if self.unit is not None:
+            self.unit.wrote |= not self.read_only
+            self.connection = self.unit.get_connection()
+        elif self.replica is None:
+            self.connection = get_pool().acquire()
+
+        try:
+            self.cursor = self.connection.cursor(self.cursor_class)
+        except BaseException:
+            self.__exit__(*sys.exc_info())
+            raise
+        return metrics.InstrumentedCursor(self.cursor, label)
 
     def __exit__(self, ex_type, ex_value, traceback) -> None:
         """
         The exit of the Accessor class for a context manager.
 
         This designed to be used as a context manager and handles
-        the cleanup of the cursor and database connection.
+        the cleanup of the cursor and returns the connection to the pool.
+        The block is committed as one transaction, or rolled back if it
+        raised. A connection that failed at the network level is dropped.
+        A block joined to a unit of work leaves all of that to the unit,
+        only marking it to be rolled back if the block raised.
 
         Args:
             ex_type: The exception type.
             ex_value: The exception value.
             traceback: The traceback for the exception.
         """
-        _, _, _ = ex_type, ex_value, traceback
-        self.connection.commit()
-        if self.cursor is not None:
-            self.cursor.close()
+        _ = traceback
+        discard = isinstance(
+            ex_value, (pymysql.err.OperationalError, pymysql.err.InterfaceError)
+        )
+        if self.unit is not None:
+            try:
+                if self.cursor is not None:
+                    self.cursor.close()
+            except pymysql.err.Error:
+                discard = True
+            self.unit.leave(ex_type is not None, discard)
+            return
 
-        self.connection.close()
+        try:
+            if discard:
+                pass
+            elif ex_type is None:
+                self.connection.commit()
+            else:
+                self.connection.rollback()
+        except pymysql.err.Error:
+            discard = True
+            raise
+        finally:
+            if self.cursor is not None:
+                try:
+                    self.cursor.close()
+                except pymysql.err.Error:
+                    discard = True
+            self._pool().release(self.connection, discard=discard)
+            if discard and self.replica is not None:
+                self.replica.mark_down()
@@ -2,9 +2,26 @@
 A module handle the logic with the items table.
 """
 
+from collections import defaultdict
 from datetime import datetime
-from typing import List, TypedDict
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    TypedDict,
+)
+
+from pymysql.cursors import Cursor, SSCursor
+from werkzeug.exceptions import BadRequest
 
+from coa_flask_app import cache, rollups, serialization
+from coa_flask_app.aio_accessor import AsyncAccessor
 from coa_flask_app.db_accessor import Accessor
 
 
@@ -20,18 +37,22 @@ EventItem = TypedDict(
     },
 )
 
+_GET_QUERY = """
+            SELECT
+                record_id,
+                event_id,
+                item_id,
+                quantity,
+                updated_by,
+                updated_tsp
+            FROM coa_data.event_items AS cdei
+            WHERE
+                cdei.event_id = %s AND
+                cdei.record_id > %s
+            ORDER BY cdei.record_id
+            """
 
-def get(event_id: int) -> List[EventItem]:
-    """
-    Gets a list of event items.
-
-    Args:
-        event_id: The ID of the event.
-
-    Returns:
-        A list of event items.
-    """
-    query = """
+_GET_MANY_QUERY = """
             SELECT
                 record_id,
                 event_id,
@@ -40,21 +61,180 @@ def get(event_id: int) -> List[EventItem]:
                 updated_by,
                 updated_tsp
             FROM coa_data.event_items AS cdei
-            WHERE cdei.event_id = %s
+            WHERE cdei.event_id IN %s
+            ORDER BY cdei.event_id, cdei.record_id
             """
-    with Accessor() as db_handle:
-        db_handle.execute(query, (event_id,))
-        return [
-            {
-                "record_id": record["record_id"],
-                "event_id": record["event_id"],
-                "item_id": record["item_id"],
-                "quantity": record["quantity"],
-                "updated_by": record["updated_by"],
-                "updated_tsp": record["updated_tsp"].strftime("%Y-%m-%d %H:%M"),
-            }
-            for record in db_handle.fetchall()
-        ]
+
+# The most IDs put in the IN list of one query, larger lists are split up.
+_CHUNK_SIZE = 1000
+
+_EVENT_ITEM_ROWS: serialization.RowMapper[EventItem] = serialization.RowMapper(
+    ("record_id", None),
+    ("event_id", None),
+    ("item_id", None),
+    ("quantity", None),
+    ("updated_by", None),
+    ("updated_tsp", serialization.minute),
+)
+
+_ADD_QUERY = """
+            INSERT INTO coa_data.event_items(
+                event_id,
+                item_id,
+                quantity,
+                updated_by
+            )
+            VALUES {rows}
+            """
+
+# The values of one event item in _ADD_QUERY, repeated for every one added.
+_ADD_ROW = "(%s, %s, %s, %s)"
+
+_UPDATE_QUERY = """
+            UPDATE coa_data.event_items
+            SET
+                event_id = %s,
+                item_id = %s,
+                quantity = %s,
+                updated_by = %s
+            WHERE record_id = %s
+            """
+
+_REMOVE_QUERY = """
+            DELETE FROM coa_data.event_items
+            WHERE record_id = %s
+            """
+
+_LOCK_QUERY = """
+            SELECT
+                record_id,
+                event_id,
+                item_id,
+                quantity
+            FROM coa_data.event_items
+            WHERE record_id IN %s
+            FOR UPDATE
+            """
+
+_ADJUST_TOTAL_QUERY = """
+            UPDATE coa_data.event
+            SET trash_items_cnt = trash_items_cnt + %s
+            WHERE event_id = %s
+            """
+
+# The fields each bulk operation needs, in the order its query takes them.
+_BULK_FIELDS = {
+    "add": ("event_id", "item_id", "quantity", "updated_by"),
+    "update": ("event_id", "item_id", "quantity", "updated_by", "record_id"),
+    "remove": ("record_id",),
+}
+
+# The fields holding IDs and quantities, stored and compared as integers.
+_INTEGER_FIELDS = frozenset(("record_id", "event_id", "item_id", "quantity"))
+
+# An event item change, its op and its query parameters.
+Change = Tuple[str, Tuple[Any, ...]]
+
+
+def get(event_id: int, after: int = 0, limit: Optional[int] = None) -> List[EventItem]:
+    """
+    Gets a list of event items.
+
+    Args:
+        event_id: The ID of the event.
+        after: Only event items with a greater record ID are returned.
+        limit: The maximum number of event items to return.
+
+    Returns:
+        A list of event items ordered by record ID.
+    """
+    query = _GET_QUERY
+    params: List[Any] = [event_id, after]
+    if limit is not None:
+        query += "LIMIT %s"
+        params.append(limit)
+
+    with Accessor(Cursor, read_only=True) as db_handle:
+        db_handle.execute(query, params)
+        return _EVENT_ITEM_ROWS.to_dicts(db_handle.fetchall())
+
+
+def stream(event_id: int, after: int = 0) -> Iterator[EventItem]:
+    """
+    Streams the event items from the database as they are read.
+
+    Only one row is held in memory at a time. The connection is held until
+    the iterator is exhausted or closed.
+
+    Args:
+        event_id: The ID of the event.
+        after: Only event items with a greater record ID are returned.
+
+    Returns:
+        An iterator of event items ordered by record ID.
+    """
+    with Accessor(SSCursor, join=False, read_only=True) as db_handle:
+        db_handle.execute(_GET_QUERY, (event_id, after))
+        for row in db_handle:
+            yield _EVENT_ITEM_ROWS.to_dict(row)
+
+
+def _chunks(
+    event_ids: Sequence[int],
+) -> Tuple[Dict[int, List[EventItem]], List[Tuple[int, ...]]]:
+    """
+    Splits up a list of event IDs for the IN lists of _GET_MANY_QUERY.
+
+    Args:
+        event_ids: The IDs of the events, duplicates are ignored.
+
+    Returns:
+        The empty lists of event items of every event, in the order asked
+        for, and the chunks of the IDs to query.
+    """
+    grouped: Dict[int, List[EventItem]] = {event_id: [] for event_id in event_ids}
+    unique = list(grouped)
+    return grouped, [
+        tuple(unique[start : start + _CHUNK_SIZE])
+        for start in range(0, len(unique), _CHUNK_SIZE)
+    ]
+
+
+def get_many(event_ids: Sequence[int]) -> Dict[int, List[EventItem]]:
+    """
+    Gets the event items of many events at once.
+
+    Args:
+        event_ids: The IDs of the events.
+
+    Returns:
+        The event items of every event ordered by record ID, keyed by the
+        event ID in the order asked for. Events without any have an empty
+        list.
+    """
+    grouped, chunks = _chunks(event_ids)
+    if not chunks:
+        return grouped
+    with Accessor(Cursor, read_only=True) as db_handle:
+        for chunk in chunks:
+            db_handle.execute(_GET_MANY_QUERY, (chunk,))
+            for event_item in _EVENT_ITEM_ROWS.to_dicts(db_handle.fetchall()):
+                grouped[event_item["event_id"]].append(event_item)
+    return grouped
+
+
+def attach(records: Sequence[Mapping[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Adds the event items of every event to it under event_items.
+
+    Args:
+        records: The events.
+
+    Returns:
+        A copy of every event with its event items.
+    """
+    grouped = get_many([record["event_id"] for record in records])
+    return [dict(record, event_items=grouped[record["event_id"]]) for record in records]
 
 
 def add(event_id: int, item_id: int, quantity: int, updated_by: str) -> None:
@@ -66,18 +246,26 @@ def add(event_id: int, item_id: int, quantity: int, updated_by: str) -> None:
         item_id: The ID of the item collected.
         quantity: The quantity of the item collected.
         updated_by: The user making the update.
+
+    Raises:
+        This can raise BadRequest errors if an ID or the quantity is not an
+        integer.
     """
-    query = """
-            INSERT INTO coa_data.event_items(
-                event_id,
-                item_id,
-                quantity,
-                updated_by
-            )
-            VALUES(%s, %s, %s, %s)
-            """
+    params = _params(
+        "add",
+        {
+            "event_id": event_id,
+            "item_id": item_id,
+            "quantity": quantity,
+            "updated_by": updated_by,
+        },
+        "The event item",
+    )
     with Accessor() as db_handle:
-        db_handle.execute(query, (event_id, item_id, quantity, updated_by))
+        _apply(db_handle, [("add", params)])
+    cache.invalidate("event_items")
+    cache.invalidate("event")
+    cache.invalidate("item_rollup")
 
 
 def update(
@@ -92,18 +280,27 @@ def update(
         item_id: The ID of the item collected.
         quantity: The quantity of the item collected.
         updated_by: The user making the update.
+
+    Raises:
+        This can raise BadRequest errors if an ID or the quantity is not an
+        integer.
     """
-    query = """
-            UPDATE coa_data.event_items
-            SET
-                event_id = %s,
-                item_id = %s,
-                quantity = %s,
-                updated_by = %s
-            WHERE record_id = %s
-            """
+    params = _params(
+        "update",
+        {
+            "record_id": record_id,
+            "event_id": event_id,
+            "item_id": item_id,
+            "quantity": quantity,
+            "updated_by": updated_by,
+        },
+        "The event item",
+    )
     with Accessor() as db_handle:
-        db_handle.execute(query, (event_id, item_id, quantity, updated_by, record_id))
+        _apply(db_handle, [("update", params)])
+    cache.invalidate("event_items")
+    cache.invalidate("event")
+    cache.invalidate("item_rollup")
 
 
 def remove(record_id: int) -> None:
@@ -112,10 +309,549 @@ def remove(record_id: int) -> None:
 
     Args:
         record_id: The ID of the event item.
+
+    Raises:
+        This can raise BadRequest errors if the ID is not an integer.
     """
-    query = """
-            DELETE FROM coa_data.event_items
-            WHERE record_id = %s
-            """
+    params = _params("remove", {"record_id": record_id}, "The event item")
+    with Accessor() as db_handle:
+        _apply(db_handle, [("remove", params)])
+    cache.invalidate("event_items")
+    cache.invalidate("event")
+    cache.invalidate("item_rollup")
+
+
+def _locked_record_ids(changes: List[Change]) -> Tuple[int, ...]:
+    """
+    Gets the records that have to be locked before applying changes.
+
+    Args:
+        changes: The changes, in the order to apply them.
+
+    Returns:
+        The IDs of the records being updated or removed.
+    """
+    return tuple(sorted({params[-1] for op, params in changes if op != "add"}))
+
+
+def _deltas(
+    changes: List[Change],
+    locked: List[Dict[str, Any]],
+) -> Tuple[rollups.Deltas, List[bool], Dict[int, Optional[Tuple[Any, ...]]]]:
+    """
+    Works out how event item changes move the quantities collected.
+
+    The changes are played over the records as actually stored rather than
+    as the client last read them, in the order given. A record removed and
+    then updated is only found by the remove, while a record updated and
+    then removed is found by both, and one removed twice only once.
+
+    Args:
+        changes: The changes, in the order to apply them.
+        locked: The locked records being updated or removed.
+
+    Returns:
+        The changes of the quantity and count of the event items, keyed by
+        the event ID and item ID, whether each change found its record, and
+        what is left to write of every record changed: the parameters of its
+        last update, or None if it is removed.
+    """
+    deltas: rollups.Deltas = defaultdict(lambda: [0, 0])
+    found: List[bool] = []
+    written: Dict[int, Optional[Tuple[Any, ...]]] = {}
+
+    def _move(record: Tuple[Any, ...], sign: int) -> None:
+        event_id, item_id, quantity = record[:3]
+        deltas[(event_id, item_id)][0] += sign * quantity
+        deltas[(event_id, item_id)][1] += sign
+
+    stored = {
+        record["record_id"]: (record["event_id"], record["item_id"], record["quantity"])
+        for record in locked
+    }
+    for op, params in changes:
+        if op == "add":
+            _move(params, 1)
+            found.append(True)
+            continue
+
+        record_id = params[-1]
+        found.append(record_id in stored)
+        if record_id not in stored:
+            continue
+        _move(stored.pop(record_id), -1)
+        written[record_id] = None
+        if op == "update":
+            _move(params, 1)
+            stored[record_id] = params[:3]
+            written[record_id] = params
+    return {key: delta for key, delta in deltas.items() if any(delta)}, found, written
+
+
+def _insert(adds: List[Tuple[Any, ...]]) -> Tuple[str, List[Any]]:
+    """
+    Builds the single statement inserting event items.
+
+    Args:
+        adds: The query parameters of the event items to add.
+
+    Returns:
+        The query and its parameters.
+    """
+    query = _ADD_QUERY.format(rows=", ".join([_ADD_ROW] * len(adds)))
+    return query, [value for params in adds for value in params]
+
+
+def _statements(
+    deltas: rollups.Deltas,
+    written: Dict[int, Optional[Tuple[Any, ...]]],
+) -> List[Tuple[str, List[Tuple[Any, ...]]]]:
+    """
+    Plans the statements applying the updates, removes and event totals of
+    event item changes.
+
+    Every record changed is written once, with its last update or removed.
+    The event rows are adjusted in ID order to keep concurrent batches from
+    deadlocking on each other.
+
+    Args:
+        deltas: The changes of the quantities, as worked out by _deltas.
+        written: What is left to write of every record changed.
+
+    Returns:
+        The queries to run with executemany and their parameters.
+    """
+    totals: Dict[int, int] = defaultdict(int)
+    for (event_id, _), (quantity, _) in deltas.items():
+        totals[event_id] += quantity
+
+    records = sorted(written.items())
+    statements = [
+        (_UPDATE_QUERY, [params for _, params in records if params is not None]),
+        (
+            _REMOVE_QUERY,
+            [(record_id,) for record_id, params in records if params is None],
+        ),
+        (
+            _ADJUST_TOTAL_QUERY,
+            [(delta, event_id) for event_id, delta in sorted(totals.items()) if delta],
+        ),
+    ]
+    return [(query, params) for query, params in statements if params]
+
+
+def _outcomes(
+    changes: List[Change], found: List[bool], first_id: Optional[int]
+) -> List[Any]:
+    """
+    Gets the outcome of every change once it was applied.
+
+    The adds are inserted by one statement, which InnoDB gives consecutive
+    IDs starting from the lastrowid it reports, as long as
+    auto_increment_increment is left at 1.
+
+    Args:
+        changes: The changes, in the order they were applied.
+        found: Whether each change found its record.
+        first_id: The ID of the first event item added, if any were.
+
+    Returns:
+        The record ID of every add, and whether every update and remove found
+        its record, in the order of the changes.
+    """
+    added = iter(range(first_id or 0, (first_id or 0) + len(changes)))
+    return [next(added) if op == "add" else hit for (op, _), hit in zip(changes, found)]
+
+
+def _apply(db_handle, changes: List[Change]) -> List[Any]:
+    """
+    Applies event item changes and keeps the event totals and the rollups
+    in step.
+
+    The records being updated or removed are locked first, so the totals
+    are adjusted by what is actually stored. The adds are inserted by one
+    statement, and the updates and removes sent with one executemany each.
+
+    Args:
+        db_handle: The cursor of the transaction to apply the changes in.
+        changes: The changes, in the order to apply them.
+
+    Returns:
+        The outcome of every change, as _outcomes gives.
+    """
+    record_ids = _locked_record_ids(changes)
+    locked = []
+    if record_ids:
+        db_handle.execute(_LOCK_QUERY, (record_ids,))
+        locked = db_handle.fetchall()
+    deltas, found, written = _deltas(changes, locked)
+    adds = [params for op, params in changes if op == "add"]
+    first_id = None
+    if adds:
+        db_handle.execute(*_insert(adds))
+        first_id = db_handle.lastrowid
+    for query, params in _statements(deltas, written):
+        db_handle.executemany(query, params)
+    rollups.apply(db_handle, deltas)
+    return _outcomes(changes, found, first_id)
+
+
+def _integer(value: Any) -> Optional[int]:
+    """
+    Converts a JSON value holding an integer, or its text, to an integer.
+
+    Args:
+        value: The value.
+
+    Returns:
+        The integer, or None if the value is not one. Booleans and floats
+        are not taken as integers.
+    """
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        try:
+            return int(value)
+        except ValueError:
+            return None
+    return None
+
+
+def _params(op: str, fields: Mapping[str, Any], label: str) -> Tuple[Any, ...]:
+    """
+    Gets the query parameters of an event item change.
+
+    The IDs and the quantity are converted to integers, so those sent as
+    strings are stored and matched like any others.
+
+    Args:
+        op: The kind of change, "add", "update" or "remove".
+        fields: The fields of the change.
+        label: What to call the change in errors.
+
+    Returns:
+        The parameters in the order the query of the change takes them.
+
+    Raises:
+        This can raise BadRequest errors if a field is missing, or an ID or
+        the quantity is not an integer.
+    """
+    missing = [field for field in _BULK_FIELDS[op] if field not in fields]
+    if missing:
+        raise BadRequest(f"{label} is missing {', '.join(missing)}.")
+
+    params = []
+    for field in _BULK_FIELDS[op]:
+        value = fields[field]
+        if field in _INTEGER_FIELDS:
+            value = _integer(value)
+            if value is None:
+                raise BadRequest(f"{label} has a {field} that is not an integer.")
+        params.append(value)
+    return tuple(params)
+
+
+def _batch(
+    operations: List[Dict[str, Any]]
+) -> Tuple[List[Change], List[Dict[str, Any]]]:
+    """
+    Validates a batch of event item changes.
+
+    Args:
+        operations: The changes to make, as given to bulk.
+
+    Returns:
+        The changes and the result of each operation, in the order they were
+        given.
+
+    Raises:
+        This can raise BadRequest errors if an operation is malformed.
+    """
+    changes: List[Change] = []
+    results = []
+    for index, operation in enumerate(operations):
+        op = operation.get("op") if isinstance(operation, dict) else None
+        if op not in _BULK_FIELDS:
+            raise BadRequest(f"Operation {index} has an unknown op {op!r}.")
+        params = _params(op, operation, f"Operation {index}")
+
+        changes.append((op, params))
+        result = {"index": index, "op": op}
+        if op != "add":
+            result["record_id"] = params[-1]
+        results.append(result)
+    return changes, results
+
+
+def _report(results: List[Dict[str, Any]], outcomes: List[Any]) -> List[Dict[str, Any]]:
+    """
+    Fills in the result of each operation of a batch once it was applied.
+
+    Args:
+        results: The results of the operations, as given by _batch.
+        outcomes: The outcome of the changes, as given by _apply.
+
+    Returns:
+        The same results, each with a status of "applied", or "not_found" for
+        an update or remove of a record that does not exist. The results of
+        adds get the ID of the new record.
+    """
+    for result, outcome in zip(results, outcomes):
+        if result["op"] == "add":
+            result["record_id"] = outcome
+            result["status"] = "applied"
+        else:
+            result["status"] = "applied" if outcome else "not_found"
+    return results
+
+
+def bulk(operations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Applies a batch of event item changes in a single transaction.
+
+    The changes take effect in the order given, so an update of a record
+    removed earlier in the batch finds nothing. They are still sent in
+    bulk: the adds with one INSERT, and the last state of every record
+    updated or removed with one executemany per kind. Either every change
+    is committed or, if any of them fails, none are. Updates and removes of
+    records that do not exist are skipped.
+
+    Args:
+        operations: The changes to make. Each one has an "op" of "add",
+            "update" or "remove" along with the fields that change takes.
+
+    Returns:
+        The result of each operation, in the order they were given, with
+        its status and record ID.
+
+    Raises:
+        This can raise BadRequest errors if an operation is malformed.
+    """
+    changes, results = _batch(operations)
+    if not results:
+        return results
+
     with Accessor() as db_handle:
-        db_handle.execute(query, (record_id,))
+        outcomes = _apply(db_handle, changes)
+    cache.invalidate("event_items")
+    cache.invalidate("event")
+    cache.invalidate("item_rollup")
+    return _report(results, outcomes)
+
+
+async def _apply_async(db_handle, changes: List[Change]) -> List[Any]:
+    """
+    Applies event item changes on an async cursor, like _apply.
+
+    Args:
+        db_handle: The async cursor of the transaction to apply the changes in.
+        changes: The changes, in the order to apply them.
+
+    Returns:
+        The outcome of every change, as _apply gives.
+    """
+    record_ids = _locked_record_ids(changes)
+    locked = []
+    if record_ids:
+        await db_handle.execute(_LOCK_QUERY, (record_ids,))
+        locked = await db_handle.fetchall()
+    deltas, found, written = _deltas(changes, locked)
+    adds = [params for op, params in changes if op == "add"]
+    first_id = None
+    if adds:
+        await db_handle.execute(*_insert(adds))
+        first_id = db_handle.lastrowid
+    for query, params in _statements(deltas, written):
+        await db_handle.executemany(query, params)
+    await rollups.apply_async(db_handle, deltas)
+    return _outcomes(changes, found, first_id)
+
+
+async def get_async(
+    event_id: int, after: int = 0, limit: Optional[int] = None
+) -> List[EventItem]:
+    """
+    Gets a list of event items on the async connection pool.
+
+    Args:
+        event_id: The ID of the event.
+        after: Only event items with a greater record ID are returned.
+        limit: The maximum number of event items to return.
+
+    Returns:
+        A list of event items ordered by record ID.
+    """
+    query = _GET_QUERY
+    params: List[Any] = [event_id, after]
+    if limit is not None:
+        query += "LIMIT %s"
+        params.append(limit)
+
+    async with AsyncAccessor(Cursor, read_only=True) as db_handle:
+        await db_handle.execute(query, params)
+        return _EVENT_ITEM_ROWS.to_dicts(await db_handle.fetchall())
+
+
+async def get_many_async(event_ids: Sequence[int]) -> Dict[int, List[EventItem]]:
+    """
+    Gets the event items of many events at once on the async connection pool.
+
+    Args:
+        event_ids: The IDs of the events.
+
+    Returns:
+        The event items of every event ordered by record ID, keyed by the
+        event ID in the order asked for. Events without any have an empty
+        list.
+    """
+    grouped, chunks = _chunks(event_ids)
+    if not chunks:
+        return grouped
+    async with AsyncAccessor(Cursor, read_only=True) as db_handle:
+        for chunk in chunks:
+            await db_handle.execute(_GET_MANY_QUERY, (chunk,))
+            for event_item in _EVENT_ITEM_ROWS.to_dicts(await db_handle.fetchall()):
+                grouped[event_item["event_id"]].append(event_item)
+    return grouped
+
+
+async def attach_async(records: Sequence[Mapping[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Adds the event items of every event to it on the async connection pool.
+
+    Args:
+        records: The events.
+
+    Returns:
+        A copy of every event with its event items.
+    """
+    grouped = await get_many_async([record["event_id"] for record in records])
+    return [dict(record, event_items=grouped[record["event_id"]]) for record in records]
+
+
+async def stream_async(event_id: int, after: int = 0) -> AsyncIterator[EventItem]:
+    """
+    Streams the event items on the async connection pool as they are read.
+
+    Args:
+        event_id: The ID of the event.
+        after: Only event items with a greater record ID are returned.
+
+    Returns:
+        An asynchronous iterator of event items ordered by record ID.
+    """
+    async with AsyncAccessor(SSCursor, join=False, read_only=True) as db_handle:
+        await db_handle.execute(_GET_QUERY, (event_id, after))
+        async for row in db_handle:
+            yield _EVENT_ITEM_ROWS.to_dict(row)
+
+
+async def add_async(
+    event_id: int, item_id: int, quantity: int, updated_by: str
+) -> None:
+    """
+    Adds an event item on the async connection pool.
+
+    Args:
+        event_id: The ID of the event.
+        item_id: The ID of the item collected.
+        quantity: The quantity of the item collected.
+        updated_by: The user making the update.
+
+    Raises:
+        This can raise BadRequest errors if an ID or the quantity is not an
+        integer.
+    """
+    params = _params(
+        "add",
+        {
+            "event_id": event_id,
+            "item_id": item_id,
+            "quantity": quantity,
+            "updated_by": updated_by,
+        },
+        "The event item",
+    )
+    async with AsyncAccessor() as db_handle:
+        await _apply_async(db_handle, [("add", params)])
+    cache.invalidate("event_items")
+    cache.invalidate("event")
+    cache.invalidate("item_rollup")
+
+
+async def update_async(
+    record_id: int, event_id: int, item_id: int, quantity: int, updated_by: str
+) -> None:
+    """
+    Updates an event item on the async connection pool.
+
+    Args:
+        record_id: The ID of the event item.
+        event_id: The ID of the event.
+        item_id: The ID of the item collected.
+        quantity: The quantity of the item collected.
+        updated_by: The user making the update.
+
+    Raises:
+        This can raise BadRequest errors if an ID or the quantity is not an
+        integer.
+    """
+    params = _params(
+        "update",
+        {
+            "record_id": record_id,
+            "event_id": event_id,
+            "item_id": item_id,
+            "quantity": quantity,
+            "updated_by": updated_by,
+        },
+        "The event item",
+    )
+    async with AsyncAccessor() as db_handle:
+        await _apply_async(db_handle, [("update", params)])
+    cache.invalidate("event_items")
+    cache.invalidate("event")
+    cache.invalidate("item_rollup")
+
+
+async def remove_async(record_id: int) -> None:
+    """
+    Removes an event item on the async connection pool.
+
+    Args:
+        record_id: The ID of the event item.
+
+    Raises:
+        This can raise BadRequest errors if the ID is not an integer.
+    """
+    params = _params("remove", {"record_id": record_id}, "The event item")
+    async with AsyncAccessor() as db_handle:
+        await _apply_async(db_handle, [("remove", params)])
+    cache.invalidate("event_items")
+    cache.invalidate("event")
+    cache.invalidate("item_rollup")
+
+
+async def bulk_async(operations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Applies a batch of event item changes on the async connection pool.
+
+    Args:
+        operations: The changes to make, as given to bulk.
+
+    Returns:
+        The result of each operation, in the order they were given.
+
+    Raises:
+        This can raise BadRequest errors if an operation is malformed.
+    """
+    changes, results = _batch(operations)
+    if not results:
+        return results
+
+    async with AsyncAccessor() as db_handle:
+        outcomes = await _apply_async(db_handle, changes)
+    cache.invalidate("event_items")
+    cache.invalidate("event")
+    cache.invalidate("item_rollup")
+    return _report(results, outcomes)
@@ -2,9 +2,13 @@
 A module handle the logic with the event table.
 """
 
-from datetime import datetime
-from typing import List, Optional, TypedDict
+from datetime import date, datetime
+from typing import Any, AsyncIterator, Iterator, List, Optional, Tuple, TypedDict
 
+from pymysql.cursors import Cursor, SSCursor
+
+from coa_flask_app import cache, rollups, serialization
+from coa_flask_app.aio_accessor import AsyncAccessor
 from coa_flask_app.db_accessor import Accessor
 
 
@@ -13,6 +17,7 @@ Event = TypedDict(
     {
         "event_id": int,
         "site_id": int,
+        "volunteer_date": date,
         "volunteer_cnt": Optional[int],
         "trash_items_cnt": int,
         "trashbag_cnt": Optional[float],
@@ -24,47 +29,198 @@ Event = TypedDict(
 )
 
 
-def get(volunteer_year: int, volunteer_season: str) -> List[Event]:
-    """
-    Gets a list of events.
-
-    Returns:
-        A list of events.
-    """
-    query = """
+_GET_QUERY = """
             SELECT
                 cde.event_id,
                 cde.site_id,
+                cde.volunteer_date,
                 cde.volunteer_cnt,
-                IFNULL(SUM(cei.quantity), 0) AS trash_items_cnt,
+                cde.trash_items_cnt,
                 cde.trashbag_cnt,
                 cde.trash_weight,
                 cde.walking_distance,
                 cde.updated_by,
                 cde.updated_tsp
             FROM coa_data.event AS cde
-            LEFT JOIN coa_data.event_items AS cei ON cei.event_id = cde.event_id
             WHERE
-                cde.volunteer_year = %s AND
-                cde.volunteer_season = %s
-            GROUP BY cde.event_id
+                cde.volunteer_date >= %s AND
+                cde.volunteer_date < %s AND
+                cde.event_id > %s
+            ORDER BY cde.event_id
             """
-    with Accessor() as db_handle:
-        db_handle.execute(query, (volunteer_year, volunteer_season))
-        return [
-            {
-                "event_id": record["event_id"],
-                "site_id": record["site_id"],
-                "volunteer_cnt": record["volunteer_cnt"],
-                "trash_items_cnt": int(record["trash_items_cnt"]),
-                "trashbag_cnt": record["trashbag_cnt"],
-                "trash_weight": record["trash_weight"],
-                "walking_distance": record["walking_distance"],
-                "updated_by": record["updated_by"],
-                "updated_tsp": record["updated_tsp"].strftime("%Y-%m-%d %H:%M"),
-            }
-            for record in db_handle.fetchall()
-        ]
+
+_EVENT_ROWS: serialization.RowMapper[Event] = serialization.RowMapper(
+    ("event_id", None),
+    ("site_id", None),
+    ("volunteer_date", serialization.day),
+    ("volunteer_cnt", None),
+    ("trash_items_cnt", int),
+    ("trashbag_cnt", None),
+    ("trash_weight", None),
+    ("walking_distance", None),
+    ("updated_by", None),
+    ("updated_tsp", serialization.minute),
+)
+
+_ADD_QUERY = """
+            INSERT INTO coa_data.event(
+                updated_by,
+                site_id,
+                volunteer_date,
+                volunteer_cnt,
+                trashbag_cnt,
+                trash_weight,
+                walking_distance
+            )
+            VALUES(%s, %s, %s, %s, %s, %s, %s)
+            """
+
+_UPDATE_QUERY = """
+            UPDATE coa_data.event
+            SET
+                updated_by = %s,
+                site_id = %s,
+                volunteer_date = %s,
+                volunteer_cnt = %s,
+                trashbag_cnt = %s,
+                trash_weight = %s,
+                walking_distance = %s
+            WHERE event_id = %s
+            """
+
+_REMOVE_QUERY = """
+            DELETE FROM coa_data.event
+            WHERE event_id = %s
+            """
+
+_RECONCILE_QUERY = """
+            UPDATE coa_data.event AS cde
+            LEFT JOIN (
+                SELECT
+                    event_id,
+                    SUM(quantity) AS quantity
+                FROM coa_data.event_items
+                GROUP BY event_id
+            ) AS cei ON cei.event_id = cde.event_id
+            SET cde.trash_items_cnt = IFNULL(cei.quantity, 0)
+            WHERE cde.trash_items_cnt <> IFNULL(cei.quantity, 0)
+            """
+
+
+# The seasons events are held in.
+SEASONS = ("Spring", "Fall")
+
+
+def volunteer_date(volunteer_year: int, volunteer_season: str) -> date:
+    """
+    Gets the date an event of a season is stored under.
+
+    Args:
+        volunteer_year: The year of the event.
+        volunteer_season: The season of the event.
+
+    Returns:
+        The first of April for the spring and of October otherwise.
+    """
+    return date(volunteer_year, 4 if volunteer_season == "Spring" else 10, 1)
+
+
+def season_range(volunteer_year: int, volunteer_season: str) -> Tuple[date, date]:
+    """
+    Gets the half open range of dates a season covers.
+
+    The spring covers the first half of the year and the fall the second,
+    which holds the dates given by volunteer_date. Filtering on this range
+    lets the volunteer_date index be used.
+
+    Args:
+        volunteer_year: The year of the season.
+        volunteer_season: The season.
+
+    Returns:
+        The first date of the season and the first date after it.
+
+    Raises:
+        ValueError: If the season is not one of SEASONS.
+    """
+    if volunteer_season not in SEASONS:
+        raise ValueError(f"The season must be one of {', '.join(SEASONS)}.")
+    if volunteer_season == "Spring":
+        return date(volunteer_year, 1, 1), date(volunteer_year, 7, 1)
+    return date(volunteer_year, 7, 1), date(volunteer_year + 1, 1, 1)
+
+
+def get(
+    volunteer_year: int,
+    volunteer_season: str,
+    after: int = 0,
+    limit: Optional[int] = None,
+) -> List[Event]:
+    """
+    Gets a list of events.
+
+    Args:
+        volunteer_year: The year of the events.
+        volunteer_season: The season of the events.
+        after: Only events with a greater ID are returned.
+        limit: The maximum number of events to return.
+
+    Returns:
+        A list of events ordered by ID.
+    """
+    start_date, end_date = season_range(volunteer_year, volunteer_season)
+    return get_range(start_date, end_date, after, limit)
+
+
+def get_range(
+    start_date: date,
+    end_date: date,
+    after: int = 0,
+    limit: Optional[int] = None,
+) -> List[Event]:
+    """
+    Gets a list of the events held within a range of dates.
+
+    Args:
+        start_date: The first date of the range.
+        end_date: The first date after the range.
+        after: Only events with a greater ID are returned.
+        limit: The maximum number of events to return.
+
+    Returns:
+        A list of events ordered by ID.
+    """
+    query = _GET_QUERY
+    params: List[Any] = [start_date, end_date, after]
+    if limit is not None:
+        query += "LIMIT %s"
+        params.append(limit)
+
+    with Accessor(Cursor, read_only=True) as db_handle:
+        db_handle.execute(query, params)
+        return _EVENT_ROWS.to_dicts(db_handle.fetchall())
+
+
+def stream(start_date: date, end_date: date, after: int = 0) -> Iterator[Event]:
+    """
+    Streams the events held within a range of dates as they are read.
+
+    Only one row is held in memory at a time, so this should be used for
+    large listings. The connection is held until the iterator is exhausted
+    or closed.
+
+    Args:
+        start_date: The first date of the range.
+        end_date: The first date after the range.
+        after: Only events with a greater ID are returned.
+
+    Returns:
+        An iterator of events ordered by ID.
+    """
+    with Accessor(SSCursor, join=False, read_only=True) as db_handle:
+        db_handle.execute(_GET_QUERY, (start_date, end_date, after))
+        for row in db_handle:
+            yield _EVENT_ROWS.to_dict(row)
 
 
 def add(
@@ -90,33 +246,20 @@ def add(
         trash_weight: The weight of the trashbags.
         walking_distance: The total distance walked of the volunteers.
     """
-    mon = 4 if volunteer_season == "Spring" else 10
-    volunteer_date = datetime.strptime(f"{volunteer_year}-{mon}", "%Y-%m").date()
-    query = """
-            INSERT INTO coa_data.event(
-                updated_by,
-                site_id,
-                volunteer_date,
-                volunteer_cnt,
-                trashbag_cnt,
-                trash_weight,
-                walking_distance
-            )
-            VALUES(%s, %s, %s, %s, %s, %s, %s)
-            """
     with Accessor() as db_handle:
         db_handle.execute(
-            query,
+            _ADD_QUERY,
             (
                 updated_by,
                 site_id,
-                volunteer_date,
+                volunteer_date(volunteer_year, volunteer_season),
                 volunteer_cnt,
                 trashbag_cnt,
                 trash_weight,
                 walking_distance,
             ),
         )
+    cache.invalidate("event")
 
 
 def update(
@@ -144,27 +287,14 @@ def update(
         trash_weight: The weight of the trashbags.
         walking_distance: The total distance walked of the volunteers.
     """
-    mon = 4 if volunteer_season == "Spring" else 10
-    volunteer_date = datetime.strptime(f"{volunteer_year}-{mon}", "%Y-%m").date()
-    query = """
-            UPDATE coa_data.event
-            SET
-                updated_by = %s,
-                site_id = %s,
-                volunteer_date = %s,
-                volunteer_cnt = %s,
-                trashbag_cnt = %s,
-                trash_weight = %s,
-                walking_distance = %s
-            WHERE event_id = %s
-            """
     with Accessor() as db_handle:
+        rollups.withdraw(db_handle, "event", event_id)
         db_handle.execute(
-            query,
+            _UPDATE_QUERY,
             (
                 updated_by,
                 site_id,
-                volunteer_date,
+                volunteer_date(volunteer_year, volunteer_season),
                 volunteer_cnt,
                 trashbag_cnt,
                 trash_weight,
@@ -172,6 +302,9 @@ def update(
                 event_id,
             ),
         )
+        rollups.restore(db_handle, "event", event_id)
+    cache.invalidate("event")
+    cache.invalidate("item_rollup")
 
 
 def remove(event_id: int) -> None:
@@ -181,9 +314,171 @@ def remove(event_id: int) -> None:
     Args:
         event_id: The ID of the event.
     """
-    query = """
-            DELETE FROM coa_data.event
-            WHERE event_id = %s
-            """
     with Accessor() as db_handle:
-        db_handle.execute(query, (event_id,))
+        rollups.withdraw(db_handle, "event", event_id)
+        db_handle.execute(_REMOVE_QUERY, (event_id,))
+    cache.invalidate("event")
+    cache.invalidate("item_rollup")
+
+
+def reconcile_trash_items_cnt() -> int:
+    """
+    Repairs the trash item totals of the events that drifted from their items.
+
+    The totals are kept up to date by the event item writes, this recounts
+    them from the event items for the case they were edited some other way.
+
+    Returns:
+        The number of events whose total was repaired.
+    """
+    with Accessor() as db_handle:
+        repaired = db_handle.execute(_RECONCILE_QUERY)
+    cache.invalidate("event")
+    return repaired
+
+
+async def get_range_async(
+    start_date: date,
+    end_date: date,
+    after: int = 0,
+    limit: Optional[int] = None,
+) -> List[Event]:
+    """
+    Gets the events held within a range of dates on the async pool.
+
+    Args:
+        start_date: The first date of the range.
+        end_date: The first date after the range.
+        after: Only events with a greater ID are returned.
+        limit: The maximum number of events to return.
+
+    Returns:
+        A list of events ordered by ID.
+    """
+    query = _GET_QUERY
+    params: List[Any] = [start_date, end_date, after]
+    if limit is not None:
+        query += "LIMIT %s"
+        params.append(limit)
+
+    async with AsyncAccessor(Cursor, read_only=True) as db_handle:
+        await db_handle.execute(query, params)
+        return _EVENT_ROWS.to_dicts(await db_handle.fetchall())
+
+
+async def stream_async(
+    start_date: date, end_date: date, after: int = 0
+) -> AsyncIterator[Event]:
+    """
+    Streams the events held within a range of dates on the async pool.
+
+    Args:
+        start_date: The first date of the range.
+        end_date: The first date after the range.
+        after: Only events with a greater ID are returned.
+
+    Returns:
+        An asynchronous iterator of events ordered by ID.
+    """
+    async with AsyncAccessor(SSCursor, join=False, read_only=True) as db_handle:
+        await db_handle.execute(_GET_QUERY, (start_date, end_date, after))
+        async for row in db_handle:
+            yield _EVENT_ROWS.to_dict(row)
+
+
+async def add_async(
+    updated_by: str,
+    site_id: int,
+    volunteer_year: int,
+    volunteer_season: str,
+    volunteer_cnt: Optional[int],
+    trashbag_cnt: Optional[float],
+    trash_weight: Optional[float],
+    walking_distance: Optional[float],
+) -> None:
+    """
+    Adds an event on the async connection pool.
+
+    Args:
+        updated_by: The user adding the item.
+        site_id: The ID of the site where the event took place.
+        volunteer_year: The year of event.
+        volunteer_season: The season of the event.
+        volunteer_cnt: The count of volunteers at the event.
+        trashbag_cnt: The count of trashbags collected.
+        trash_weight: The weight of the trashbags.
+        walking_distance: The total distance walked of the volunteers.
+    """
+    async with AsyncAccessor() as db_handle:
+        await db_handle.execute(
+            _ADD_QUERY,
+            (
+                updated_by,
+                site_id,
+                volunteer_date(volunteer_year, volunteer_season),
+                volunteer_cnt,
+                trashbag_cnt,
+                trash_weight,
+                walking_distance,
+            ),
+        )
+    cache.invalidate("event")
+
+
+async def update_async(
+    event_id: int,
+    updated_by: str,
+    site_id: int,
+    volunteer_year: int,
+    volunteer_season: str,
+    volunteer_cnt: Optional[int],
+    trashbag_cnt: Optional[float],
+    trash_weight: Optional[float],
+    walking_distance: Optional[float],
+) -> None:
+    """
+    Updates an event on the async connection pool.
+
+    Args:
+        event_id: The ID of the event.
+        updated_by: The user adding the item.
+        site_id: The ID of the site where the event took place.
+        volunteer_year: The year of event.
+        volunteer_season: The season of the event.
+        volunteer_cnt: The count of volunteers at the event.
+        trashbag_cnt: The count of trashbags collected.
+        trash_weight: The weight of the trashbags.
+        walking_distance: The total distance walked of the volunteers.
+    """
+    async with AsyncAccessor() as db_handle:
+        await rollups.withdraw_async(db_handle, "event", event_id)
+        await db_handle.execute(
+            _UPDATE_QUERY,
+            (
+                updated_by,
+                site_id,
+                volunteer_date(volunteer_year, volunteer_season),
+                volunteer_cnt,
+                trashbag_cnt,
+                trash_weight,
+                walking_distance,
+                event_id,
+            ),
+        )
+        await rollups.restore_async(db_handle, "event", event_id)
+    cache.invalidate("event")
+    cache.invalidate("item_rollup")
+
+
+async def remove_async(event_id: int) -> None:
+    """
+    Removes an event on the async connection pool.
+
+    Args:
+        event_id: The ID of the event.
+    """
+    async with AsyncAccessor() as db_handle:
+        await rollups.withdraw_async(db_handle, "event", event_id)
+        await db_handle.execute(_REMOVE_QUERY, (event_id,))
+    cache.invalidate("event")
+    cache.invalidate("item_rollup")
@@ -0,0 +1,121 @@
+"""
+The module designed to contain the generation counters shared by all workers.
+
+Every table has a counter in a small memory mapped file that is bumped each
+time the table is written to. Since every uwsgi worker maps the same file, a
+worker can tell that its cached copy of a table is stale by comparing the
+counter it cached with against the current one, without any round trip.
+
+The file also starts with a random epoch that is chosen when the file is
+created, so counters that restart from zero never repeat an earlier version.
+"""
+
+import fcntl
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from typing import Dict, Optional, Tuple
+
+TABLES = ("item", "site", "event", "event_items", "item_rollup")
+
+_SLOT = struct.Struct("=Q")
+_SIZE = _SLOT.size * (len(TABLES) + 1)
+_OFFSETS = {table: _SLOT.size * (index + 1) for index, table in enumerate(TABLES)}
+
+# The memory map of the generation file and its descriptor, kept for locking.
+_FILE: Optional[Tuple[mmap.mmap, int]] = None
+_LOCK = threading.Lock()
+
+
+def _path() -> str:
+    """
+    Gets the path of the file holding the counters.
+
+    Returns:
+        The path of the generation file.
+    """
+    return os.environ.get(
+        "COA_GENERATION_FILE", os.path.join(tempfile.gettempdir(), "coa_generations")
+    )
+
+
+def _get_file() -> Tuple[mmap.mmap, int]:
+    """
+    Gets the shared memory map of the counters, creating the file if needed.
+
+    Returns:
+        The memory map of the generation file and its file descriptor.
+    """
+    global _FILE  # pylint: disable=global-statement
+    if _FILE is not None:
+        return _FILE
+
+    with _LOCK:
+        if _FILE is None:
+            fd = os.open(_path(), os.O_RDWR | os.O_CREAT, 0o600)
+            fcntl.lockf(fd, fcntl.LOCK_EX)
+            try:
+                if os.fstat(fd).st_size < _SIZE:
+                    os.ftruncate(fd, _SIZE)
+                    os.pwrite(fd, os.urandom(_SLOT.size), 0)
+            finally:
+                fcntl.lockf(fd, fcntl.LOCK_UN)
+            _FILE = (mmap.mmap(fd, _SIZE), fd)
+        return _FILE
+
+
+def epoch() -> int:
+    """
+    Gets the random epoch of the generation file.
+
+    Returns:
+        The epoch of the counters.
+    """
+    return _SLOT.unpack_from(_get_file()[0], 0)[0]
+
+
+def current(table: str) -> int:
+    """
+    Gets the current generation of a table.
+
+    Args:
+        table: The name of the table.
+
+    Returns:
+        The number of writes made to the table.
+    """
+    return _SLOT.unpack_from(_get_file()[0], _OFFSETS[table])[0]
+
+
+def bump(table: str) -> int:
+    """
+    Records that a table has been written to.
+
+    Args:
+        table: The name of the table.
+
+    Returns:
+        The new generation of the table.
+    """
+    mapping, fd = _get_file()
+    offset = _OFFSETS[table]
+    with _LOCK:
+        fcntl.lockf(fd, fcntl.LOCK_EX)
+        try:
+            generation = _SLOT.unpack_from(mapping, offset)[0] + 1
+            _SLOT.pack_into(mapping, offset, generation)
+        finally:
+            fcntl.lockf(fd, fcntl.LOCK_UN)
+    return generation
+
+
+def snapshot() -> Dict[str, int]:
+    """
+    Gets the current generation of every table.
+
+    Returns:
+        A dictionary of the table names to their generations.
+    """
+    return {table: current(table) for table in TABLES}
@@ -4,6 +4,10 @@ A module handle the logic with the item table.
 
 from typing import List, TypedDict
 
+from pymysql.cursors import Cursor
+
+from coa_flask_app import cache, rollups, serialization
+from coa_flask_app.aio_accessor import AsyncAccessor
 from coa_flask_app.db_accessor import Accessor
 
 
@@ -17,15 +21,14 @@ Item = TypedDict(
     },
 )
 
+_ITEM_ROWS: serialization.RowMapper[Item] = serialization.RowMapper(
+    ("item_id", None),
+    ("material", None),
+    ("category", None),
+    ("item_name", None),
+)
 
-def get() -> List[Item]:
-    """
-    Gets a list of items.
-
-    Returns:
-        A list of items.
-    """
-    query = """
+_GET_QUERY = """
             SELECT
                 item_id,
                 material,
@@ -33,9 +36,42 @@ def get() -> List[Item]:
                 item_name
             FROM coa_data.item
             """
-    with Accessor() as db_handle:
-        db_handle.execute(query)
-        return db_handle.fetchall()
+
+_ADD_QUERY = """
+            INSERT INTO coa_data.item(
+                material,
+                category,
+                item_name
+            )
+            VALUES(%s, %s, %s)
+            """
+
+_UPDATE_QUERY = """
+            UPDATE coa_data.item
+            SET
+                material = %s,
+                category = %s,
+                item_name = %s
+            WHERE item_id = %s
+            """
+
+_REMOVE_QUERY = """
+            DELETE FROM coa_data.item
+            WHERE item_id = %s
+            """
+
+
+@cache.cached("item")
+def get() -> List[Item]:
+    """
+    Gets a list of items.
+
+    Returns:
+        A list of items.
+    """
+    with Accessor(Cursor, read_only=True) as db_handle:
+        db_handle.execute(_GET_QUERY)
+        return _ITEM_ROWS.to_dicts(db_handle.fetchall())
 
 
 def add(material: str, category: str, item_name: str) -> None:
@@ -47,16 +83,9 @@ def add(material: str, category: str, item_name: str) -> None:
         category: The category of the item.
         item_name: The name of the item.
     """
-    query = """
-            INSERT INTO coa_data.item(
-                material,
-                category,
-                item_name
-            )
-            VALUES(%s, %s, %s)
-            """
     with Accessor() as db_handle:
-        db_handle.execute(query, (material, category, item_name))
+        db_handle.execute(_ADD_QUERY, (material, category, item_name))
+    cache.invalidate("item")
 
 
 def update(item_id: int, material: str, category: str, item_name: str) -> None:
@@ -69,16 +98,12 @@ def update(item_id: int, material: str, category: str, item_name: str) -> None:
         category: The category of the item.
         item_name: The name of the item.
     """
-    query = """
-            UPDATE coa_data.item
-            SET
-                material = %s,
-                category = %s,
-                item_name = %s
-            WHERE item_id = %s
-            """
     with Accessor() as db_handle:
-        db_handle.execute(query, (material, category, item_name, item_id))
+        rollups.withdraw(db_handle, "item", item_id)
+        db_handle.execute(_UPDATE_QUERY, (material, category, item_name, item_id))
+        rollups.restore(db_handle, "item", item_id)
+    cache.invalidate("item")
+    cache.invalidate("item_rollup")
 
 
 def remove(item_id: int) -> None:
@@ -88,9 +113,69 @@ def remove(item_id: int) -> None:
     Args:
         item_id: The ID of the item.
     """
-    query = """
-            DELETE FROM coa_data.item
-            WHERE item_id = %s
-            """
     with Accessor() as db_handle:
-        db_handle.execute(query, (item_id,))
+        rollups.withdraw(db_handle, "item", item_id)
+        db_handle.execute(_REMOVE_QUERY, (item_id,))
+    cache.invalidate("item")
+    cache.invalidate("item_rollup")
+
+
+@cache.cached("item")
+async def get_async() -> List[Item]:
+    """
+    Gets a list of items on the async connection pool.
+
+    Returns:
+        A list of items.
+    """
+    async with AsyncAccessor(Cursor, read_only=True) as db_handle:
+        await db_handle.execute(_GET_QUERY)
+        return _ITEM_ROWS.to_dicts(await db_handle.fetchall())
+
+
+async def add_async(material: str, category: str, item_name: str) -> None:
+    """
+    Adds an item on the async connection pool.
+
+    Args:
+        material: The material of the item.
+        category: The category of the item.
+        item_name: The name of the item.
+    """
+    async with AsyncAccessor() as db_handle:
+        await db_handle.execute(_ADD_QUERY, (material, category, item_name))
+    cache.invalidate("item")
+
+
+async def update_async(
+    item_id: int, material: str, category: str, item_name: str
+) -> None:
+    """
+    Updates an item on the async connection pool.
+
+    Args:
+        item_id: The ID of the item.
+        material: The material of the item.
+        category: The category of the item.
+        item_name: The name of the item.
+    """
+    async with AsyncAccessor() as db_handle:
+        await rollups.withdraw_async(db_handle, "item", item_id)
+        await db_handle.execute(_UPDATE_QUERY, (material, category, item_name, item_id))
+        await rollups.restore_async(db_handle, "item", item_id)
+    cache.invalidate("item")
+    cache.invalidate("item_rollup")
+
+
+async def remove_async(item_id: int) -> None:
+    """
+    Removes an item on the async connection pool.
+
+    Args:
+        item_id: The ID of the item.
+    """
+    async with AsyncAccessor() as db_handle:
+        await rollups.withdraw_async(db_handle, "item", item_id)
+        await db_handle.execute(_REMOVE_QUERY, (item_id,))
+    cache.invalidate("item")
+    cache.invalidate("item_rollup")
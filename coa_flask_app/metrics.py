@@ -0,0 +1,421 @@
+"""
+The module designed to contain the instrumentation of the app.
+
+The metrics are exposed in the Prometheus text format. When running under
+uwsgi every worker is a separate process, so PROMETHEUS_MULTIPROC_DIR should
+point to an empty directory shared by the workers. Each worker then writes
+its samples there and a scrape of any worker reports the sum of all of them.
+"""
+
+from functools import wraps
+import os
+import sys
+import time
+from typing import Any, AsyncIterator, Iterator, Tuple
+
+from flask import request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+_ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000, float("inf"))
+
+QUERY_SECONDS = Histogram(
+    "coa_db_query_seconds",
+    "Time spent executing and fetching database queries.",
+    ["query", "operation"],
+)
+QUERY_ROWS = Histogram(
+    "coa_db_query_rows",
+    "Number of rows fetched or changed by database queries.",
+    ["query"],
+    buckets=_ROW_BUCKETS,
+)
+CONNECT_SECONDS = Histogram(
+    "coa_db_connect_seconds", "Time spent opening new database connections."
+)
+POOL_WAIT_SECONDS = Histogram(
+    "coa_db_pool_wait_seconds", "Time spent waiting to check out a connection."
+)
+POOL_TIMEOUTS = Counter(
+    "coa_db_pool_timeouts", "Number of connection checkouts that timed out."
+)
+POOL_IN_USE = Gauge(
+    "coa_db_pool_in_use",
+    "Number of connections checked out of the pools.",
+    multiprocess_mode="livesum",
+)
+DB_READS = Counter(
+    "coa_db_reads",
+    "Number of read only database blocks by where they were sent.",
+    ["target"],
+)
+REQUEST_SECONDS = Histogram(
+    "coa_http_request_seconds",
+    "Time spent handling requests.",
+    ["endpoint", "method", "status"],
+)
+SERIALIZATION_SECONDS = Histogram(
+    "coa_serialization_seconds",
+    "Time spent serializing response bodies.",
+    ["endpoint"],
+)
+TOKEN_CACHE_LOOKUPS = Counter(
+    "coa_token_cache_lookups",
+    "Number of verified token cache lookups by result.",
+    ["result"],
+)
+PASSWORD_HASH_SECONDS = Histogram(
+    "coa_password_hash_seconds",
+    "Time spent waiting for and checking password hashes.",
+)
+PASSWORD_HASH_PENDING = Gauge(
+    "coa_password_hash_pending",
+    "Number of password hash checks running or waiting for a thread.",
+    multiprocess_mode="livesum",
+)
+
+
+def caller_label(depth: int = 2) -> str:
+    """
+    Gets the label of the data function a query is being made from.
+
+    Args:
+        depth: How many frames up from the caller of this function to look.
+
+    Returns:
+        The label in the form module.function, such as events.get.
+    """
+    frame = sys._getframe(depth)  # pylint: disable=protected-access
+    module = frame.f_globals.get("__name__", "").rsplit(".", 1)[-1]
+    return f"{module}.{frame.f_code.co_name}"
+
+
+class InstrumentedCursor:
+    """
+    A cursor wrapper that records the latency and row counts of its queries.
+
+    Everything besides executing and fetching is passed to the wrapped cursor.
+    """
+
+    def __init__(self, cursor: Any, label: str) -> None:
+        """
+        The constructor of the InstrumentedCursor class.
+
+        Args:
+            cursor: The cursor to wrap.
+            label: The label of the data function using the cursor.
+        """
+        self.cursor = cursor
+        self.label = label
+
+    def __getattr__(self, name: str) -> Any:
+        """
+        Passes any other attribute through to the wrapped cursor.
+
+        Args:
+            name: The name of the attribute.
+
+        Returns:
+            The attribute of the wrapped cursor.
+        """
+        return getattr(self.cursor, name)
+
+    def _timed(self, operation: str, func, *args) -> Any:
+        """
+        Runs a cursor method and records how long it took.
+
+        Args:
+            operation: The name of the operation for the metric label.
+            func: The cursor method to run.
+            args: The arguments to run it with.
+
+        Returns:
+            The result of the method.
+        """
+        start = time.perf_counter()
+        result = func(*args)
+        QUERY_SECONDS.labels(self.label, operation).observe(time.perf_counter() - start)
+        return result
+
+    def execute(self, query: str, args: Any = None) -> int:
+        """
+        Executes a query.
+
+        Args:
+            query: The query to execute.
+            args: The parameters of the query.
+
+        Returns:
+            The number of affected rows.
+        """
+        result = self._timed("execute", self.cursor.execute, query, args)
+        if self.cursor.description is None:
+            QUERY_ROWS.labels(self.label).observe(result or 0)
+        return result
+
+    def executemany(self, query: str, args: Any) -> int:
+        """
+        Executes a query for every set of parameters.
+
+        Args:
+            query: The query to execute.
+            args: The sets of parameters of the query.
+
+        Returns:
+            The number of affected rows.
+        """
+        result = self._timed("executemany", self.cursor.executemany, query, args)
+        QUERY_ROWS.labels(self.label).observe(result or 0)
+        return result
+
+    def fetchone(self) -> Any:
+        """
+        Fetches the next row.
+
+        Returns:
+            The next row or None when there are no more.
+        """
+        result = self._timed("fetch", self.cursor.fetchone)
+        return result
+
+    def fetchmany(self, size: Any = None) -> Any:
+        """
+        Fetches the next rows.
+
+        Args:
+            size: The number of rows to fetch.
+
+        Returns:
+            The next rows.
+        """
+        result = self._timed("fetch", self.cursor.fetchmany, size)
+        QUERY_ROWS.labels(self.label).observe(len(result))
+        return result
+
+    def fetchall(self) -> Any:
+        """
+        Fetches all of the remaining rows.
+
+        Returns:
+            The remaining rows.
+        """
+        result = self._timed("fetch", self.cursor.fetchall)
+        QUERY_ROWS.labels(self.label).observe(len(result))
+        return result
+
+    def __iter__(self) -> Iterator[Any]:
+        """
+        Iterates over the rows, recording the totals once they run out.
+
+        Returns:
+            An iterator of the rows.
+        """
+        rows = 0
+        elapsed = 0.0
+        iterator = iter(self.cursor.fetchone, None)
+        while True:
+            start = time.perf_counter()
+            row = next(iterator, None)
+            elapsed += time.perf_counter() - start
+            if row is None:
+                break
+            rows += 1
+            yield row
+        QUERY_SECONDS.labels(self.label, "fetch").observe(elapsed)
+        QUERY_ROWS.labels(self.label).observe(rows)
+
+
+class AsyncInstrumentedCursor:
+    """
+    The asyncio counterpart of InstrumentedCursor, for aiomysql cursors.
+    """
+
+    def __init__(self, cursor: Any, label: str) -> None:
+        """
+        The constructor of the AsyncInstrumentedCursor class.
+
+        Args:
+            cursor: The cursor to wrap.
+            label: The label of the data function using the cursor.
+        """
+        self.cursor = cursor
+        self.label = label
+
+    def __getattr__(self, name: str) -> Any:
+        """
+        Passes any other attribute through to the wrapped cursor.
+
+        Args:
+            name: The name of the attribute.
+
+        Returns:
+            The attribute of the wrapped cursor.
+        """
+        return getattr(self.cursor, name)
+
+    async def _timed(self, operation: str, func, *args) -> Any:
+        """
+        Awaits a cursor method and records how long it took.
+
+        Args:
+            operation: The name of the operation for the metric label.
+            func: The cursor method to await.
+            args: The arguments to call it with.
+
+        Returns:
+            The result of the method.
+        """
+        start = time.perf_counter()
+        result = await func(*args)
+        QUERY_SECONDS.labels(self.label, operation).observe(time.perf_counter() - start)
+        return result
+
+    async def execute(self, query: str, args: Any = None) -> int:
+        """
+        Executes a query.
+
+        Args:
+            query: The query to execute.
+            args: The parameters of the query.
+
+        Returns:
+            The number of affected rows.
+        """
+        result = await self._timed("execute", self.cursor.execute, query, args)
+        if self.cursor.description is None:
+            QUERY_ROWS.labels(self.label).observe(result or 0)
+        return result
+
+    async def executemany(self, query: str, args: Any) -> int:
+        """
+        Executes a query for every set of parameters.
+
+        Args:
+            query: The query to execute.
+            args: The sets of parameters of the query.
+
+        Returns:
+            The number of affected rows.
+        """
+        result = await self._timed("executemany", self.cursor.executemany, query, args)
+        QUERY_ROWS.labels(self.label).observe(result or 0)
+        return result
+
+    async def fetchone(self) -> Any:
+        """
+        Fetches the next row.
+
+        Returns:
+            The next row or None when there are no more.
+        """
+        return await self._timed("fetch", self.cursor.fetchone)
+
+    async def fetchall(self) -> Any:
+        """
+        Fetches all of the remaining rows.
+
+        Returns:
+            The remaining rows.
+        """
+        result = await self._timed("fetch", self.cursor.fetchall)
+        QUERY_ROWS.labels(self.label).observe(len(result))
+        return result
+
+    async def __aiter__(self) -> AsyncIterator[Any]:
+        """
+        Iterates over the rows, recording the totals once they run out.
+
+        Returns:
+            An asynchronous iterator of the rows.
+        """
+        rows = 0
+        elapsed = 0.0
+        while True:
+            start = time.perf_counter()
+            row = await self.cursor.fetchone()
+            elapsed += time.perf_counter() - start
+            if row is None:
+                break
+            rows += 1
+            yield row
+        QUERY_SECONDS.labels(self.label, "fetch").observe(elapsed)
+        QUERY_ROWS.labels(self.label).observe(rows)
+
+
+def serialization_timer(func):
+    """
+    A decorator used to record how long building a response body takes.
+
+    Args:
+        func: The function serializing the response, such as jsonify.
+    """
+
+    @wraps(func)
+    def _inner(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            SERIALIZATION_SECONDS.labels(request.endpoint).observe(
+                time.perf_counter() - start
+            )
+
+    return _inner
+
+
+def observe_request(start: float, status: int) -> None:
+    """
+    Records how long the current request took to handle.
+
+    Args:
+        start: When the request started, from time.perf_counter.
+        status: The status code of the response.
+    """
+    REQUEST_SECONDS.labels(request.endpoint, request.method, status).observe(
+        time.perf_counter() - start
+    )
+
+
+def mark_process_dead(pid: int) -> None:
+    """
+    Drops the live gauges of a worker that has exited.
+
+    Args:
+        pid: The process ID of the exited worker.
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        multiprocess.mark_process_dead(pid)
+
+
+def register_worker_exit() -> None:
+    """
+    Makes uwsgi workers drop their live gauges when they exit.
+
+    This does nothing when the app is not running under uwsgi.
+    """
+    try:
+        import uwsgi  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        return
+    uwsgi.atexit = lambda: mark_process_dead(os.getpid())
+
+
+def exposition() -> Tuple[bytes, str]:
+    """
+    Renders the metrics of every worker in the Prometheus text format.
+
+    Returns:
+        The rendered metrics and their content type.
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,92 @@
+"""
+The module designed to contain the helpers for paging through large listings.
+
+Listings are paged by key rather than by offset. The cursor handed back to
+the client encodes the last ID it was sent, so the next page starts with an
+indexed lookup no matter how deep into the listing it is.
+"""
+
+import base64
+import binascii
+import json
+from typing import Any, AsyncIterable, AsyncIterator, Iterable, Iterator, Optional
+
+from werkzeug.exceptions import BadRequest
+
+from coa_flask_app import serialization
+
+
+def encode_cursor(last_id: int) -> str:
+    """
+    Encodes the cursor pointing just past a row.
+
+    Args:
+        last_id: The ID of the last row sent to the client.
+
+    Returns:
+        The opaque cursor to resume from.
+    """
+    return base64.urlsafe_b64encode(json.dumps({"after": last_id}).encode()).decode()
+
+
+def decode_cursor(cursor: Optional[str]) -> int:
+    """
+    Decodes a cursor sent back by a client.
+
+    Args:
+        cursor: The cursor from the previous page, if any.
+
+    Returns:
+        The ID the next page starts after, 0 for the first page.
+
+    Raises:
+        This can raise BadRequest errors if the cursor is malformed.
+    """
+    if not cursor:
+        return 0
+    try:
+        return int(json.loads(base64.urlsafe_b64decode(cursor.encode()))["after"])
+    except (binascii.Error, ValueError, KeyError, TypeError) as err:
+        raise BadRequest("Invalid cursor.") from err
+
+
+def stream_json(key: str, records: Iterable[Any]) -> Iterator[bytes]:
+    """
+    Serializes a listing piece by piece as it is read.
+
+    The output matches jsonify with a single key holding the list.
+
+    Args:
+        key: The name of the key holding the list.
+        records: The records to serialize.
+
+    Returns:
+        An iterator of JSON text chunks.
+    """
+    yield b"{" + serialization.dumps(key) + b":["
+    separator = b""
+    for record in records:
+        yield separator + serialization.dumps(record)
+        separator = b","
+    yield b"]}\n"
+
+
+async def stream_json_async(
+    key: str, records: AsyncIterable[Any]
+) -> AsyncIterator[bytes]:
+    """
+    Serializes a listing piece by piece as it is read asynchronously.
+
+    Args:
+        key: The name of the key holding the list.
+        records: The records to serialize.
+
+    Returns:
+        An asynchronous iterator of the same chunks as stream_json.
+    """
+    yield b"{" + serialization.dumps(key) + b":["
+    separator = b""
+    async for record in records:
+        yield separator + serialization.dumps(record)
+        separator = b","
+    yield b"]}\n"
@@ -0,0 +1,250 @@
+"""
+The module designed to contain the connection pool of the database.
+
+A pool belongs to the process that created it. Connections are pinged when
+they are checked out and retired once they get too old, and a checkout waits
+for a free connection up to a timeout once the pool is at its size limit.
+"""
+
+from dataclasses import dataclass
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+import pymysql
+
+from coa_flask_app import metrics
+
+
+class PoolTimeout(Exception):
+    """
+    Raised when no connection could be checked out of the pool in time.
+    """
+
+
+@dataclass
+class PoolSettings:
+    """
+    How a connection pool opens connections and how many it keeps.
+
+    Attributes:
+        connect: The function used to open a new connection.
+        min_size: The number of connections opened up front.
+        max_size: The maximum number of connections open at once, at least 1.
+        max_age: The number of seconds a connection may live for.
+        timeout: The number of seconds to wait for a free connection.
+    """
+
+    connect: Callable[[], Any]
+    min_size: int
+    max_size: int
+    max_age: float
+    timeout: float
+
+    def __post_init__(self) -> None:
+        """
+        Makes sure the pool can hand out at least one connection.
+        """
+        self.max_size = max(self.max_size, 1)
+
+
+@dataclass
+class PoolCounters:
+    """
+    The usage counters of a connection pool.
+
+    Attributes:
+        checkouts: The number of connections checked out so far.
+        waits: The number of checkouts that had to wait for a connection.
+        wait_time: The total number of seconds spent waiting.
+        max_wait_time: The longest wait in seconds.
+        timeouts: The number of checkouts that gave up waiting.
+        connects: The number of connections opened.
+        discards: The number of connections closed.
+    """
+
+    checkouts: int = 0
+    waits: int = 0
+    wait_time: float = 0.0
+    max_wait_time: float = 0.0
+    timeouts: int = 0
+    connects: int = 0
+    discards: int = 0
+
+
+class ConnectionPool:
+    """
+    A bounded pool of database connections owned by a single process.
+
+    Connections are pinged when they are checked out and are retired once
+    they are older than the max age, so a connection dropped by the server
+    is replaced instead of being handed to a request.
+    """
+
+    def __init__(self, settings: PoolSettings) -> None:
+        """
+        The constructor of the ConnectionPool class.
+
+        Args:
+            settings: How the pool opens connections and how many it keeps.
+        """
+        self.pid = os.getpid()
+        self.settings = settings
+
+        self._cond = threading.Condition()
+        self._idle: List[Tuple[Any, float]] = []
+        self._created: Dict[int, float] = {}
+        self._in_use = 0
+        self._counters = PoolCounters()
+
+        for _ in range(min(settings.min_size, settings.max_size)):
+            connection = self._open()
+            self._idle.append((connection, self._created[id(connection)]))
+
+    def _open(self) -> Any:
+        """
+        Opens a new connection and starts tracking its age.
+
+        Returns:
+            The new connection.
+        """
+        start = time.perf_counter()
+        connection = self.settings.connect()
+        metrics.CONNECT_SECONDS.observe(time.perf_counter() - start)
+        with self._cond:
+            self._created[id(connection)] = time.monotonic()
+            self._counters.connects += 1
+        return connection
+
+    def _close(self, connection: Any) -> None:
+        """
+        Closes a connection and stops tracking it.
+
+        Args:
+            connection: The connection to close.
+        """
+        with self._cond:
+            self._created.pop(id(connection), None)
+            self._counters.discards += 1
+        try:
+            connection.close()
+        except Exception:  # pylint: disable=broad-except
+            pass
+
+    def _is_healthy(self, connection: Any, created: float) -> bool:
+        """
+        Checks whether an idle connection is still fit to be handed out.
+
+        Args:
+            connection: The connection to check.
+            created: When the connection was opened.
+
+        Returns:
+            Whether the connection is young enough and still answers a ping.
+        """
+        if time.monotonic() - created > self.settings.max_age:
+            return False
+        try:
+            connection.ping(reconnect=False)
+        except pymysql.err.Error:
+            return False
+        return True
+
+    def acquire(self) -> Any:
+        """
+        Checks a connection out of the pool.
+
+        Returns:
+            A healthy connection.
+
+        Raises:
+            PoolTimeout: If no connection frees up within the timeout.
+        """
+        start = time.monotonic()
+        idle = None
+        settings, counters = self.settings, self._counters
+        with self._cond:
+            waited = False
+            while not self._idle and self._in_use >= settings.max_size:
+                remaining = settings.timeout - (time.monotonic() - start)
+                if remaining <= 0:
+                    counters.timeouts += 1
+                    metrics.POOL_TIMEOUTS.inc()
+                    raise PoolTimeout(
+                        f"No database connection free after {settings.timeout}s."
+                    )
+                waited = True
+                self._cond.wait(remaining)
+
+            if self._idle:
+                idle = self._idle.pop()
+            self._in_use += 1
+            counters.checkouts += 1
+
+            wait_time = time.monotonic() - start
+            metrics.POOL_WAIT_SECONDS.observe(wait_time)
+            metrics.POOL_IN_USE.inc()
+            if waited:
+                counters.waits += 1
+                counters.wait_time += wait_time
+                counters.max_wait_time = max(counters.max_wait_time, wait_time)
+
+        try:
+            if idle is not None:
+                connection, created = idle
+                if self._is_healthy(connection, created):
+                    return connection
+                self._close(connection)
+            return self._open()
+        except BaseException:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            metrics.POOL_IN_USE.dec()
+            raise
+
+    def release(self, connection: Any, discard: bool = False) -> None:
+        """
+        Returns a connection to the pool.
+
+        Args:
+            connection: The connection being returned.
+            discard: Whether the connection is broken and should be closed.
+        """
+        created = self._created.get(id(connection))
+        max_age = self.settings.max_age
+        if discard or created is None or time.monotonic() - created > max_age:
+            self._close(connection)
+            created = None
+
+        with self._cond:
+            if created is not None:
+                self._idle.append((connection, created))
+            self._in_use -= 1
+            self._cond.notify()
+        metrics.POOL_IN_USE.dec()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Gets the current usage counters of the pool.
+
+        Returns:
+            A dictionary of the pool statistics.
+        """
+        counters = self._counters
+        with self._cond:
+            return {
+                "pid": self.pid,
+                "min_size": self.settings.min_size,
+                "max_size": self.settings.max_size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "checkouts": counters.checkouts,
+                "waits": counters.waits,
+                "wait_time_total": counters.wait_time,
+                "wait_time_max": counters.max_wait_time,
+                "timeouts": counters.timeouts,
+                "connects": counters.connects,
+                "discards": counters.discards,
+            }
@@ -0,0 +1,410 @@
+"""
+The module designed to contain the checking of the query plans of the app.
+
+Every query the data modules issue is kept in a module level constant whose
+name ends in _QUERY, so they can all be collected without running the app
+and explained against a target database. The plans are checked for full
+scans, filesorts and temporary tables, indexes are suggested for them, and
+the plans are compared to a baseline so a change that makes a query worse
+is caught before it reaches production.
+
+EXPLAIN only plans a statement and never runs it, so this is safe to point
+at a live database.
+"""
+
+from datetime import date
+import json
+import re
+from types import ModuleType
+from typing import Any, Dict, List, Optional, Tuple, TypedDict
+
+from coa_flask_app import (
+    analytics,
+    auth,
+    event_items,
+    events,
+    items,
+    rollups,
+    sites,
+)
+from coa_flask_app.db_accessor import Accessor
+
+MODULES: Tuple[ModuleType, ...] = (
+    auth,
+    items,
+    sites,
+    events,
+    event_items,
+    rollups,
+    analytics,
+)
+
+# The parameters explained with the queries that need realistic values to be
+# planned the way they are run. Every other placeholder is given 1.
+SAMPLE_PARAMS: Dict[str, Tuple[Any, ...]] = {
+    "auth._LOGIN_QUERY": ("admin",),
+    "events._GET_QUERY": (date(2020, 3, 1), date(2020, 9, 1), 0),
+    "event_items._GET_QUERY": (1, 0),
+    "rollups._TOTALS_QUERY": (2020, "Spring"),
+}
+
+# The fields filled in to explain the queries that are templates, with the
+# grouping and filters the stats routes are most often asked for.
+TEMPLATE_FIELDS: Dict[str, Dict[str, str]] = {
+    "rollups._TOTALS_QUERY": {
+        "columns": ", ".join(rollups.GROUPINGS["sites"]),
+        "conditions": "volunteer_year = %s AND volunteer_season = %s",
+    },
+}
+
+# The access types of EXPLAIN from the best to the worst.
+ACCESS_TYPES = (
+    "system",
+    "const",
+    "eq_ref",
+    "ref",
+    "fulltext",
+    "ref_or_null",
+    "index_merge",
+    "unique_subquery",
+    "index_subquery",
+    "range",
+    "index",
+    "ALL",
+)
+
+_FLAGS = {"Using filesort": "filesort", "Using temporary": "temporary"}
+
+_TABLE = re.compile(
+    r"\b(?:FROM|JOIN|UPDATE|INTO)\s+(\w+\.\w+)(?:\s+AS\s+(\w+))?", re.IGNORECASE
+)
+_CONDITION = re.compile(
+    r"(?:(\w+)\.)?(\w+)\s*(=|>=|<=|<>|>|<|\bIN\b)\s*%s", re.IGNORECASE
+)
+_ORDER = re.compile(r"\b(GROUP|ORDER)\s+BY\s+(?:(\w+)\.)?(\w+)", re.IGNORECASE)
+_PLACEHOLDER = re.compile(r"(\bIN\s+)?%s", re.IGNORECASE)
+_SET = re.compile(r"\bSET\b.*?(?=\bWHERE\b|$)", re.IGNORECASE | re.DOTALL)
+
+BASELINE = "migrations/query_plans.json"
+
+PlanRow = TypedDict(
+    "PlanRow",
+    {
+        "table": str,
+        "type": Optional[str],
+        "key": Optional[str],
+        "rows": Optional[int],
+        "flags": List[str],
+    },
+)
+
+QueryReport = TypedDict(
+    "QueryReport",
+    {
+        "plan": List[PlanRow],
+        "problems": List[str],
+        "suggestions": List[str],
+        "regressions": List[str],
+    },
+)
+
+
+def collect() -> Dict[str, str]:
+    """
+    Collects every explainable query of the data modules.
+
+    Inserts are left out, as they do not look any rows up, and templates
+    are filled in with their TEMPLATE_FIELDS.
+
+    Returns:
+        A dictionary of the qualified names of the queries to their text.
+    """
+    queries = {}
+    for module in MODULES:
+        short_name = module.__name__.rsplit(".", 1)[-1]
+        for name, value in sorted(vars(module).items()):
+            if not (name.endswith("_QUERY") and isinstance(value, str)):
+                continue
+            if value.lstrip().upper().startswith("INSERT"):
+                continue
+            qualified = f"{short_name}.{name}"
+            if qualified in TEMPLATE_FIELDS:
+                value = value.format(**TEMPLATE_FIELDS[qualified])
+            queries[qualified] = value
+    return queries
+
+
+def sample_params(name: str, query: str) -> Tuple[Any, ...]:
+    """
+    Gets the parameters to explain a query with.
+
+    Args:
+        name: The qualified name of the query.
+        query: The text of the query.
+
+    Returns:
+        The sample parameters of the query, or 1 for every placeholder,
+        as a one value list for IN clauses.
+    """
+    if name in SAMPLE_PARAMS:
+        return SAMPLE_PARAMS[name]
+    return tuple(
+        (1,) if match.group(1) else 1 for match in _PLACEHOLDER.finditer(query)
+    )
+
+
+def explain(db_handle: Any, query: str, params: Tuple[Any, ...]) -> List[PlanRow]:
+    """
+    Explains a query.
+
+    Args:
+        db_handle: A cursor returning dictionaries.
+        query: The query to explain.
+        params: The parameters of the query.
+
+    Returns:
+        A row of the plan for every table the query reads.
+    """
+    db_handle.execute("EXPLAIN " + query, params)
+    return [
+        {
+            "table": row["table"],
+            "type": row["type"],
+            "key": row["key"],
+            "rows": row["rows"],
+            "flags": [
+                flag for text, flag in _FLAGS.items() if text in (row["Extra"] or "")
+            ],
+        }
+        for row in db_handle.fetchall()
+    ]
+
+
+def _tables(query: str) -> Dict[str, str]:
+    """
+    Gets the tables of a query by the name EXPLAIN reports them under.
+
+    Args:
+        query: The text of the query.
+
+    Returns:
+        A dictionary of the aliases, or the bare table names of the tables
+        without one, to the qualified table names.
+    """
+    return {
+        alias or table.split(".", 1)[1]: table for table, alias in _TABLE.findall(query)
+    }
+
+
+def _columns(query: str, alias: str, aliased: bool) -> Tuple[List[str], ...]:
+    """
+    Gets the columns of a table a query filters, groups and orders by.
+
+    Columns without a table prefix are taken to belong to the tables
+    without an alias, which is how the queries of the app are written. The
+    columns assigned by an UPDATE are left out.
+
+    Args:
+        query: The text of the query.
+        alias: The name EXPLAIN reports the table under.
+        aliased: Whether the table was given an alias.
+
+    Returns:
+        The equality, grouping, range and ordering columns, in that order.
+    """
+    equal: List[str] = []
+    grouped: List[str] = []
+    ranged: List[str] = []
+    ordered: List[str] = []
+
+    def _belongs(prefix: Optional[str]) -> bool:
+        return prefix == alias if prefix else not aliased
+
+    query = _SET.sub("", query)
+    for prefix, column, operator in _CONDITION.findall(query):
+        if _belongs(prefix):
+            (equal if operator.upper() in ("=", "IN") else ranged).append(column)
+    for clause, prefix, column in _ORDER.findall(query):
+        if _belongs(prefix):
+            (grouped if clause.upper() == "GROUP" else ordered).append(column)
+    return equal, grouped, ranged, ordered
+
+
+def problems(query: str, plan: List[PlanRow]) -> List[str]:
+    """
+    Finds the full scans, filesorts and temporary tables of a plan.
+
+    Full scans of tables the query reads all of, such as the listings of
+    every item, are expected and left out, as are derived tables.
+
+    Args:
+        query: The text of the query.
+        plan: The plan of the query.
+
+    Returns:
+        A description of every problem found.
+    """
+    tables = _tables(query)
+    found = []
+    for row in plan:
+        table = tables.get(row["table"], row["table"])
+        aliased = table.split(".")[-1] != row["table"]
+        if (
+            row["type"] in ("ALL", "index")
+            and row["table"] in tables
+            and any(_columns(query, row["table"], aliased))
+        ):
+            kind = "full scan" if row["type"] == "ALL" else "full index scan"
+            found.append(f"{kind} of {table} (~{row['rows']} rows)")
+        for flag in row["flags"]:
+            found.append(f"{flag} on {table}")
+    return found
+
+
+def _index_columns(query: str, row: PlanRow, table: str) -> List[str]:
+    """
+    Picks the columns of the index to suggest for a table of a plan.
+
+    Args:
+        query: The text of the query.
+        row: The row of the plan for the table.
+        table: The qualified name of the table.
+
+    Returns:
+        The columns in the order to index them, empty when an index would
+        not help.
+    """
+    aliased = table.split(".")[-1] != row["table"]
+    equal, grouped, ranged, ordered = _columns(query, row["table"], aliased)
+    avoids_sort = set(ranged) <= set(ordered)
+    if row["key"] is not None and not avoids_sort:
+        return []
+    columns: List[str] = []
+    for column in equal + grouped + (ordered if avoids_sort else ranged[:1]):
+        if column not in columns:
+            columns.append(column)
+    return columns
+
+
+def suggest_indexes(query: str, plan: List[PlanRow]) -> List[str]:
+    """
+    Suggests indexes for the tables a plan scans or sorts.
+
+    The columns compared for equality come first, then those grouped by,
+    then the ones ordered by when the index can hand the rows out in that
+    order, or else the first one compared by range. No index is suggested
+    for a sort that an index already in use could not have avoided.
+
+    Args:
+        query: The text of the query.
+        plan: The plan of the query.
+
+    Returns:
+        The statements adding the suggested indexes.
+    """
+    tables = _tables(query)
+    suggestions = []
+    for row in plan:
+        if row["type"] not in ("ALL", "index") and not row["flags"]:
+            continue
+        table = tables.get(row["table"])
+        if table is None:
+            continue
+        columns = _index_columns(query, row, table)
+        if not columns:
+            continue
+        name = "_".join([table.split(".")[-1]] + columns + ["idx"])
+        statement = f"ALTER TABLE {table} ADD INDEX {name} ({', '.join(columns)});"
+        if statement not in suggestions:
+            suggestions.append(statement)
+    return suggestions
+
+
+def regressions(baseline: List[PlanRow], plan: List[PlanRow]) -> List[str]:
+    """
+    Compares a plan to its baseline.
+
+    A table regresses when it is accessed in a worse way than before or
+    gains a filesort or temporary table. Changes in the estimated number of
+    rows are not regressions, as they follow the data.
+
+    Args:
+        baseline: The stored plan of the query.
+        plan: The current plan of the query.
+
+    Returns:
+        A description of every regression found.
+    """
+    before = {row["table"]: row for row in baseline}
+    found = []
+    for row in plan:
+        old = before.get(row["table"])
+        if old is None:
+            continue
+        if _rank(row["type"]) > _rank(old["type"]):
+            found.append(
+                f"{row['table']} went from {old['type']} ({old['key']}) "
+                f"to {row['type']} ({row['key']})"
+            )
+        for flag in row["flags"]:
+            if flag not in old["flags"]:
+                found.append(f"{row['table']} now needs a {flag}")
+    return found
+
+
+def _rank(access_type: Optional[str]) -> int:
+    """
+    Ranks an access type from the best to the worst.
+
+    Args:
+        access_type: The access type of a plan row.
+
+    Returns:
+        The position of the type, with unknown types counted as the best.
+    """
+    if access_type not in ACCESS_TYPES:
+        return -1
+    return ACCESS_TYPES.index(access_type)
+
+
+def check(
+    baseline_path: str, save: bool = False
+) -> Tuple[Dict[str, QueryReport], bool]:
+    """
+    Explains every query and checks the plans against the baseline.
+
+    Args:
+        baseline_path: The JSON file holding the baseline plans.
+        save: Whether to store the current plans as the new baseline.
+
+    Returns:
+        The report of every query and whether any of them regressed.
+    """
+    try:
+        with open(baseline_path, encoding="utf-8") as baseline_file:
+            baseline: Dict[str, List[PlanRow]] = json.load(baseline_file)
+    except FileNotFoundError:
+        baseline = {}
+
+    reports: Dict[str, QueryReport] = {}
+    with Accessor(join=False) as db_handle:
+        for name, query in collect().items():
+            plan = explain(db_handle, query, sample_params(name, query))
+            reports[name] = {
+                "plan": plan,
+                "problems": problems(query, plan),
+                "suggestions": suggest_indexes(query, plan),
+                "regressions": regressions(baseline.get(name, []), plan),
+            }
+
+    if save:
+        with open(baseline_path, "w", encoding="utf-8") as baseline_file:
+            json.dump(
+                {name: report["plan"] for name, report in reports.items()},
+                baseline_file,
+                indent=2,
+                sort_keys=True,
+            )
+            baseline_file.write("\n")
+
+    return reports, any(report["regressions"] for report in reports.values())
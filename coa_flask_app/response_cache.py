@@ -0,0 +1,288 @@
+"""
+The module designed to contain the response cache shared by all workers.
+
+Under uwsgi the serialized responses are kept in a cache region of the uwsgi
+master, outside of the Python heap of any one worker, so the workers share a
+single copy and a recycled worker starts out warm. Elsewhere, such as when
+running the development server, a size bounded cache in the process is used
+instead.
+
+Every key includes the generations of the tables the response is built from,
+so a write to one of them makes every worker miss its old responses, which
+are then evicted as the least recently used.
+"""
+
+from collections import OrderedDict
+from functools import wraps
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional, Tuple
+from urllib.parse import urlencode
+
+from flask import current_app, request
+
+from coa_flask_app import generations
+
+try:
+    import uwsgi
+except ImportError:
+    uwsgi = None
+
+
+class LocalStore:
+    """
+    A least recently used cache of bytes, bounded by their total size.
+    """
+
+    def __init__(self, max_bytes: int, ttl: float) -> None:
+        """
+        The constructor of the LocalStore class.
+
+        Args:
+            max_bytes: The maximum number of bytes of values to hold.
+            ttl: The number of seconds a value stays valid for.
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._bytes = 0
+        self._evictions = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        """
+        Gets a value from the cache.
+
+        Args:
+            key: The key of the value.
+
+        Returns:
+            The value or None if it is missing or has expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, value: bytes) -> None:
+        """
+        Stores a value, evicting the least recently used ones to fit it.
+
+        Args:
+            key: The key of the value.
+            value: The value to store, which is skipped if it is larger
+                than the whole cache.
+        """
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._bytes += len(value)
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self._evictions += 1
+
+    def _drop(self, key: str) -> None:
+        """
+        Removes a value, the lock must already be held.
+
+        Args:
+            key: The key of the value.
+        """
+        _, value = self._entries.pop(key)
+        self._bytes -= len(value)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Gets the usage counters of the cache.
+
+        Returns:
+            A dictionary of the cache statistics.
+        """
+        with self._lock:
+            return {
+                "backend": "local",
+                "size": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "evictions": self._evictions,
+            }
+
+
+class UwsgiStore:
+    """
+    A cache region of the uwsgi master, shared by all of its workers.
+
+    The size, eviction and expiry of the region are set up by its cache2
+    option in uwsgi.ini.
+    """
+
+    def __init__(self, name: str, ttl: float) -> None:
+        """
+        The constructor of the UwsgiStore class.
+
+        Args:
+            name: The name of the cache region.
+            ttl: The number of seconds a value stays valid for.
+        """
+        self.name = name
+        self.ttl = ttl
+
+    def get(self, key: str) -> Optional[bytes]:
+        """
+        Gets a value from the cache.
+
+        Args:
+            key: The key of the value.
+
+        Returns:
+            The value or None if it is missing or has expired.
+        """
+        return uwsgi.cache_get(key, self.name)
+
+    def set(self, key: str, value: bytes) -> None:
+        """
+        Stores a value, the region evicting the least recently used ones.
+
+        Args:
+            key: The key of the value.
+            value: The value to store.
+        """
+        uwsgi.cache_update(key, value, int(self.ttl), self.name)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Gets the details of the cache.
+
+        Returns:
+            A dictionary of the cache details.
+        """
+        return {"backend": "uwsgi", "name": self.name}
+
+
+def _create_store():
+    """
+    Creates the store of the current server.
+
+    Returns:
+        The uwsgi cache region named by COA_RESPONSE_CACHE when running
+        under uwsgi, otherwise a cache in this process.
+    """
+    ttl = float(os.environ.get("COA_CACHE_TTL", "300"))
+    if uwsgi is not None:
+        return UwsgiStore(os.environ.get("COA_RESPONSE_CACHE", "coa_responses"), ttl)
+    return LocalStore(
+        int(os.environ.get("COA_RESPONSE_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+        ttl,
+    )
+
+
+STORE = _create_store()
+
+_LOCK = threading.Lock()
+_HITS = 0
+_MISSES = 0
+
+
+def lookup(key: str) -> Optional[bytes]:
+    """
+    Gets a response body from the shared cache.
+
+    Args:
+        key: The key of the response, including the version of its tables.
+
+    Returns:
+        The body or None if it has to be built.
+    """
+    global _HITS, _MISSES  # pylint: disable=global-statement
+    value = STORE.get(key)
+    with _LOCK:
+        if value is None:
+            _MISSES += 1
+        else:
+            _HITS += 1
+    return value
+
+
+def store(key: str, value: bytes) -> None:
+    """
+    Puts a response body in the shared cache.
+
+    Args:
+        key: The key of the response, including the version of its tables.
+        value: The body.
+    """
+    STORE.set(key, value)
+
+
+def key_for(path: str, params: Iterable[Tuple[str, str]], *tables: str) -> str:
+    """
+    Builds the key of a response at the current version of its tables.
+
+    Args:
+        path: The path of the request.
+        params: The query arguments of the request, in any order.
+        tables: The names of the tables the response is built from.
+
+    Returns:
+        The key of the response.
+    """
+    version = [str(generations.epoch())] + [
+        f"{table}={generations.current(table)}" for table in tables
+    ]
+    return "|".join((path, urlencode(sorted(params)), ":".join(version)))
+
+
+def stats() -> Dict[str, Any]:
+    """
+    Gets the usage counters of the shared cache in this process.
+
+    Returns:
+        A dictionary of the cache statistics.
+    """
+    with _LOCK:
+        return dict(STORE.stats(), hits=_HITS, misses=_MISSES)
+
+
+def shared(*tables: str, params: Tuple[str, ...] = ()):
+    """
+    A decorator used for the flask JSON routes to share their responses.
+
+    Only requests with exactly the given query arguments are cached, any
+    other request, such as for a page or a stream, runs the route as usual.
+
+    Args:
+        tables: The names of the tables the route reads from.
+        params: The names of the query arguments the route is cached by.
+    """
+
+    def _decorator(func):
+        @wraps(func)
+        def _inner(*args, **kwargs):
+            if set(request.args) != set(params):
+                return func(*args, **kwargs)
+
+            # The key is taken before the body is built, so a write landing
+            # in between leaves the body under an older version.
+            key = key_for(request.path, request.args.items(multi=True), *tables)
+            body = lookup(key)
+            if body is None:
+                response = current_app.make_response(func(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                body = response.get_data()
+                store(key, body)
+            return current_app.response_class(body, mimetype="application/json")
+
+        return _inner
+
+    return _decorator
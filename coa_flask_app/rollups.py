@@ -0,0 +1,451 @@
+"""
+The module designed to contain the rollups of the items collected.
+
+The quantity and count of the event items are kept summed up in the
+coa_data.item_rollup table by the year, season and site of their event and
+the material and category of their item, so the stats routes read a few
+rows instead of every tally ever recorded.
+
+The event item writes adjust the rollups in the same transaction as the
+tallies, and the event and item writes move the sums of the rows they
+change from their old key to their new one. `flask rebuild-rollups` builds
+the whole table again from the tallies.
+"""
+
+from collections import defaultdict
+from typing import Any, Dict, List, Tuple
+
+from pymysql.cursors import Cursor
+
+from coa_flask_app import cache, serialization
+from coa_flask_app.aio_accessor import AsyncAccessor
+from coa_flask_app.db_accessor import Accessor
+
+# The key of a rollup row, in the order of the primary key of the table.
+RollupKey = Tuple[int, str, int, str, str]
+
+# How much the quantity and count of the event items of an event and item
+# changed, keyed by the event ID and item ID.
+Deltas = Dict[Tuple[int, int], List[int]]
+
+# The columns the stats may be filtered by and the types of their values.
+FILTERS = {
+    "volunteer_year": int,
+    "volunteer_season": str,
+    "site_id": int,
+    "material": str,
+    "category": str,
+}
+
+# The columns the stats of every grouping are totalled by.
+GROUPINGS = {
+    "seasons": ("volunteer_year", "volunteer_season"),
+    "sites": ("site_id",),
+    "materials": ("material", "category"),
+}
+
+_CLEAR_QUERY = """
+            DELETE FROM coa_data.item_rollup
+            """
+
+# The sums are grouped by the position of their keys, as GROUP BY would take
+# volunteer_year and volunteer_season as the stored columns of the event
+# rather than the keys computed from its date.
+_REBUILD_QUERY = """
+            INSERT INTO coa_data.item_rollup(
+                volunteer_year,
+                volunteer_season,
+                site_id,
+                material,
+                category,
+                quantity,
+                event_items_cnt
+            )
+            SELECT
+                YEAR(cde.volunteer_date) AS volunteer_year,
+                IF(MONTH(cde.volunteer_date) < 7, 'Spring', 'Fall')
+                    AS volunteer_season,
+                cde.site_id,
+                cdi.material,
+                cdi.category,
+                SUM(cdei.quantity),
+                COUNT(*)
+            FROM coa_data.event_items AS cdei
+            JOIN coa_data.event AS cde ON cde.event_id = cdei.event_id
+            JOIN coa_data.item AS cdi ON cdi.item_id = cdei.item_id
+            GROUP BY 1, 2, 3, 4, 5
+            """
+
+_EVENT_KEYS_QUERY = """
+            SELECT
+                event_id,
+                YEAR(volunteer_date) AS volunteer_year,
+                IF(MONTH(volunteer_date) < 7, 'Spring', 'Fall')
+                    AS volunteer_season,
+                site_id
+            FROM coa_data.event
+            WHERE event_id IN %s
+            FOR UPDATE
+            """
+
+_ITEM_KEYS_QUERY = """
+            SELECT
+                item_id,
+                material,
+                category
+            FROM coa_data.item
+            WHERE item_id IN %s
+            LOCK IN SHARE MODE
+            """
+
+_ADJUST_QUERY = """
+            INSERT INTO coa_data.item_rollup(
+                volunteer_year,
+                volunteer_season,
+                site_id,
+                material,
+                category,
+                quantity,
+                event_items_cnt
+            )
+            VALUES(%s, %s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                quantity = coa_data.item_rollup.quantity + VALUES(quantity),
+                event_items_cnt =
+                    coa_data.item_rollup.event_items_cnt + VALUES(event_items_cnt)
+            """
+
+_LOCK_EVENT_QUERY = """
+            SELECT event_id
+            FROM coa_data.event
+            WHERE event_id = %s
+            FOR UPDATE
+            """
+
+_SHIFT_EVENT_QUERY = """
+            INSERT INTO coa_data.item_rollup(
+                volunteer_year,
+                volunteer_season,
+                site_id,
+                material,
+                category,
+                quantity,
+                event_items_cnt
+            )
+            SELECT
+                YEAR(cde.volunteer_date) AS volunteer_year,
+                IF(MONTH(cde.volunteer_date) < 7, 'Spring', 'Fall')
+                    AS volunteer_season,
+                cde.site_id,
+                cdi.material,
+                cdi.category,
+                %s * SUM(cdei.quantity),
+                %s * COUNT(*)
+            FROM coa_data.event_items AS cdei
+            JOIN coa_data.event AS cde ON cde.event_id = cdei.event_id
+            JOIN coa_data.item AS cdi ON cdi.item_id = cdei.item_id
+            WHERE cdei.event_id = %s
+            GROUP BY 1, 2, 3, 4, 5
+            ON DUPLICATE KEY UPDATE
+                quantity = coa_data.item_rollup.quantity + VALUES(quantity),
+                event_items_cnt =
+                    coa_data.item_rollup.event_items_cnt + VALUES(event_items_cnt)
+            """
+
+_LOCK_ITEM_QUERY = """
+            SELECT item_id
+            FROM coa_data.item
+            WHERE item_id = %s
+            FOR UPDATE
+            """
+
+_SHIFT_ITEM_QUERY = """
+            INSERT INTO coa_data.item_rollup(
+                volunteer_year,
+                volunteer_season,
+                site_id,
+                material,
+                category,
+                quantity,
+                event_items_cnt
+            )
+            SELECT
+                YEAR(cde.volunteer_date) AS volunteer_year,
+                IF(MONTH(cde.volunteer_date) < 7, 'Spring', 'Fall')
+                    AS volunteer_season,
+                cde.site_id,
+                cdi.material,
+                cdi.category,
+                %s * SUM(cdei.quantity),
+                %s * COUNT(*)
+            FROM coa_data.event_items AS cdei
+            JOIN coa_data.event AS cde ON cde.event_id = cdei.event_id
+            JOIN coa_data.item AS cdi ON cdi.item_id = cdei.item_id
+            WHERE cdei.item_id = %s
+            GROUP BY 1, 2, 3, 4, 5
+            ON DUPLICATE KEY UPDATE
+                quantity = coa_data.item_rollup.quantity + VALUES(quantity),
+                event_items_cnt =
+                    coa_data.item_rollup.event_items_cnt + VALUES(event_items_cnt)
+            """
+
+# The queries locking a row and shifting the sums of its event items, by
+# the table the row is in.
+_SHIFT_QUERIES = {
+    "event": (_LOCK_EVENT_QUERY, _SHIFT_EVENT_QUERY),
+    "item": (_LOCK_ITEM_QUERY, _SHIFT_ITEM_QUERY),
+}
+
+# The columns and conditions are filled in by _totals_query, and only ever
+# taken from GROUPINGS and FILTERS.
+_TOTALS_QUERY = """
+            SELECT
+                {columns},
+                SUM(quantity) AS quantity,
+                SUM(event_items_cnt) AS event_items_cnt
+            FROM coa_data.item_rollup
+            WHERE {conditions}
+            GROUP BY {columns}
+            HAVING SUM(event_items_cnt) > 0
+            ORDER BY {columns}
+            """
+
+_TOTALS_ROWS: Dict[str, serialization.RowMapper[Dict[str, Any]]] = {
+    grouping: serialization.RowMapper(
+        *[(column, None) for column in columns],
+        ("quantity", int),
+        ("event_items_cnt", int),
+    )
+    for grouping, columns in GROUPINGS.items()
+}
+
+
+def adjustments(
+    deltas: Deltas,
+    event_keys: Dict[int, Tuple[int, str, int]],
+    item_keys: Dict[int, Tuple[str, str]],
+) -> List[Tuple[Any, ...]]:
+    """
+    Sums up event item changes by the rollup rows they fall in.
+
+    Changes of events or items that do not exist are left out, the same as
+    when the rollups are rebuilt.
+
+    Args:
+        deltas: The changes of the quantity and count of the event items.
+        event_keys: The year, season and site of every event.
+        item_keys: The material and category of every item.
+
+    Returns:
+        The parameters of _ADJUST_QUERY for every row that changes, in the
+        order of the primary key, so concurrent writes lock the rows in the
+        same order.
+    """
+    rows: Dict[RollupKey, List[int]] = defaultdict(lambda: [0, 0])
+    for (event_id, item_id), (quantity, count) in deltas.items():
+        if event_id not in event_keys or item_id not in item_keys:
+            continue
+        row = rows[event_keys[event_id] + item_keys[item_id]]
+        row[0] += quantity
+        row[1] += count
+    return [key + tuple(row) for key, row in sorted(rows.items()) if any(row)]
+
+
+def apply(db_handle, deltas: Deltas) -> None:
+    """
+    Adjusts the rollups by event item changes.
+
+    The events are locked, so they cannot move to another season or site
+    until the transaction ends.
+
+    Args:
+        db_handle: The cursor of the transaction the changes are made in.
+        deltas: The changes of the quantity and count of the event items.
+    """
+    if not deltas:
+        return
+    db_handle.execute(_EVENT_KEYS_QUERY, (tuple({key[0] for key in deltas}),))
+    event_keys = {
+        row["event_id"]: (
+            row["volunteer_year"],
+            row["volunteer_season"],
+            row["site_id"],
+        )
+        for row in db_handle.fetchall()
+    }
+    db_handle.execute(_ITEM_KEYS_QUERY, (tuple({key[1] for key in deltas}),))
+    item_keys = {
+        row["item_id"]: (row["material"], row["category"])
+        for row in db_handle.fetchall()
+    }
+    params = adjustments(deltas, event_keys, item_keys)
+    if params:
+        db_handle.executemany(_ADJUST_QUERY, params)
+
+
+def withdraw(db_handle, table: str, row_id: int) -> None:
+    """
+    Takes the event items of an event or item out of the rollups.
+
+    This is called before the row is updated or removed, and the row stays
+    locked until the transaction ends.
+
+    Args:
+        db_handle: The cursor of the transaction the row is changed in.
+        table: The table of the row, either event or item.
+        row_id: The ID of the row.
+    """
+    lock_query, shift_query = _SHIFT_QUERIES[table]
+    db_handle.execute(lock_query, (row_id,))
+    db_handle.execute(shift_query, (-1, -1, row_id))
+
+
+def restore(db_handle, table: str, row_id: int) -> None:
+    """
+    Puts the event items of an event or item back into the rollups.
+
+    This is called after the row is updated, so they land under its new
+    season, site, material or category.
+
+    Args:
+        db_handle: The cursor of the transaction the row is changed in.
+        table: The table of the row, either event or item.
+        row_id: The ID of the row.
+    """
+    db_handle.execute(_SHIFT_QUERIES[table][1], (1, 1, row_id))
+
+
+def rebuild() -> int:
+    """
+    Builds the rollups again from the event items.
+
+    The rollups are kept up to date by the writes of the app, this is for
+    the first fill and for the case the tallies were edited some other way.
+
+    Returns:
+        The number of rollup rows built.
+    """
+    with Accessor() as db_handle:
+        db_handle.execute(_CLEAR_QUERY)
+        rebuilt = db_handle.execute(_REBUILD_QUERY)
+    cache.invalidate("item_rollup")
+    return rebuilt
+
+
+def _totals_query(grouping: str, filters: Tuple[Tuple[str, Any], ...]) -> str:
+    """
+    Builds the query totalling the rollups by a grouping.
+
+    Args:
+        grouping: The name of the grouping, one of GROUPINGS.
+        filters: The columns to filter by and their values.
+
+    Returns:
+        The query, taking the values of the filters as its parameters.
+    """
+    conditions = [f"{column} = %s" for column, _ in filters]
+    return _TOTALS_QUERY.format(
+        columns=", ".join(GROUPINGS[grouping]),
+        conditions=" AND ".join(conditions) or "TRUE",
+    )
+
+
+@cache.cached("item_rollup")
+def totals(
+    grouping: str, filters: Tuple[Tuple[str, Any], ...] = ()
+) -> List[Dict[str, Any]]:
+    """
+    Gets the totals of the items collected by a grouping.
+
+    Args:
+        grouping: The name of the grouping, one of GROUPINGS.
+        filters: The columns to filter by, from FILTERS, and their values.
+
+    Returns:
+        The quantity and count of the event items of every group with any,
+        ordered by the grouping columns.
+    """
+    with Accessor(Cursor, read_only=True) as db_handle:
+        db_handle.execute(
+            _totals_query(grouping, filters), [value for _, value in filters]
+        )
+        return _TOTALS_ROWS[grouping].to_dicts(db_handle.fetchall())
+
+
+async def apply_async(db_handle, deltas: Deltas) -> None:
+    """
+    Adjusts the rollups by event item changes on an async cursor, like apply.
+
+    Args:
+        db_handle: The async cursor of the transaction the changes are made in.
+        deltas: The changes of the quantity and count of the event items.
+    """
+    if not deltas:
+        return
+    await db_handle.execute(_EVENT_KEYS_QUERY, (tuple({key[0] for key in deltas}),))
+    event_keys = {
+        row["event_id"]: (
+            row["volunteer_year"],
+            row["volunteer_season"],
+            row["site_id"],
+        )
+        for row in await db_handle.fetchall()
+    }
+    await db_handle.execute(_ITEM_KEYS_QUERY, (tuple({key[1] for key in deltas}),))
+    item_keys = {
+        row["item_id"]: (row["material"], row["category"])
+        for row in await db_handle.fetchall()
+    }
+    params = adjustments(deltas, event_keys, item_keys)
+    if params:
+        await db_handle.executemany(_ADJUST_QUERY, params)
+
+
+async def withdraw_async(db_handle, table: str, row_id: int) -> None:
+    """
+    Takes the event items of an event or item out of the rollups on an async
+    cursor, like withdraw.
+
+    Args:
+        db_handle: The async cursor of the transaction the row is changed in.
+        table: The table of the row, either event or item.
+        row_id: The ID of the row.
+    """
+    lock_query, shift_query = _SHIFT_QUERIES[table]
+    await db_handle.execute(lock_query, (row_id,))
+    await db_handle.execute(shift_query, (-1, -1, row_id))
+
+
+async def restore_async(db_handle, table: str, row_id: int) -> None:
+    """
+    Puts the event items of an event or item back into the rollups on an
+    async cursor, like restore.
+
+    Args:
+        db_handle: The async cursor of the transaction the row is changed in.
+        table: The table of the row, either event or item.
+        row_id: The ID of the row.
+    """
+    await db_handle.execute(_SHIFT_QUERIES[table][1], (1, 1, row_id))
+
+
+@cache.cached("item_rollup")
+async def totals_async(
+    grouping: str, filters: Tuple[Tuple[str, Any], ...] = ()
+) -> List[Dict[str, Any]]:
+    """
+    Gets the totals of the items collected on the async connection pool.
+
+    Args:
+        grouping: The name of the grouping, one of GROUPINGS.
+        filters: The columns to filter by, from FILTERS, and their values.
+
+    Returns:
+        The quantity and count of the event items of every group with any,
+        ordered by the grouping columns.
+    """
+    async with AsyncAccessor(Cursor, read_only=True) as db_handle:
+        await db_handle.execute(
+            _totals_query(grouping, filters), [value for _, value in filters]
+        )
+        return _TOTALS_ROWS[grouping].to_dicts(await db_handle.fetchall())
@@ -0,0 +1,255 @@
+"""
+The module designed to contain the request parsing shared by the apps.
+
+The flask app and the ASGI app read their query arguments through these
+functions, so both accept the same arguments and reject bad ones with the
+same errors. The arguments are given as flask's request.args or starlette's
+request.query_params, which both have get and getlist.
+"""
+
+from datetime import date
+from typing import Any, Callable, Dict, List, Optional, Protocol, Tuple
+
+from werkzeug.exceptions import BadRequest
+
+from coa_flask_app import (
+    auth,
+    cache,
+    events,
+    generations,
+    pagination,
+    response_cache,
+    rollups,
+    sites,
+)
+
+
+class QueryArgs(Protocol):
+    """
+    The query arguments of a request, of either app.
+    """
+
+    def get(self, key: str, default: Any, /) -> Any:
+        """
+        Gets the first value of an argument.
+
+        Args:
+            key: The name of the argument.
+            default: The value to return if it is missing.
+        """
+
+    def getlist(self, key: str, /) -> List[str]:
+        """
+        Gets every value of an argument.
+
+        Args:
+            key: The name of the argument.
+        """
+
+
+def arg(args: QueryArgs, name: str, convert: Callable[[str], Any] = str) -> Any:
+    """
+    Gets a query argument the way flask's request.args.get does with a type.
+
+    Args:
+        args: The query arguments.
+        name: The name of the argument.
+        convert: The function converting the argument.
+
+    Returns:
+        The converted argument, or None if it is missing or invalid.
+    """
+    value = args.get(name, None)
+    if value is None:
+        return None
+    try:
+        return convert(value)
+    except ValueError:
+        return None
+
+
+def wants_stream(args: QueryArgs) -> bool:
+    """
+    Checks whether the request asked for a streamed response.
+
+    Args:
+        args: The query arguments.
+
+    Returns:
+        Whether the stream argument is set.
+    """
+    return args.get("stream", "").lower() in ("1", "true")
+
+
+def id_list(args: QueryArgs, name: str) -> List[int]:
+    """
+    Gets a list of IDs from a query argument.
+
+    The IDs may be comma separated, given as repeated arguments, or both.
+
+    Args:
+        args: The query arguments.
+        name: The name of the argument.
+
+    Returns:
+        The IDs, empty if the argument is missing.
+
+    Raises:
+        This can raise BadRequest errors if any of the IDs is not a number.
+    """
+    try:
+        return [
+            int(part)
+            for value in args.getlist(name)
+            for part in value.split(",")
+            if part.strip()
+        ]
+    except ValueError as err:
+        raise BadRequest(f"{name} must be a comma separated list of IDs.") from err
+
+
+def includes(args: QueryArgs, name: str) -> bool:
+    """
+    Checks whether the request asked for some related records to be included.
+
+    Args:
+        args: The query arguments.
+        name: The name of the related records.
+
+    Returns:
+        Whether the comma separated include argument names them.
+    """
+    return name in args.get("include", "").split(",")
+
+
+def rollup_filters(args: QueryArgs) -> Tuple[Tuple[str, Any], ...]:
+    """
+    Gets the filters of the stats routes from the query arguments.
+
+    Args:
+        args: The query arguments.
+
+    Returns:
+        The columns to filter the rollups by and their values, leaving out
+        any argument that is missing or invalid.
+    """
+    filters = (
+        (column, arg(args, column, convert))
+        for column, convert in rollups.FILTERS.items()
+    )
+    return tuple((column, value) for column, value in filters if value is not None)
+
+
+def season(args: QueryArgs) -> Optional[str]:
+    """
+    Gets the season of the analytics routes.
+
+    Args:
+        args: The query arguments, with an optional volunteer_season.
+
+    Returns:
+        The season, or None if it is missing.
+
+    Raises:
+        This can raise BadRequest errors if the season is not one of
+        events.SEASONS.
+    """
+    volunteer_season = arg(args, "volunteer_season")
+    if volunteer_season is not None and volunteer_season not in events.SEASONS:
+        raise BadRequest(f"The season must be one of {', '.join(events.SEASONS)}.")
+    return volunteer_season
+
+
+def next_cursor(page: List[Any], limit: int, id_key: str) -> Optional[str]:
+    """
+    Gets the cursor of the page after a page read with one extra row.
+
+    Args:
+        page: The page of records, with up to limit + 1 records.
+        limit: The number of records the client asked for.
+        id_key: The key holding the ID the records are ordered by.
+
+    Returns:
+        The cursor of the next page or None if this is the last page.
+    """
+    if len(page) <= limit:
+        return None
+    return pagination.encode_cursor(page[limit - 1][id_key])
+
+
+def coordinate(args: QueryArgs) -> Tuple[float, float]:
+    """
+    Gets the coordinate of the sites near routes.
+
+    Args:
+        args: The query arguments, with lat and long.
+
+    Returns:
+        The latitude and longitude.
+
+    Raises:
+        This can raise BadRequest errors if either is missing or invalid.
+    """
+    lat = arg(args, "lat", float)
+    long_f = arg(args, "long", float)
+    if (
+        lat is None
+        or long_f is None
+        or not (-90 <= lat <= 90 and -180 <= long_f <= 180)
+    ):
+        raise BadRequest("A valid latitude and longitude are needed.")
+    return lat, long_f
+
+
+def event_range(args: QueryArgs) -> Tuple[date, date]:
+    """
+    Gets the range of dates of the events routes.
+
+    Args:
+        args: The query arguments, with either a start_date and end_date or
+            a volunteer_year and volunteer_season.
+
+    Returns:
+        The first date of the range and the first date after it.
+
+    Raises:
+        This can raise BadRequest errors if neither is given or the season
+        is not valid.
+    """
+    start_date = arg(args, "start_date", date.fromisoformat)
+    end_date = arg(args, "end_date", date.fromisoformat)
+    if start_date is not None and end_date is not None:
+        return start_date, end_date
+
+    volunteer_year = arg(args, "volunteer_year", int)
+    if volunteer_year is None:
+        raise BadRequest("Either a year and season or a date range is needed.")
+    try:
+        return events.season_range(volunteer_year, arg(args, "volunteer_season"))
+    except ValueError as err:
+        raise BadRequest(str(err)) from err
+
+
+def worker_status(
+    pool: Optional[Dict[str, Any]], replicas: List[Dict[str, Any]]
+) -> Dict[str, Any]:
+    """
+    Gets the internal counters of the worker for the status routes.
+
+    Args:
+        pool: The statistics of the worker's connection pool.
+        replicas: The statistics of the worker's read replicas.
+
+    Returns:
+        A dictionary of the worker statistics.
+    """
+    return {
+        "pool": pool,
+        "replicas": replicas,
+        "cache": cache.stats(),
+        "response_cache": response_cache.stats(),
+        "token_cache": auth.TOKEN_CACHE.stats(),
+        "password_hashing": auth.HASH_LIMITER.stats(),
+        "site_index": sites.INDEX.stats(),
+        "generations": generations.snapshot(),
+    }
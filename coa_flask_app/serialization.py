@@ -0,0 +1,201 @@
+"""
+The module designed to contain the JSON serialization of the responses.
+
+Rows are read with plain tuple cursors and turned into dictionaries through
+a row mapper that knows the position and conversion of every column up
+front, instead of pymysql building a dictionary per row that is then copied
+into another one. The dictionaries are serialized with orjson when it is
+installed and with the standard library otherwise. Both produce the same
+text as jsonify, except that non-ASCII characters are written as UTF-8
+rather than escaped. DECIMAL columns read as Decimal are written as numbers
+by both.
+"""
+
+from datetime import date, datetime
+from decimal import Decimal
+import json
+import os
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generic,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+    cast,
+)
+
+from flask import current_app
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore[assignment]
+
+
+def _default(value: Any) -> Any:
+    """
+    Converts the values neither JSON backend handles on its own.
+
+    Args:
+        value: The value to convert.
+
+    Returns:
+        A Decimal as a float.
+
+    Raises:
+        TypeError: If the value cannot be serialized.
+    """
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _stdlib_dumps(obj: Any) -> bytes:
+    """
+    Serializes an object with the standard library.
+
+    Args:
+        obj: The object to serialize.
+
+    Returns:
+        The compact JSON text with sorted keys.
+    """
+    return json.dumps(
+        obj,
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+        default=_default,
+    ).encode()
+
+
+def _orjson_dumps(obj: Any) -> bytes:
+    """
+    Serializes an object with orjson.
+
+    Args:
+        obj: The object to serialize.
+
+    Returns:
+        The compact JSON text with sorted keys.
+    """
+    return orjson.dumps(obj, default=_default, option=orjson.OPT_SORT_KEYS)
+
+
+_BACKENDS: Dict[str, Callable[[Any], bytes]] = {"json": _stdlib_dumps}
+if orjson is not None:
+    _BACKENDS["orjson"] = _orjson_dumps
+
+dumps = _BACKENDS[
+    os.environ.get("COA_JSON_BACKEND", "orjson" if orjson is not None else "json")
+]
+
+
+def jsonify(*args: Any, **kwargs: Any):
+    """
+    Builds a JSON response, a drop in replacement for flask.jsonify.
+
+    Args:
+        args: A single object to serialize.
+        kwargs: The keys of an object to serialize.
+
+    Returns:
+        The JSON response.
+    """
+    if args and kwargs:
+        raise TypeError("jsonify() behavior undefined when passed both args and kwargs")
+    data = args[0] if len(args) == 1 else (args or kwargs)
+    return current_app.response_class(dumps(data) + b"\n", mimetype="application/json")
+
+
+def minute(value: datetime) -> str:
+    """
+    Formats a timestamp to the minute.
+
+    Args:
+        value: The timestamp.
+
+    Returns:
+        The timestamp as YYYY-MM-DD HH:MM.
+    """
+    return value.strftime("%Y-%m-%d %H:%M")
+
+
+def day(value: date) -> str:
+    """
+    Formats a date.
+
+    Args:
+        value: The date.
+
+    Returns:
+        The date as YYYY-MM-DD.
+    """
+    return value.strftime("%Y-%m-%d")
+
+
+# The type of the dictionaries a row mapper gives, usually a TypedDict.
+Record = TypeVar("Record")
+
+
+class RowMapper(Generic[Record]):
+    """
+    Turns tuple rows into dictionaries using a fixed map of the columns.
+
+    The mapper is typed by the dictionaries it gives, such as
+    RowMapper[Site], which should have a key for every column.
+    """
+
+    def __init__(self, *columns: Tuple[str, Optional[Callable[[Any], Any]]]) -> None:
+        """
+        The constructor of the RowMapper class.
+
+        Args:
+            columns: The name and conversion of every column, in the order
+                they are selected in. A conversion of None keeps the value
+                as is, and conversions are never applied to NULLs.
+        """
+        self.names = tuple(name for name, _ in columns)
+        self._conversions = [
+            (index, convert)
+            for index, (_, convert) in enumerate(columns)
+            if convert is not None
+        ]
+
+    def to_dict(self, row: Sequence[Any]) -> Record:
+        """
+        Converts a single row.
+
+        Args:
+            row: The row read from a tuple cursor.
+
+        Returns:
+            The row as a dictionary.
+        """
+        record = dict(zip(self.names, row))
+        for index, convert in self._conversions:
+            value = row[index]
+            if value is not None:
+                record[self.names[index]] = convert(value)
+        return cast(Record, record)
+
+    def to_dicts(self, rows: Iterable[Sequence[Any]]) -> List[Record]:
+        """
+        Converts many rows.
+
+        Args:
+            rows: The rows read from a tuple cursor.
+
+        Returns:
+            The rows as dictionaries.
+        """
+        if not self._conversions:
+            names = self.names
+            return [cast(Record, dict(zip(names, row))) for row in rows]
+        to_dict = self.to_dict
+        return [to_dict(row) for row in rows]
@@ -2,8 +2,14 @@
 A module handle the logic with the site table.
 """
 
-from typing import List, Optional, TypedDict
+import math
+import os
+from typing import Any, Dict, List, Optional, Tuple, TypedDict
 
+from pymysql.cursors import Cursor
+
+from coa_flask_app import cache, db_accessor, generations, serialization, spatial
+from coa_flask_app.aio_accessor import AsyncAccessor
 from coa_flask_app.db_accessor import Accessor
 
 
@@ -22,15 +28,24 @@ Site = TypedDict(
     },
 )
 
+_SITE_ROWS: serialization.RowMapper[Site] = serialization.RowMapper(
+    ("site_id", None),
+    ("site_name", None),
+    ("state", None),
+    ("county", None),
+    ("town", None),
+    ("street", None),
+    ("zipcode", None),
+    ("lat", float),
+    ("long", float),
+)
 
-def get() -> List[Site]:
-    """
-    Gets a list of sites.
+# The grid index of the sites with coordinates, kept by every worker.
+INDEX: spatial.GridIndex[Site] = spatial.GridIndex(
+    float(os.environ.get("COA_SITE_INDEX_CELL", "0.1")), id_key="site_id"
+)
 
-    Returns:
-        A list of sites.
-    """
-    query = """
+_GET_QUERY = """
             SELECT
                 site_id,
                 site_name,
@@ -43,22 +58,52 @@ def get() -> List[Site]:
                 `long`
             FROM coa_data.site
             """
-    with Accessor() as db_handle:
-        db_handle.execute(query)
-        return [
-            {
-                "site_id": record["site_id"],
-                "site_name": record["site_name"],
-                "state": record["state"],
-                "county": record["county"],
-                "town": record["town"],
-                "street": record["street"],
-                "zipcode": record["zipcode"],
-                "lat": None if record["lat"] is None else float(record["lat"]),
-                "long": None if record["long"] is None else float(record["long"]),
-            }
-            for record in db_handle.fetchall()
-        ]
+
+_ADD_QUERY = """
+            INSERT INTO coa_data.site(
+                site_name,
+                state,
+                county,
+                town,
+                street,
+                zipcode,
+                lat,
+                `long`
+            )
+            VALUES(%s, %s, %s, %s, %s, %s, %s, %s)
+            """
+
+_UPDATE_QUERY = """
+            UPDATE coa_data.site
+            SET
+                site_name = %s,
+                state = %s,
+                county = %s,
+                town = %s,
+                street = %s,
+                zipcode = %s,
+                lat = %s,
+                `long` = %s
+            WHERE site_id = %s
+            """
+
+_REMOVE_QUERY = """
+            DELETE FROM coa_data.site
+            WHERE site_id = %s
+            """
+
+
+@cache.cached("site")
+def get() -> List[Site]:
+    """
+    Gets a list of sites.
+
+    Returns:
+        A list of sites.
+    """
+    with Accessor(Cursor, read_only=True) as db_handle:
+        db_handle.execute(_GET_QUERY)
+        return _SITE_ROWS.to_dicts(db_handle.fetchall())
 
 
 def add(
@@ -84,23 +129,16 @@ def add(
         lat: The latitude of the site.
         long_f: The longitude of the site.
     """
-    query = """
-            INSERT INTO coa_data.site(
-                site_name,
-                state,
-                county,
-                town,
-                street,
-                zipcode,
-                lat,
-                `long`
-            )
-            VALUES(%s, %s, %s, %s, %s, %s, %s, %s)
-            """
     with Accessor() as db_handle:
         db_handle.execute(
-            query, (site_name, state, county, town, street, zipcode, lat, long_f)
+            _ADD_QUERY, (site_name, state, county, town, street, zipcode, lat, long_f)
         )
+        site_id = db_handle.lastrowid
+    cache.invalidate("site")
+    _reindex(
+        site_id,
+        _site(site_id, site_name, state, county, town, street, zipcode, lat, long_f),
+    )
 
 
 def update(
@@ -128,24 +166,16 @@ def update(
         lat: The latitude of the site.
         long_f: The longitude of the site.
     """
-    query = """
-            UPDATE coa_data.site
-            SET
-                site_name = %s,
-                state = %s,
-                county = %s,
-                town = %s,
-                street = %s,
-                zipcode = %s,
-                lat = %s,
-                `long` = %s
-            WHERE site_id = %s
-            """
     with Accessor() as db_handle:
         db_handle.execute(
-            query,
+            _UPDATE_QUERY,
             (site_name, state, county, town, street, zipcode, lat, long_f, site_id),
         )
+    cache.invalidate("site")
+    _reindex(
+        site_id,
+        _site(site_id, site_name, state, county, town, street, zipcode, lat, long_f),
+    )
 
 
 def remove(site_id: int) -> None:
@@ -155,9 +185,264 @@ def remove(site_id: int) -> None:
     Args:
         site_id: The ID of the site.
     """
-    query = """
-            DELETE FROM coa_data.site
-            WHERE site_id = %s
-            """
     with Accessor() as db_handle:
-        db_handle.execute(query, (site_id,))
+        db_handle.execute(_REMOVE_QUERY, (site_id,))
+    cache.invalidate("site")
+    _reindex(site_id, None)
+
+
+@cache.cached("site")
+async def get_async() -> List[Site]:
+    """
+    Gets a list of sites on the async connection pool.
+
+    Returns:
+        A list of sites.
+    """
+    async with AsyncAccessor(Cursor, read_only=True) as db_handle:
+        await db_handle.execute(_GET_QUERY)
+        return _SITE_ROWS.to_dicts(await db_handle.fetchall())
+
+
+async def add_async(
+    site_name: str,
+    state: str,
+    county: str,
+    town: str,
+    street: Optional[str],
+    zipcode: Optional[str],
+    lat: Optional[float],
+    long_f: Optional[float],
+) -> None:
+    """
+    Adds a site on the async connection pool.
+
+    Args:
+        site_name: The name of the site.
+        state: The state the site is in.
+        county: The county the site is in.
+        town: The town the site is in.
+        street: The street the site is on.
+        zipcode: The zipcode the site is in.
+        lat: The latitude of the site.
+        long_f: The longitude of the site.
+    """
+    async with AsyncAccessor() as db_handle:
+        await db_handle.execute(
+            _ADD_QUERY, (site_name, state, county, town, street, zipcode, lat, long_f)
+        )
+        site_id = db_handle.lastrowid
+    cache.invalidate("site")
+    _reindex(
+        site_id,
+        _site(site_id, site_name, state, county, town, street, zipcode, lat, long_f),
+    )
+
+
+async def update_async(
+    site_id: int,
+    site_name: str,
+    state: str,
+    county: str,
+    town: str,
+    street: Optional[str],
+    zipcode: Optional[str],
+    lat: Optional[float],
+    long_f: Optional[float],
+) -> None:
+    """
+    Updates a site on the async connection pool.
+
+    Args:
+        site_id: The ID of the site.
+        site_name: The name of the site.
+        state: The state the site is in.
+        county: The county the site is in.
+        town: The town the site is in.
+        street: The street the site is on.
+        zipcode: The zipcode the site is in.
+        lat: The latitude of the site.
+        long_f: The longitude of the site.
+    """
+    async with AsyncAccessor() as db_handle:
+        await db_handle.execute(
+            _UPDATE_QUERY,
+            (site_name, state, county, town, street, zipcode, lat, long_f, site_id),
+        )
+    cache.invalidate("site")
+    _reindex(
+        site_id,
+        _site(site_id, site_name, state, county, town, street, zipcode, lat, long_f),
+    )
+
+
+async def remove_async(site_id: int) -> None:
+    """
+    Removes a site on the async connection pool.
+
+    Args:
+        site_id: The ID of the site.
+    """
+    async with AsyncAccessor() as db_handle:
+        await db_handle.execute(_REMOVE_QUERY, (site_id,))
+    cache.invalidate("site")
+    _reindex(site_id, None)
+
+
+def _site(
+    site_id: int,
+    site_name: str,
+    state: str,
+    county: str,
+    town: str,
+    street: Optional[str],
+    zipcode: Optional[str],
+    lat: Optional[float],
+    long_f: Optional[float],
+) -> Site:
+    """
+    Gets a site the way get returns it.
+
+    Args:
+        site_id: The ID of the site.
+        site_name: The name of the site.
+        state: The state the site is in.
+        county: The county the site is in.
+        town: The town the site is in.
+        street: The street the site is on.
+        zipcode: The zipcode the site is in.
+        lat: The latitude of the site.
+        long_f: The longitude of the site.
+
+    Returns:
+        The site.
+    """
+    return {
+        "site_id": site_id,
+        "site_name": site_name,
+        "state": state,
+        "county": county,
+        "town": town,
+        "street": street,
+        "zipcode": zipcode,
+        "lat": None if lat is None else float(lat),
+        "long": None if long_f is None else float(long_f),
+    }
+
+
+def _index_version() -> Tuple[int, int]:
+    """
+    Gets the version of the site table the index should be at.
+
+    Returns:
+        The epoch and the generation of the site table.
+    """
+    return generations.epoch(), generations.current("site")
+
+
+def _reindex(site_id: int, site: Optional[Site]) -> None:
+    """
+    Applies a write to the index of this worker once it has been committed.
+
+    The index follows the write without being rebuilt only if no other write
+    was made to the table since it was last brought up to date, otherwise
+    it is rebuilt the next time it is used, as it is in the other workers.
+
+    Args:
+        site_id: The ID of the site written to.
+        site: The site as written, or None if it was removed.
+    """
+
+    def _apply() -> None:
+        epoch, generation = _index_version()
+        INDEX.change(site_id, site, (epoch, generation - 1), (epoch, generation))
+
+    db_accessor.on_commit(_apply)
+
+
+def index() -> spatial.GridIndex[Site]:
+    """
+    Gets the index of the sites, rebuilding it if the sites changed.
+
+    Returns:
+        The index of the sites with coordinates.
+    """
+    current = _index_version()
+    if INDEX.version != current:
+        INDEX.rebuild(get(), current)
+    return INDEX
+
+
+async def index_async() -> spatial.GridIndex[Site]:
+    """
+    Gets the index of the sites on the async connection pool.
+
+    Returns:
+        The index of the sites with coordinates.
+    """
+    current = _index_version()
+    if INDEX.version != current:
+        INDEX.rebuild(await get_async(), current)
+    return INDEX
+
+
+def parse_bbox(text: str) -> Tuple[float, float, float, float]:
+    """
+    Parses a bounding box given as min_long,min_lat,max_long,max_lat.
+
+    Args:
+        text: The bounding box.
+
+    Returns:
+        The western, southern, eastern and northern edges.
+
+    Raises:
+        ValueError: If the box is malformed or outside the map.
+    """
+    edges = tuple(float(edge) for edge in text.split(","))
+    if len(edges) != 4 or not all(math.isfinite(edge) for edge in edges):
+        raise ValueError("A bounding box needs four numbers.")
+    min_long, min_lat, max_long, max_lat = edges
+    if not -180 <= min_long <= max_long <= 180 or not -90 <= min_lat <= max_lat <= 90:
+        raise ValueError("The bounding box is outside the map.")
+    return min_long, min_lat, max_long, max_lat
+
+
+def near(
+    site_index: spatial.GridIndex[Site], lat: float, long_f: float, limit: int
+) -> List[Dict[str, Any]]:
+    """
+    Gets the sites closest to a coordinate.
+
+    Sites with no coordinates are never returned.
+
+    Args:
+        site_index: The index of the sites.
+        lat: The latitude.
+        long_f: The longitude.
+        limit: The number of sites to return.
+
+    Returns:
+        The sites with their distance in kilometers, the closest first.
+    """
+    return [
+        dict(site, distance_km=round(distance, 3))
+        for distance, site in site_index.near(lat, long_f, limit)
+    ]
+
+
+def within(
+    site_index: spatial.GridIndex[Site], bbox: Tuple[float, float, float, float]
+) -> List[Site]:
+    """
+    Gets the sites inside a bounding box.
+
+    Args:
+        site_index: The index of the sites.
+        bbox: The western, southern, eastern and northern edges.
+
+    Returns:
+        The sites, ordered by their ID.
+    """
+    min_long, min_lat, max_long, max_lat = bbox
+    return site_index.within(min_lat, min_long, max_lat, max_long)
@@ -0,0 +1,387 @@
+"""
+The module designed to contain an in-memory grid index of points on a map.
+
+The points are bucketed into square cells of a fixed number of degrees, so a
+bounding box only looks at the cells it overlaps and a nearest points search
+only looks at the cells around the point, widening until it has enough
+candidates and then scanning the box that the furthest of them spans. Points
+can be put and discarded one at a time, so the index can follow the writes
+made to it without being rebuilt.
+"""
+
+import heapq
+import math
+import threading
+from typing import (
+    Any,
+    Dict,
+    Generic,
+    Iterator,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+# The mean radius of the earth in kilometers.
+EARTH_RADIUS_KM = 6371.0088
+
+Point = TypeVar("Point", bound=Mapping[str, Any])
+Cell = Tuple[int, int]
+
+
+class PointKeys(NamedTuple):
+    """
+    The keys the ID and coordinates of the points of an index are under.
+    """
+
+    id: str
+    lat: str
+    long: str
+
+
+def haversine(lat_a: float, long_a: float, lat_b: float, long_b: float) -> float:
+    """
+    Gets the great circle distance between two coordinates.
+
+    Args:
+        lat_a: The latitude of the first coordinate.
+        long_a: The longitude of the first coordinate.
+        lat_b: The latitude of the second coordinate.
+        long_b: The longitude of the second coordinate.
+
+    Returns:
+        The distance in kilometers.
+    """
+    phi_a, phi_b = math.radians(lat_a), math.radians(lat_b)
+    half = (
+        math.sin((phi_b - phi_a) / 2) ** 2
+        + math.cos(phi_a)
+        * math.cos(phi_b)
+        * math.sin(math.radians(long_b - long_a) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(half)))
+
+
+class GridIndex(Generic[Point]):
+    """
+    A grid of cells holding points by their latitude and longitude.
+
+    Every point is a dictionary with an ID and the coordinates under the
+    keys given to the constructor. Points with no coordinates are left out.
+    The index is safe to use from many threads.
+    """
+
+    def __init__(
+        self,
+        cell_size: float,
+        id_key: str = "id",
+        lat_key: str = "lat",
+        long_key: str = "long",
+    ) -> None:
+        """
+        The constructor of the GridIndex class.
+
+        Args:
+            cell_size: The width and height of the cells, in degrees.
+            id_key: The key of the ID of the points.
+            lat_key: The key of the latitude of the points.
+            long_key: The key of the longitude of the points.
+        """
+        self.cell_size = cell_size
+        self.keys = PointKeys(id_key, lat_key, long_key)
+        self.version: Optional[Any] = None
+        self._cells: Dict[Cell, Dict[Any, Point]] = {}
+        self._located: Dict[Any, Cell] = {}
+        self._lock = threading.RLock()
+
+    def _cell(self, lat: float, long_f: float) -> Cell:
+        """
+        Gets the cell a coordinate falls in.
+
+        Args:
+            lat: The latitude.
+            long_f: The longitude.
+
+        Returns:
+            The column and row of the cell.
+        """
+        return (
+            math.floor(long_f / self.cell_size),
+            math.floor(lat / self.cell_size),
+        )
+
+    def _span(self, min_lat: float, min_long: float, max_lat: float, max_long: float):
+        """
+        Gets the points of the cells a box overlaps.
+
+        The occupied cells are filtered instead when the box covers more
+        cells than are occupied.
+
+        Args:
+            min_lat: The southern edge of the box.
+            min_long: The western edge of the box.
+            max_lat: The northern edge of the box.
+            max_long: The eastern edge of the box.
+
+        Returns:
+            An iterator over the points, some of them outside the box.
+        """
+        min_x, min_y = self._cell(min_lat, min_long)
+        max_x, max_y = self._cell(max_lat, max_long)
+        if (max_x - min_x + 1) * (max_y - min_y + 1) > len(self._cells):
+            cells: Iterator[Dict[Any, Point]] = (
+                points
+                for (x, y), points in self._cells.items()
+                if min_x <= x <= max_x and min_y <= y <= max_y
+            )
+        else:
+            cells = (
+                self._cells[(x, y)]
+                for x in range(min_x, max_x + 1)
+                for y in range(min_y, max_y + 1)
+                if (x, y) in self._cells
+            )
+        return (point for points in cells for point in points.values())
+
+    def put(self, point: Point) -> None:
+        """
+        Adds a point or moves it to its new coordinates.
+
+        A point with no coordinates is discarded.
+
+        Args:
+            point: The point.
+        """
+        with self._lock:
+            self.discard(point[self.keys.id])
+            lat, long_f = point[self.keys.lat], point[self.keys.long]
+            if lat is None or long_f is None:
+                return
+            cell = self._cell(lat, long_f)
+            self._cells.setdefault(cell, {})[point[self.keys.id]] = point
+            self._located[point[self.keys.id]] = cell
+
+    def discard(self, point_id: Any) -> None:
+        """
+        Removes a point if it is in the index.
+
+        Args:
+            point_id: The ID of the point.
+        """
+        with self._lock:
+            cell = self._located.pop(point_id, None)
+            if cell is not None:
+                points = self._cells[cell]
+                del points[point_id]
+                if not points:
+                    del self._cells[cell]
+
+    def change(
+        self, point_id: Any, point: Optional[Point], previous: Any, version: Any
+    ) -> None:
+        """
+        Applies a write made to one point.
+
+        The index moves to the version of the write only if it was at the
+        version just before it, otherwise some other write is missing and it
+        keeps its version so it gets rebuilt.
+
+        Args:
+            point_id: The ID of the point.
+            point: The point as written, or None if it was removed.
+            previous: The version just before the write.
+            version: The version of the write.
+        """
+        with self._lock:
+            if point is None:
+                self.discard(point_id)
+            else:
+                self.put(point)
+            if self.version == previous:
+                self.version = version
+
+    def rebuild(self, points: List[Point], version: Any) -> None:
+        """
+        Replaces every point of the index.
+
+        Args:
+            points: The points.
+            version: The version of the data the points were read from.
+        """
+        with self._lock:
+            self._cells = {}
+            self._located = {}
+            for point in points:
+                self.put(point)
+            self.version = version
+
+    def within(
+        self, min_lat: float, min_long: float, max_lat: float, max_long: float
+    ) -> List[Point]:
+        """
+        Gets the points inside a box, edges included.
+
+        Args:
+            min_lat: The southern edge of the box.
+            min_long: The western edge of the box.
+            max_lat: The northern edge of the box.
+            max_long: The eastern edge of the box.
+
+        Returns:
+            The points, ordered by their ID.
+        """
+        with self._lock:
+            inside = [
+                point
+                for point in self._span(min_lat, min_long, max_lat, max_long)
+                if min_lat <= point[self.keys.lat] <= max_lat
+                and min_long <= point[self.keys.long] <= max_long
+            ]
+        return sorted(inside, key=lambda point: point[self.keys.id])
+
+    def near(self, lat: float, long_f: float, limit: int) -> List[Tuple[float, Point]]:
+        """
+        Gets the points closest to a coordinate.
+
+        Args:
+            lat: The latitude.
+            long_f: The longitude.
+            limit: The number of points to return.
+
+        Returns:
+            The distance in kilometers and the points, the closest and then
+            the lowest ID first.
+        """
+        if limit <= 0:
+            return []
+        with self._lock:
+            if not self._cells:
+                return []
+            candidates = self._around(lat, long_f, limit)
+            if len(candidates) >= limit:
+                furthest = heapq.nsmallest(limit, candidates)[-1][0]
+                candidates = self._span_distance(lat, long_f, furthest)
+            best = heapq.nsmallest(limit, candidates)
+            return [(distance, self._point(point_id)) for distance, point_id in best]
+
+    def _point(self, point_id: Any) -> Point:
+        """
+        Gets a point of the index by its ID.
+
+        Args:
+            point_id: The ID of the point.
+
+        Returns:
+            The point.
+        """
+        return self._cells[self._located[point_id]][point_id]
+
+    def _distances(self, lat: float, long_f: float, points) -> List[Tuple[float, Any]]:
+        """
+        Gets the distances of points to a coordinate.
+
+        Args:
+            lat: The latitude.
+            long_f: The longitude.
+            points: The points.
+
+        Returns:
+            The distance and ID of every point.
+        """
+        return [
+            (
+                haversine(lat, long_f, point[self.keys.lat], point[self.keys.long]),
+                point[self.keys.id],
+            )
+            for point in points
+        ]
+
+    def _around(self, lat: float, long_f: float, limit: int) -> List[Tuple[float, Any]]:
+        """
+        Gets at least a number of points around a coordinate, if there are.
+
+        The box around the coordinate doubles in size until it holds enough
+        points or covers every occupied cell.
+
+        Args:
+            lat: The latitude.
+            long_f: The longitude.
+            limit: The number of points wanted.
+
+        Returns:
+            The distance and ID of the points found.
+        """
+        x, y = self._cell(lat, long_f)
+        columns = [column for column, _ in self._cells]
+        rows = [row for _, row in self._cells]
+        reach = max(x - min(columns), max(columns) - x, y - min(rows), max(rows) - y, 0)
+        radius = 1
+        while True:
+            size = radius * self.cell_size
+            points = list(
+                self._span(lat - size, long_f - size, lat + size, long_f + size)
+            )
+            if len(points) >= limit or radius > reach:
+                return self._distances(lat, long_f, points)
+            radius *= 2
+
+    def _span_distance(self, lat: float, long_f: float, distance: float):
+        """
+        Gets the points that could be within a distance of a coordinate.
+
+        Args:
+            lat: The latitude.
+            long_f: The longitude.
+            distance: The distance in kilometers.
+
+        Returns:
+            The distance and ID of the points of the cells the distance
+            reaches, or of every point if it reaches a pole or the
+            antimeridian.
+        """
+        angle = (distance + 1e-6) / EARTH_RADIUS_KM
+        lat_reach = math.degrees(angle)
+        if abs(lat) + lat_reach >= 90 or math.sin(angle) >= math.cos(math.radians(lat)):
+            return self._distances(lat, long_f, self._all())
+        long_reach = math.degrees(
+            math.asin(math.sin(angle) / math.cos(math.radians(lat)))
+        )
+        if abs(long_f) + long_reach >= 180:
+            return self._distances(lat, long_f, self._all())
+        return self._distances(
+            lat,
+            long_f,
+            self._span(
+                lat - lat_reach,
+                long_f - long_reach,
+                lat + lat_reach,
+                long_f + long_reach,
+            ),
+        )
+
+    def _all(self) -> Iterator[Point]:
+        """
+        Gets every point of the index.
+
+        Returns:
+            An iterator over the points.
+        """
+        return (point for points in self._cells.values() for point in points.values())
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Gets the size of the index.
+
+        Returns:
+            A dictionary of the index statistics.
+        """
+        with self._lock:
+            return {
+                "points": len(self._located),
+                "cells": len(self._cells),
+                "cell_size": self.cell_size,
+                "version": self.version,
+            }
@@ -0,0 +1,336 @@
+"""
+The module designed to contain the report of the items collected the most.
+
+The quantities of every item are summed up by season along with the county
+and site they were found at, from the arrays of analytics, and the top items
+of every season, county and site are picked out with a heap and joined to
+the items catalog. The report is built once per version of the tables it
+reads, so it is rebuilt after the event items change and every other
+request is answered from memory.
+"""
+
+import asyncio
+import heapq
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from coa_flask_app import analytics, generations, items, sites
+
+# The tables the report is built from.
+TABLES = analytics.TABLES + ("item", "site")
+
+# The number of top items kept for every season and scope.
+DEPTH = int(os.environ.get("COA_TOP_ITEMS_DEPTH", "50"))
+
+# The year, season, scope and the county or site ID of a list of top items,
+# with None for all of a season.
+ReportKey = Tuple[int, str, str, Optional[Union[str, int]]]
+
+# The top items of the seasons by their key.
+Report = Dict[ReportKey, List[Dict[str, Any]]]
+
+# A function giving the county or site ID of a code of a scope.
+_Namer = Callable[[int], Optional[Union[str, int]]]
+
+_LOCK = threading.Lock()
+_REPORT: Optional[Tuple[Tuple[int, ...], Report]] = None
+
+
+def version() -> Tuple[int, ...]:
+    """
+    Gets the current version of the tables the report is built from.
+
+    Returns:
+        The epoch and the generations of the tables.
+    """
+    return (generations.epoch(),) + tuple(
+        generations.current(table) for table in TABLES
+    )
+
+
+def _select(
+    keys: np.ndarray, totals: np.ndarray, depth: int
+) -> List[Tuple[Tuple[int, ...], List[Tuple[int, int]]]]:
+    """
+    Picks the top items of every group.
+
+    Args:
+        keys: The year, spring flag, scope and item of every total, sorted
+            by them, as analytics.group_by gives.
+        totals: The summed quantity of every key.
+        depth: The number of items to pick per group.
+
+    Returns:
+        The year, spring flag and scope of every group along with its top
+        item IDs and quantities, the larger quantity and then the lower ID
+        first.
+    """
+    starts = np.flatnonzero(np.any(np.diff(keys[:, :3], axis=0) != 0, axis=1)) + 1
+    selected = []
+    for segment in np.split(np.arange(len(keys)), starts):
+        if segment.size == 0:
+            continue
+        best = heapq.nlargest(
+            depth, zip(totals[segment].tolist(), (-keys[segment, 3]).tolist())
+        )
+        selected.append(
+            (
+                tuple(keys[segment[0], :3].tolist()),
+                [(-negated_id, int(quantity)) for quantity, negated_id in best],
+            )
+        )
+    return selected
+
+
+def _lookup(keys: np.ndarray, values: np.ndarray, wanted: np.ndarray) -> np.ndarray:
+    """
+    Looks up the values of many keys at once.
+
+    Args:
+        keys: The keys, in any order.
+        values: The value of every key.
+        wanted: The keys to look up.
+
+    Returns:
+        The value of every wanted key, or -1 for those that are missing.
+    """
+    if keys.size == 0:
+        return np.full(len(wanted), -1, dtype=np.int64)
+    order = np.argsort(keys)
+    positions = order[
+        np.minimum(np.searchsorted(keys, wanted, sorter=order), len(keys) - 1)
+    ]
+    return np.where(keys[positions] == wanted, values[positions], -1)
+
+
+def _columns(
+    dataset: analytics.Dataset, by_id: Dict[int, items.Item]
+) -> Dict[str, np.ndarray]:
+    """
+    Gets the columns the tallies of catalogued items are ranked by.
+
+    Args:
+        dataset: The arrays of the events and event items.
+        by_id: The items of the catalog by their ID.
+
+    Returns:
+        The item ID, quantity and the year, spring flag and site ID of the
+        event of every tally, by their name.
+    """
+    tallies, events = dataset.tallies, dataset.events
+    known = np.isin(tallies.item_ids, np.fromiter(by_id, dtype=np.int64))
+    item_events = tallies.events[known]
+    return {
+        "item_ids": tallies.item_ids[known],
+        "quantities": tallies.quantities[known],
+        "years": events.years[item_events],
+        "spring": events.spring[item_events].astype(np.int64),
+        "site_ids": events.site_ids[item_events],
+    }
+
+
+def _county_codes(
+    site_list: List[sites.Site], site_ids: np.ndarray
+) -> Tuple[List[str], np.ndarray]:
+    """
+    Gets the counties of some sites as codes.
+
+    Args:
+        site_list: The sites.
+        site_ids: The site IDs to look up.
+
+    Returns:
+        The counties in sorted order, and the position in them of the county
+        of every site ID, or -1 for sites missing from the site list.
+    """
+    counties = sorted({site["county"] for site in site_list})
+    codes_by_county = {county: code for code, county in enumerate(counties)}
+    return counties, _lookup(
+        np.array([site["site_id"] for site in site_list], dtype=np.int64),
+        np.array([codes_by_county[site["county"]] for site in site_list]),
+        site_ids,
+    )
+
+
+def _rank(
+    columns: Dict[str, np.ndarray],
+    codes: np.ndarray,
+    scope: str,
+    name: _Namer,
+    by_id: Dict[int, items.Item],
+    depth: int,
+) -> Report:
+    """
+    Picks the top items of every season within one scope.
+
+    Args:
+        columns: The columns of the tallies, as _columns gives.
+        codes: The code of the county or site of every tally within the
+            scope, or -1 for tallies left out of it.
+        scope: The name of the scope.
+        name: The function giving the county or site ID of a code.
+        by_id: The items of the catalog by their ID.
+        depth: The number of items to keep per season.
+
+    Returns:
+        The top items of every season and county or site of the scope.
+    """
+    mask = codes >= 0
+    keys, groups = analytics.group_by(
+        columns["years"][mask],
+        columns["spring"][mask],
+        codes[mask],
+        columns["item_ids"][mask],
+    )
+    totals = np.bincount(
+        groups, weights=columns["quantities"][mask], minlength=len(keys)
+    )
+    ranked: Report = {}
+    for (year, is_spring, code), best in _select(keys, totals, depth):
+        ranked[(year, "Spring" if is_spring else "Fall", scope, name(code))] = [
+            dict(by_id[item_id], quantity=quantity) for item_id, quantity in best
+        ]
+    return ranked
+
+
+def build(
+    dataset: analytics.Dataset,
+    catalog: List[items.Item],
+    site_list: List[sites.Site],
+    depth: int,
+) -> Report:
+    """
+    Builds the top items of every season, county and site.
+
+    Tallies of items missing from the catalog are left out, as are sites
+    missing from the site list when picking by county.
+
+    Args:
+        dataset: The arrays of the events and event items.
+        catalog: The items catalog.
+        site_list: The sites.
+        depth: The number of items to keep per season and scope.
+
+    Returns:
+        The report.
+    """
+    by_id = {item["item_id"]: item for item in catalog}
+    columns = _columns(dataset, by_id)
+    counties, county_codes = _county_codes(site_list, columns["site_ids"])
+    scopes: Dict[str, Tuple[np.ndarray, _Namer]] = {
+        "all": (np.zeros(len(columns["item_ids"]), dtype=np.int64), lambda code: None),
+        "county": (county_codes, lambda code: counties[code]),
+        "site": (columns["site_ids"], lambda code: code),
+    }
+    report: Report = {}
+    for scope, (codes, name) in scopes.items():
+        report.update(_rank(columns, codes, scope, name, by_id, depth))
+    return report
+
+
+def cached(current: Tuple[int, ...]) -> Optional[Report]:
+    """
+    Gets the report of a version if it has been built already.
+
+    Args:
+        current: The version of the tables.
+
+    Returns:
+        The report, or None if it has to be built.
+    """
+    with _LOCK:
+        if _REPORT is None or _REPORT[0] != current:
+            return None
+        return _REPORT[1]
+
+
+def keep(current: Tuple[int, ...], report: Report) -> Report:
+    """
+    Keeps a report built at a version for the next calls.
+
+    Args:
+        current: The version of the tables the report was built at.
+        report: The report.
+
+    Returns:
+        The report.
+    """
+    global _REPORT  # pylint: disable=global-statement
+    with _LOCK:
+        _REPORT = (current, report)
+    return report
+
+
+def load() -> Report:
+    """
+    Gets the report of the current version, building it if needed.
+
+    The report is built without holding the lock, as analytics.load does.
+
+    Returns:
+        The report.
+    """
+    current = version()
+    report = cached(current)
+    if report is None:
+        report = keep(current, build(analytics.load(), items.get(), sites.get(), DEPTH))
+    return report
+
+
+async def load_async() -> Report:
+    """
+    Gets the report of the current version on the async connection pool.
+
+    Returns:
+        The report.
+    """
+    current = version()
+    report = cached(current)
+    if report is None:
+        dataset = await analytics.load_async()
+        catalog, site_list = await items.get_async(), await sites.get_async()
+        # Ranking the items is CPU bound, so it is kept off the event loop.
+        report = keep(
+            current,
+            await asyncio.get_running_loop().run_in_executor(
+                None, build, dataset, catalog, site_list, DEPTH
+            ),
+        )
+    return report
+
+
+def top(
+    report: Report,
+    volunteer_year: int,
+    volunteer_season: str,
+    county: Optional[str],
+    site_id: Optional[int],
+    limit: int,
+) -> List[Dict[str, Any]]:
+    """
+    Gets the top items of a season from a report.
+
+    Args:
+        report: The report.
+        volunteer_year: The year of the season.
+        volunteer_season: The season.
+        county: The county to pick within, or None.
+        site_id: The ID of the site to pick within, or None.
+        limit: The number of items to return, of which at most DEPTH are
+            kept.
+
+    Returns:
+        The items collected the most, with their quantity, the largest
+        first.
+    """
+    key: ReportKey
+    if site_id is not None:
+        key = (volunteer_year, volunteer_season, "site", site_id)
+    elif county is not None:
+        key = (volunteer_year, volunteer_season, "county", county)
+    else:
+        key = (volunteer_year, volunteer_season, "all", None)
+    return report.get(key, [])[: max(limit, 0)]
@@ -0,0 +1,10 @@
+#!/bin/sh
+# Starts the app under uwsgi, or under uvicorn when COA_SERVER=asgi.
+set -e
+
+if [ "$COA_SERVER" = "asgi" ]; then
+    cp /app/deployment/asgi/app.conf /etc/nginx/conf.d/app.conf
+    cp /app/deployment/asgi/supervisord.ini /etc/supervisor.d/supervisord.ini
+fi
+
+exec /usr/bin/supervisord
@@ -0,0 +1,17 @@
+-- Keeps the total quantity of trash items collected at an event on the event
+-- itself, so listing events no longer sums coa_data.event_items every time.
+-- The total is maintained by the event item writes of the app and can be
+-- recounted with `flask reconcile-trash-counts`.
+
+ALTER TABLE coa_data.event
+    ADD COLUMN trash_items_cnt INT NOT NULL DEFAULT 0;
+
+UPDATE coa_data.event AS cde
+LEFT JOIN (
+    SELECT
+        event_id,
+        SUM(quantity) AS quantity
+    FROM coa_data.event_items
+    GROUP BY event_id
+) AS cei ON cei.event_id = cde.event_id
+SET cde.trash_items_cnt = IFNULL(cei.quantity, 0);
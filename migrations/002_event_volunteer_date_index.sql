@@ -0,0 +1,6 @@
+-- Lets the events of a season or of any range of dates be found with an index
+-- range scan on the stored volunteer_date, rather than by comparing the
+-- volunteer_year and volunteer_season derived from it row by row.
+
+ALTER TABLE coa_data.event
+    ADD INDEX event_volunteer_date_site_idx (volunteer_date, site_id);
@@ -0,0 +1,39 @@
+-- Keeps the quantity and count of the event items summed up by the year,
+-- season and site of their event and the material and category of their
+-- item, so the /stats routes never scan the event items. The rollups are
+-- maintained by the event, item and event item writes of the app and can be
+-- rebuilt with `flask rebuild-rollups`.
+
+CREATE TABLE coa_data.item_rollup(
+    volunteer_year INT NOT NULL,
+    volunteer_season VARCHAR(6) NOT NULL,
+    site_id INT NOT NULL,
+    material VARCHAR(255) NOT NULL,
+    category VARCHAR(255) NOT NULL,
+    quantity BIGINT NOT NULL DEFAULT 0,
+    event_items_cnt INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (volunteer_year, volunteer_season, site_id, material, category),
+    INDEX item_rollup_site_idx (site_id, volunteer_year)
+);
+
+INSERT INTO coa_data.item_rollup(
+    volunteer_year,
+    volunteer_season,
+    site_id,
+    material,
+    category,
+    quantity,
+    event_items_cnt
+)
+SELECT
+    YEAR(cde.volunteer_date) AS volunteer_year,
+    IF(MONTH(cde.volunteer_date) < 7, 'Spring', 'Fall') AS volunteer_season,
+    cde.site_id,
+    cdi.material,
+    cdi.category,
+    SUM(cdei.quantity),
+    COUNT(*)
+FROM coa_data.event_items AS cdei
+JOIN coa_data.event AS cde ON cde.event_id = cdei.event_id
+JOIN coa_data.item AS cdi ON cdi.item_id = cdei.item_id
+GROUP BY 1, 2, 3, 4, 5;
@@ -0,0 +1,289 @@
+"""
+The fixtures shared by the tests.
+
+The tests run the app against the SQLite stand-in database of the
+benchmarks. It is seeded once per session and copied for every test, so
+each test starts from the same rows.
+"""
+
+import os
+import shutil
+import tempfile
+
+import pymysql
+import pytest
+
+from coa_flask_app import APP, aio_accessor, db_accessor, generations
+
+from benchmarks import sqlite_db
+
+
+def pytest_configure() -> None:
+    """
+    Points the app at settings of its own before any test runs.
+    """
+    os.environ.setdefault("SECRET_KEY", "test-secret-key-" + "x" * 32)
+    os.environ.setdefault(
+        "COA_GENERATION_FILE",
+        os.path.join(tempfile.gettempdir(), "coa_test_generations"),
+    )
+
+
+@pytest.fixture(name="seeded", scope="session")
+def fixture_seeded(tmp_path_factory) -> str:
+    """
+    Seeds a database for the whole session.
+
+    Returns:
+        The directory holding the seeded database.
+    """
+    directory = str(tmp_path_factory.mktemp("seeded"))
+    sqlite_db.seed(directory, 3, 20, 5)
+    return directory
+
+
+@pytest.fixture(name="database")
+def fixture_database(seeded, tmp_path) -> str:
+    """
+    Connects the app to a fresh copy of the seeded database.
+
+    Every table is marked as changed, so nothing cached from an earlier
+    test is served.
+
+    Returns:
+        The directory holding the copy.
+    """
+    for schema in sqlite_db.SCHEMAS:
+        shutil.copy(os.path.join(seeded, f"{schema}.db"), tmp_path)
+    directory = str(tmp_path)
+    db_accessor.set_connect(sqlite_db.connector(directory))
+    for table in generations.TABLES:
+        generations.bump(table)
+    return directory
+
+
+@pytest.fixture(name="client")
+def fixture_client(database):
+    """
+    Gets a test client of the flask app on a fresh database.
+
+    Returns:
+        The test client.
+    """
+    _ = database
+    return APP.test_client()
+
+
+@pytest.fixture(name="rows")
+def fixture_rows(database):
+    """
+    Gets a function running a query against the fresh database outside of
+    the app.
+
+    Returns:
+        A function taking the SQLite query and its parameters and returning
+        every row of the result.
+    """
+
+    def _rows(statement: str, *args):
+        connection = sqlite_db.SQLiteConnection(database).connection
+        try:
+            return connection.execute(statement, args).fetchall()
+        finally:
+            connection.close()
+
+    return _rows
+
+
+class AsyncSQLiteCursor:
+    """
+    The asyncio counterpart of the SQLite cursor, with the parts of
+    aiomysql's API used by the app.
+    """
+
+    def __init__(self, cursor: sqlite_db.SQLiteCursor) -> None:
+        """
+        The constructor of the AsyncSQLiteCursor class.
+
+        Args:
+            cursor: The SQLite cursor to run the queries on.
+        """
+        self.cursor = cursor
+
+    @property
+    def description(self):
+        """
+        Gets the columns of the last query.
+
+        Returns:
+            The description of every column, or None if it read no rows.
+        """
+        return self.cursor.description
+
+    @property
+    def rowcount(self) -> int:
+        """
+        Gets the number of rows the last query affected.
+
+        Returns:
+            The number of rows.
+        """
+        return self.cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        """
+        Gets the ID of the last row inserted.
+
+        Returns:
+            The ID of the row.
+        """
+        return self.cursor.lastrowid
+
+    async def execute(self, query: str, args=None) -> int:
+        """
+        Executes a query.
+
+        Args:
+            query: The query to execute.
+            args: The parameters of the query.
+
+        Returns:
+            The number of affected rows.
+        """
+        return self.cursor.execute(query, args)
+
+    async def executemany(self, query: str, args) -> int:
+        """
+        Executes a query for every set of parameters.
+
+        Args:
+            query: The query to execute.
+            args: The sets of parameters of the query.
+
+        Returns:
+            The number of affected rows.
+        """
+        return self.cursor.executemany(query, args)
+
+    async def fetchone(self):
+        """
+        Fetches the next row.
+
+        Returns:
+            The next row or None when there are no more.
+        """
+        return self.cursor.fetchone()
+
+    async def fetchall(self):
+        """
+        Fetches the remaining rows.
+
+        Returns:
+            The remaining rows.
+        """
+        return self.cursor.fetchall()
+
+    async def close(self) -> None:
+        """
+        Closes the cursor.
+        """
+        self.cursor.close()
+
+
+class AsyncSQLiteConnection:
+    """
+    The asyncio counterpart of the SQLite connection.
+    """
+
+    def __init__(self, directory: str) -> None:
+        """
+        The constructor of the AsyncSQLiteConnection class.
+
+        Args:
+            directory: The directory holding a file per schema.
+        """
+        self.connection = sqlite_db.SQLiteConnection(directory)
+
+    async def cursor(self, cursor_class) -> AsyncSQLiteCursor:
+        """
+        Opens a cursor.
+
+        Args:
+            cursor_class: The aiomysql cursor class asked for.
+
+        Returns:
+            A cursor returning dictionaries for the dictionary cursor classes.
+        """
+        driver = aio_accessor._driver()  # pylint: disable=protected-access
+        as_dicts = issubclass(cursor_class, (driver.DictCursor, driver.SSDictCursor))
+        return AsyncSQLiteCursor(
+            self.connection.cursor(pymysql.cursors.DictCursor if as_dicts else None)
+        )
+
+    async def commit(self) -> None:
+        """
+        Commits the transaction.
+        """
+        self.connection.commit()
+
+    async def rollback(self) -> None:
+        """
+        Rolls the transaction back.
+        """
+        self.connection.rollback()
+
+    def close(self) -> None:
+        """
+        Closes the connection.
+        """
+        self.connection.close()
+
+
+class AsyncSQLitePool:
+    """
+    A pool with the parts of aiomysql's API used by the app, opening a new
+    connection for every checkout.
+    """
+
+    size = freesize = minsize = maxsize = 1
+
+    def __init__(self, directory: str) -> None:
+        """
+        The constructor of the AsyncSQLitePool class.
+
+        Args:
+            directory: The directory holding the database.
+        """
+        self.directory = directory
+
+    async def acquire(self) -> AsyncSQLiteConnection:
+        """
+        Checks a connection out.
+
+        Returns:
+            A new connection.
+        """
+        return AsyncSQLiteConnection(self.directory)
+
+    @staticmethod
+    def release(connection: AsyncSQLiteConnection) -> None:
+        """
+        Returns a connection, which is closed.
+
+        Args:
+            connection: The connection.
+        """
+        connection.close()
+
+
+@pytest.fixture(name="aio_database")
+def fixture_aio_database(database, monkeypatch) -> str:
+    """
+    Connects the ASGI app to the same fresh copy of the seeded database.
+
+    Returns:
+        The directory holding the copy.
+    """
+    monkeypatch.setattr(aio_accessor, "_POOL", AsyncSQLitePool(database))
+    return database
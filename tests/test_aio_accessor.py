@@ -0,0 +1,184 @@
+"""
+The tests of the database access of the ASGI app.
+"""
+
+import asyncio
+import time
+
+import pymysql
+import pytest
+
+from coa_flask_app import db_accessor
+from coa_flask_app.aio_accessor import AsyncAccessor
+
+
+class FailingCursor:
+    """
+    A cursor whose queries fail with an error.
+    """
+
+    def __init__(self, error: Exception) -> None:
+        """
+        The constructor of the FailingCursor class.
+
+        Args:
+            error: The error every query fails with.
+        """
+        self.error = error
+
+    async def execute(self, query: str, args=None) -> int:
+        """
+        Fails to run a query.
+
+        Args:
+            query: The query.
+            args: The parameters of the query.
+
+        Raises:
+            Error: The error the cursor was made with.
+        """
+        raise self.error
+
+    async def close(self) -> None:
+        """
+        Closes the cursor.
+        """
+
+
+class FailingConnection:
+    """
+    A connection handing out failing cursors.
+    """
+
+    def __init__(self, error: Exception) -> None:
+        """
+        The constructor of the FailingConnection class.
+
+        Args:
+            error: The error every query fails with.
+        """
+        self.error = error
+        self.closed = False
+
+    async def cursor(self, cursor_class) -> FailingCursor:
+        """
+        Opens a cursor.
+
+        Args:
+            cursor_class: The aiomysql cursor class asked for.
+
+        Returns:
+            A failing cursor.
+        """
+        _ = cursor_class
+        return FailingCursor(self.error)
+
+    async def rollback(self) -> None:
+        """
+        Rolls the transaction back.
+        """
+
+    def close(self) -> None:
+        """
+        Closes the connection.
+        """
+        self.closed = True
+
+
+class ReplicaPool:
+    """
+    The pool of a replica holding a single connection.
+    """
+
+    def __init__(self, connection: FailingConnection) -> None:
+        """
+        The constructor of the ReplicaPool class.
+
+        Args:
+            connection: The connection to hand out.
+        """
+        self.connection = connection
+        self.released = 0
+
+    async def acquire(self) -> FailingConnection:
+        """
+        Checks the connection out.
+
+        Returns:
+            The connection.
+        """
+        return self.connection
+
+    def release(self, connection: FailingConnection) -> None:
+        """
+        Returns the connection.
+
+        Args:
+            connection: The connection.
+        """
+        assert connection is self.connection
+        self.released += 1
+
+
+async def _read() -> None:
+    """
+    Runs a read only query, which may be sent to a replica.
+    """
+    async with AsyncAccessor(join=False, read_only=True) as db_handle:
+        await db_handle.execute("SELECT 1")
+
+
+def _replica(monkeypatch, error: Exception):
+    """
+    Sets up a single replica whose queries fail, without a lag check due.
+
+    Args:
+        monkeypatch: The pytest monkeypatch fixture.
+        error: The error every query fails with.
+
+    Returns:
+        The replica and its pool.
+    """
+    replica = db_accessor.Replica("replica-1")
+    replica.health.checked = time.monotonic()
+    pool = ReplicaPool(FailingConnection(error))
+    monkeypatch.setattr("coa_flask_app.db_accessor._REPLICAS", [replica])
+    monkeypatch.setattr(
+        "coa_flask_app.aio_accessor._REPLICA_POOLS", {replica.address: pool}
+    )
+    return replica, pool
+
+
+def test_lost_replica_is_marked_down(monkeypatch):
+    """
+    A replica whose connection is lost mid read is marked down, the same as
+    with Accessor, and its connection is closed.
+    """
+    replica, pool = _replica(
+        monkeypatch, pymysql.err.OperationalError(2013, "Lost connection")
+    )
+
+    with pytest.raises(pymysql.err.OperationalError):
+        asyncio.run(_read())
+
+    assert pool.connection.closed
+    assert pool.released == 1
+    assert not replica.health.is_up()
+    assert replica.health.failures == 1
+
+
+def test_failed_query_keeps_replica_up(monkeypatch):
+    """
+    A query failing for its own reasons leaves the replica and its
+    connection alone.
+    """
+    replica, pool = _replica(
+        monkeypatch, pymysql.err.ProgrammingError(1064, "Syntax error")
+    )
+
+    with pytest.raises(pymysql.err.ProgrammingError):
+        asyncio.run(_read())
+
+    assert not pool.connection.closed
+    assert pool.released == 1
+    assert replica.health.is_up()
@@ -0,0 +1,212 @@
+"""
+The tests of the yearly trends computed over the events.
+"""
+
+from collections import defaultdict
+from datetime import date
+
+import numpy as np
+import pytest
+from starlette.testclient import TestClient
+
+from coa_flask_app import analytics
+from coa_flask_app.asgi import APP
+
+EVENTS = [
+    (1, 1, date(2020, 4, 1), 10, 2.0, 5.0, 2),
+    (2, 1, date(2020, 10, 1), None, 1.0, None, 1),
+    (3, 2, date(2021, 4, 1), 5, None, 3.0, 3),
+]
+
+EVENT_ITEMS = [(1, 100, 20), (1, 101, 10), (2, 100, 6), (3, 101, 4), (9, 100, 50)]
+
+
+@pytest.fixture(name="dataset")
+def fixture_dataset() -> analytics.Dataset:
+    """
+    Builds a dataset of three events, one of them missing its volunteers and
+    another its distance, and a tally of an event that does not exist.
+
+    Returns:
+        The dataset.
+    """
+    return analytics.Dataset(EVENTS, EVENT_ITEMS)
+
+
+def test_group_by():
+    """
+    Rows are grouped by all of their keys, the groups in sorted order.
+    """
+    keys, groups = analytics.group_by(
+        np.array([2, 1, 2, 1, 3]), np.array([5, 5, 5, 6, 5])
+    )
+
+    assert keys.tolist() == [[1, 5], [1, 6], [2, 5], [3, 5]]
+    assert groups.tolist() == [2, 0, 2, 1, 3]
+
+
+def test_group_by_nothing():
+    """
+    No rows make no groups.
+    """
+    keys, groups = analytics.group_by(np.array([], dtype=np.int64))
+
+    assert len(keys) == 0
+    assert len(groups) == 0
+
+
+def test_dataset_drops_unknown_events(dataset):
+    """
+    The tallies of events that do not exist are left out of the totals.
+    """
+    assert dataset.events.quantities.tolist() == [30, 6, 4]
+    assert len(dataset.tallies.item_ids) == 4
+
+
+def test_site_trends(dataset):
+    """
+    The rates of a site only count the events where both measures are known.
+    """
+    assert analytics.site_trends(dataset, None, None, None) == [
+        {
+            "site_id": 1,
+            "year": 2020,
+            "events_cnt": 2,
+            "quantity": 36,
+            "volunteer_cnt": 10,
+            "walking_distance": 3.0,
+            "trash_weight": 5.0,
+            "trashbag_cnt": 3.0,
+            "per_volunteer": 3.0,
+            "per_mile": 12.0,
+            "weight_per_bag": 2.5,
+        },
+        {
+            "site_id": 2,
+            "year": 2021,
+            "events_cnt": 1,
+            "quantity": 4,
+            "volunteer_cnt": 5,
+            "walking_distance": 0.0,
+            "trash_weight": 3.0,
+            "trashbag_cnt": 3.0,
+            "per_volunteer": 0.8,
+            "per_mile": None,
+            "weight_per_bag": 1.0,
+        },
+    ]
+
+
+def test_site_trends_filters(dataset):
+    """
+    The site trends can be narrowed to a season, a site or an item.
+    """
+    spring = analytics.site_trends(dataset, None, "Spring", None)
+    assert [(row["site_id"], row["quantity"]) for row in spring] == [(1, 30), (2, 4)]
+
+    site = analytics.site_trends(dataset, 2, None, None)
+    assert [(row["site_id"], row["year"]) for row in site] == [(2, 2021)]
+
+    item = analytics.site_trends(dataset, None, None, 100)
+    assert [row["quantity"] for row in item] == [26, 0]
+    assert item[0]["per_volunteer"] == 2.0
+
+
+def test_item_trends(dataset):
+    """
+    The rates of an item are taken over every event of the year, and an
+    event counts once per item however many tallies it has.
+    """
+    assert analytics.item_trends(dataset, None, None, None) == [
+        {
+            "item_id": 100,
+            "year": 2020,
+            "events_cnt": 2,
+            "quantity": 26,
+            "per_volunteer": 2.0,
+            "per_mile": 8.6667,
+        },
+        {
+            "item_id": 101,
+            "year": 2020,
+            "events_cnt": 1,
+            "quantity": 10,
+            "per_volunteer": 1.0,
+            "per_mile": 3.3333,
+        },
+        {
+            "item_id": 101,
+            "year": 2021,
+            "events_cnt": 1,
+            "quantity": 4,
+            "per_volunteer": 0.8,
+            "per_mile": None,
+        },
+    ]
+    assert [row["year"] for row in analytics.item_trends(dataset, None, None, 101)] == [
+        2020,
+        2021,
+    ]
+
+
+def test_trends_route(client, rows):
+    """
+    The trends route totals every site and year of the seeded events.
+    """
+    expected = defaultdict(lambda: [0, 0])
+    for site_id, volunteer_date, quantity in rows(
+        "SELECT event.site_id, event.volunteer_date, SUM(event_items.quantity)"
+        " FROM coa_data.event LEFT JOIN coa_data.event_items"
+        " ON event_items.event_id = event.event_id GROUP BY event.event_id"
+    ):
+        totals = expected[(site_id, date.fromisoformat(str(volunteer_date)).year)]
+        totals[0] += 1
+        totals[1] += quantity or 0
+
+    trends = client.get("/stats/trends").get_json()["trends"]
+
+    assert {
+        (row["site_id"], row["year"]): [row["events_cnt"], row["quantity"]]
+        for row in trends
+    } == expected
+    assert client.get("/stats/trends?by=county").status_code == 400
+
+
+def test_trends_follow_writes(client):
+    """
+    The trends are computed again once the event items change.
+    """
+    before = client.get("/stats/trends?by=item&item_id=1").get_json()["trends"]
+    response = client.post(
+        "/event-items/add",
+        json={"event_id": 1, "item_id": 1, "quantity": 500, "updated_by": "x"},
+    )
+    assert response.status_code == 200
+
+    after = client.get("/stats/trends?by=item&item_id=1").get_json()["trends"]
+
+    assert sum(row["quantity"] for row in after) == 500 + sum(
+        row["quantity"] for row in before
+    )
+
+
+@pytest.mark.parametrize(
+    "path",
+    [
+        "/stats/trends?volunteer_season=Summer",
+        "/stats/trends?by=item&volunteer_season=spring",
+        "/stats/top-items?volunteer_year=2020&volunteer_season=Winter",
+    ],
+)
+def test_unknown_seasons_are_rejected(client, aio_database, path):
+    """
+    A season other than Spring or Fall is rejected by both apps, rather than
+    taken as Fall or matching nothing.
+    """
+    _ = aio_database
+
+    response = client.get(path)
+
+    assert response.status_code == 400
+    assert b"Spring, Fall" in response.data
+    assert TestClient(APP).get(path).status_code == 400
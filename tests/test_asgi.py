@@ -0,0 +1,109 @@
+"""
+The tests of the ASGI entrance to the app.
+"""
+
+import pytest
+from starlette.testclient import TestClient
+
+from coa_flask_app.asgi import APP
+
+from benchmarks import sqlite_db
+
+
+@pytest.fixture(name="asgi_client")
+def fixture_asgi_client(aio_database):
+    """
+    Gets a test client of the ASGI app on a fresh database.
+
+    The client is not entered, so the pool is not closed after the test.
+
+    Returns:
+        The test client.
+    """
+    _ = aio_database
+    return TestClient(APP)
+
+
+@pytest.mark.parametrize(
+    "path",
+    [
+        "/items",
+        "/sites",
+        "/sites/near?lat=39.5&long=-74.5&k=3",
+        "/events?volunteer_year={year}&volunteer_season=Fall",
+        "/events?volunteer_year={year}&volunteer_season=Spring&limit=3",
+        "/event-items?event_id=5",
+        "/stats/seasons",
+        "/stats/trends?by=item&volunteer_season=Fall",
+        "/stats/top-items?volunteer_year={year}&volunteer_season=Spring&n=3",
+    ],
+)
+def test_same_responses_as_flask(asgi_client, client, rows, path):
+    """
+    The ASGI app answers with the same bodies and ETags as the flask app.
+    """
+    ((year,),) = rows("SELECT MAX(strftime('%Y', volunteer_date)) FROM coa_data.event")
+    path = path.format(year=year)
+
+    served = asgi_client.get(path, headers={"Accept-Encoding": "identity"})
+    expected = client.get(path)
+
+    assert served.status_code == expected.status_code == 200
+    assert served.content == expected.data
+    assert served.headers.get("etag") == expected.headers.get("etag")
+
+
+def test_conditional_get(asgi_client):
+    """
+    A GET with the current ETag is answered with 304 and no body.
+    """
+    etag = asgi_client.get("/items").headers["etag"]
+
+    response = asgi_client.get("/items", headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert not response.content
+
+
+def test_writes_are_committed(asgi_client, rows):
+    """
+    A write is committed and shows up in the next read.
+    """
+    response = asgi_client.post(
+        "/event-items/add",
+        json={"event_id": 5, "item_id": 3, "quantity": 7, "updated_by": "asgi"},
+    )
+
+    assert response.status_code == 200
+    assert rows(
+        "SELECT event_id, item_id, quantity FROM coa_data.event_items"
+        " WHERE updated_by = 'asgi'"
+    ) == [(5, 3, 7)]
+    records = asgi_client.get("/event-items?event_id=5").json()["event_items"]
+    assert any(record["updated_by"] == "asgi" for record in records)
+
+
+def test_errors(asgi_client):
+    """
+    Bad requests and failed logins are answered with their HTTP errors.
+    """
+    bad = asgi_client.post("/event-items/bulk", json={"operations": [{"op": "x"}]})
+    denied = asgi_client.post(
+        "/login", json={"username": sqlite_db.USERNAME, "password": "wrong"}
+    )
+
+    assert bad.status_code == 400
+    assert denied.status_code == 401
+    assert asgi_client.get("/missing").status_code == 404
+
+
+def test_login(asgi_client):
+    """
+    The seeded user can log in.
+    """
+    response = asgi_client.post(
+        "/login", json={"username": sqlite_db.USERNAME, "password": sqlite_db.PASSWORD}
+    )
+
+    assert response.status_code == 200
+    assert response.json()["token"]
@@ -0,0 +1,227 @@
+"""
+The tests of the logins, the verified tokens and the limit on the password
+hashes checked at once.
+"""
+
+import fcntl
+import multiprocessing
+import os
+import threading
+import time
+from typing import Any, List, Tuple
+
+import jwt
+import pytest
+from werkzeug.exceptions import ServiceUnavailable, Unauthorized
+from werkzeug.security import generate_password_hash
+
+from coa_flask_app import APP, auth
+from coa_flask_app.auth import HashLimiter, HashSettings, TokenCache
+
+from benchmarks import sqlite_db
+
+_HASH = generate_password_hash("secret", method="pbkdf2:sha256:1000")
+
+
+def _limiter(
+    path: str, max_workers: int = 1, max_queue: int = 0, timeout: float = 0.1
+) -> HashLimiter:
+    """
+    Creates a limiter, with a short timeout by default.
+
+    Args:
+        path: The file whose locks are shared.
+        max_workers: The number of hashes checked at once.
+        max_queue: The number of checks allowed to wait.
+        timeout: The number of seconds a check may wait.
+
+    Returns:
+        The limiter.
+    """
+    return HashLimiter(HashSettings(max_workers, max_queue, timeout, path))
+
+
+def _hold_places(path: str, count: int, held, done) -> None:
+    """
+    Holds the first places of a limiter in another process until told to
+    stop.
+
+    Args:
+        path: The file whose locks are shared.
+        count: The number of places to hold.
+        held: The event set once the places are held.
+        done: The event to wait for before giving them back.
+    """
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    fcntl.lockf(fd, fcntl.LOCK_EX, count, 0)
+    held.set()
+    done.wait(10)
+
+
+@pytest.fixture(name="slow_hash")
+def fixture_slow_hash(monkeypatch):
+    """
+    Makes the hash checks block until they are let through.
+
+    Returns:
+        The event set once a check is running and the event letting the
+        checks through.
+    """
+    running, proceed = threading.Event(), threading.Event()
+
+    def _check(pwhash: str, password: str) -> bool:
+        running.set()
+        assert proceed.wait(10)
+        return pwhash == password
+
+    monkeypatch.setattr(auth, "check_password_hash", _check)
+    yield running, proceed
+    proceed.set()
+
+
+def _check_in_thread(limiter: HashLimiter) -> Tuple[threading.Thread, List[Any]]:
+    """
+    Checks a hash on another thread.
+
+    Args:
+        limiter: The limiter to check it under.
+
+    Returns:
+        The thread and the list the result is put in.
+    """
+    results: List[Any] = []
+    thread = threading.Thread(target=lambda: results.append(limiter.check("a", "a")))
+    thread.start()
+    return thread, results
+
+
+def test_login(client):
+    """
+    The seeded user gets a token for the right password and nothing else
+    does.
+    """
+    response = client.post(
+        "/login", json={"username": sqlite_db.USERNAME, "password": sqlite_db.PASSWORD}
+    )
+
+    assert response.status_code == 200
+    claims = jwt.decode(
+        response.get_json()["token"], os.environ["SECRET_KEY"], algorithms=["HS256"]
+    )
+    assert claims["sub"] == sqlite_db.USERNAME
+    for username, password in [(sqlite_db.USERNAME, "wrong"), ("nobody", "x")]:
+        response = client.post(
+            "/login", json={"username": username, "password": password}
+        )
+        assert response.status_code == 401
+
+
+def test_verified_tokens_are_cached(client, monkeypatch):
+    """
+    A token is only decoded the first time it is seen, and a bad token is
+    turned away.
+    """
+    cache = TokenCache(8)
+    monkeypatch.setattr(auth, "TOKEN_CACHE", cache)
+    protected = auth.verify_token(lambda: auth.g.token_claims["sub"])
+    token = client.post(
+        "/login", json={"username": sqlite_db.USERNAME, "password": sqlite_db.PASSWORD}
+    ).get_json()["token"]
+
+    for _ in range(3):
+        with APP.test_request_context(headers={"Authorization": f"Bearer {token}"}):
+            assert protected() == sqlite_db.USERNAME
+    with APP.test_request_context(headers={"Authorization": "Bearer nonsense"}):
+        with pytest.raises(Unauthorized):
+            protected()
+
+    assert cache.stats() == {"size": 1, "max_size": 8, "hits": 2, "misses": 2}
+
+
+def test_token_cache_expiry_and_size():
+    """
+    Expired tokens are dropped, tokens without an expiry are not kept, and
+    the least recently used token makes way for a new one.
+    """
+    cache = TokenCache(2)
+    cache.put("old", {"exp": time.time() - 1})
+    cache.put("forever", {"sub": "x"})
+    cache.put("a", {"exp": time.time() + 60})
+    cache.put("b", {"exp": time.time() + 60})
+    assert cache.get("a") is not None
+    cache.put("c", {"exp": time.time() + 60})
+
+    assert cache.get("old") is None
+    assert cache.get("forever") is None
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+
+
+def test_limiter_checks_hashes(tmp_path):
+    """
+    Hashes are checked and their places given back.
+    """
+    limiter = _limiter(str(tmp_path / "places"))
+
+    assert limiter.check(_HASH, "secret")
+    assert not limiter.check(_HASH, "wrong")
+    assert limiter.stats()["pending"] == 0
+
+
+def test_limiter_waits_for_a_turn(tmp_path, slow_hash):
+    """
+    A check with a place to wait in runs once the check before it is done.
+    """
+    running, proceed = slow_hash
+    limiter = _limiter(str(tmp_path / "places"), max_queue=1, timeout=5.0)
+    first, first_result = _check_in_thread(limiter)
+    assert running.wait(10)
+    second, second_result = _check_in_thread(limiter)
+
+    proceed.set()
+    first.join(10)
+    second.join(10)
+
+    assert first_result == second_result == [True]
+    assert limiter.stats()["rejected"] == 0
+
+
+def test_limiter_turns_away_checks(tmp_path, slow_hash):
+    """
+    A check with no place to wait in is turned away.
+    """
+    running, proceed = slow_hash
+    limiter = _limiter(str(tmp_path / "places"))
+    first, first_result = _check_in_thread(limiter)
+    assert running.wait(10)
+
+    with pytest.raises(ServiceUnavailable):
+        limiter.check("a", "a")
+    proceed.set()
+    first.join(10)
+
+    assert first_result == [True]
+    assert limiter.stats()["rejected"] == 1
+
+
+def test_limit_is_shared_by_processes(tmp_path):
+    """
+    Places held by another process are not handed out, and are free again
+    once it gives them back.
+    """
+    path = str(tmp_path / "places")
+    context = multiprocessing.get_context("fork")
+    held, done = context.Event(), context.Event()
+    holder = context.Process(target=_hold_places, args=(path, 1, held, done))
+    holder.start()
+    try:
+        assert held.wait(10)
+        with pytest.raises(ServiceUnavailable):
+            _limiter(path).check(_HASH, "secret")
+    finally:
+        done.set()
+        holder.join(10)
+
+    assert holder.exitcode == 0
+    assert _limiter(path).check(_HASH, "secret")
@@ -0,0 +1,126 @@
+"""
+The tests of the precompressed responses of the reference routes.
+"""
+
+import gzip
+import json
+
+import pytest
+
+from coa_flask_app import compression
+
+_ITEM = {"material": "Glass", "category": "Bottles", "item_name": "Test"}
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, expected",
+    [
+        (None, "identity"),
+        ("identity", "identity"),
+        ("gzip", "gzip"),
+        ("gzip;q=0.5, identity;q=1", "identity"),
+        ("deflate", "identity"),
+    ],
+)
+def test_negotiate(accept_encoding, expected):
+    """
+    The encoding the client prefers most is picked among those available.
+    """
+    assert compression.negotiate(accept_encoding, {"identity", "gzip"}) == expected
+
+
+def test_negotiate_only_offers_available():
+    """
+    A payload too short to compress is only offered as is.
+    """
+    assert compression.negotiate("gzip, br", {"identity"}) == "identity"
+
+
+def test_encode_skips_short_bodies():
+    """
+    Short bodies are kept as they are, longer ones in every encoding.
+    """
+    assert set(compression.encode(b"{}")) == {"identity"}
+
+    body = json.dumps({"items": list(range(500))}).encode()
+    encodings = compression.encode(body)
+    assert "gzip" in encodings
+    assert gzip.decompress(encodings["gzip"]) == body
+
+
+def test_tagged():
+    """
+    Every compressed encoding gets a tag of its own.
+    """
+    assert compression.tagged("abc", None) == "abc"
+    assert compression.tagged("abc", "identity") == "abc"
+    assert compression.tagged("abc", "gzip") == "abc-gzip"
+
+
+def test_route_serves_encodings(client):
+    """
+    The reference routes send the same payload in the encoding asked for.
+    """
+    plain = client.get("/items", headers={"Accept-Encoding": "identity"})
+    gzipped = client.get("/items", headers={"Accept-Encoding": "gzip"})
+
+    assert "Content-Encoding" not in plain.headers
+    assert gzipped.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in gzipped.headers["Vary"]
+    assert json.loads(gzip.decompress(gzipped.get_data())) == plain.get_json()
+
+
+def test_route_rebuilds_after_write(client):
+    """
+    The stored payload is built again once its table changes.
+    """
+    before = client.get("/items", headers={"Accept-Encoding": "gzip"})
+    response = client.post("/items/add", json=_ITEM)
+    assert response.status_code == 200
+
+    after = client.get("/items", headers={"Accept-Encoding": "gzip"})
+
+    listed = json.loads(gzip.decompress(after.get_data()))["items"]
+    assert (
+        len(listed) == len(json.loads(gzip.decompress(before.get_data()))["items"]) + 1
+    )
+
+
+def test_encodings_have_own_tags(client):
+    """
+    Every encoding of a response is tagged on its own, so a held copy is
+    only current for a client that would get the same encoding.
+    """
+    plain = client.get("/items", headers={"Accept-Encoding": "identity"})
+    gzipped = client.get("/items", headers={"Accept-Encoding": "gzip"})
+    assert gzipped.headers["Content-Encoding"] == "gzip"
+    etag = gzipped.headers["ETag"]
+    assert gzipped.get_etag() == (
+        compression.tagged(plain.get_etag()[0], "gzip"),
+        False,
+    )
+
+    same = client.get(
+        "/items", headers={"Accept-Encoding": "gzip", "If-None-Match": etag}
+    )
+    other = client.get(
+        "/items", headers={"Accept-Encoding": "identity", "If-None-Match": etag}
+    )
+
+    assert same.status_code == 304
+    assert same.headers["ETag"] == etag
+    assert other.status_code == 200
+    assert other.headers["ETag"] == plain.headers["ETag"]
+
+
+def test_plain_tag_matches_any_encoding(client):
+    """
+    A copy held uncompressed stays current whatever the client accepts.
+    """
+    etag = client.get("/items", headers={"Accept-Encoding": "identity"}).headers["ETag"]
+
+    response = client.get(
+        "/items", headers={"Accept-Encoding": "gzip", "If-None-Match": etag}
+    )
+
+    assert response.status_code == 304
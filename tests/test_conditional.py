@@ -0,0 +1,53 @@
+"""
+The tests of the conditional GETs of the read routes.
+"""
+
+_ITEM = {"material": "Glass", "category": "Bottles", "item_name": "Test"}
+
+
+def test_not_modified(client):
+    """
+    A client holding the current version gets an empty 304.
+    """
+    response = client.get("/stats/seasons")
+    etag = response.headers["ETag"]
+    assert response.headers["Cache-Control"] == "no-cache"
+
+    cached = client.get("/stats/seasons", headers={"If-None-Match": etag})
+
+    assert cached.status_code == 304
+    assert not cached.get_data()
+    assert cached.headers["ETag"] == etag
+
+
+def test_write_changes_etag(client):
+    """
+    A write to a table the route reads from makes the held copy stale, and
+    a write to another table does not.
+    """
+    etag = client.get("/items").headers["ETag"]
+    response = client.post("/sites/remove", json={"site_id": 1})
+    assert response.status_code == 200
+    assert client.get("/items", headers={"If-None-Match": etag}).status_code == 304
+
+    response = client.post("/items/add", json=_ITEM)
+    assert response.status_code == 200
+    stale = client.get("/items", headers={"If-None-Match": etag})
+
+    assert stale.status_code == 200
+    assert stale.headers["ETag"] != etag
+    assert any(item["item_name"] == "Test" for item in stale.get_json()["items"])
+
+
+def test_etag_depends_on_query(client):
+    """
+    Every query string of a route has a tag of its own.
+    """
+    first = client.get("/stats/sites?volunteer_season=Spring").headers["ETag"]
+    second = client.get("/stats/sites?volunteer_season=Fall").headers["ETag"]
+
+    assert first != second
+    response = client.get(
+        "/stats/sites?volunteer_season=Fall", headers={"If-None-Match": first}
+    )
+    assert response.status_code == 200
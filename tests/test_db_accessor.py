@@ -0,0 +1,108 @@
+"""
+The tests of the unit of work shared by the Accessors of a request.
+"""
+
+import sqlite3
+
+import pytest
+
+from coa_flask_app import APP, db_accessor, generations, items
+
+_COUNT_ITEMS = "SELECT COUNT(*) FROM coa_data.item"
+
+
+def test_request_commits_once(rows):
+    """
+    The writes of a request are committed together when it finishes, and
+    the caches are only invalidated then.
+    """
+    ((before,),) = rows(_COUNT_ITEMS)
+    generation = generations.current("item")
+
+    with APP.test_request_context("/items/add"):
+        items.add("Glass", "Bottles", "Test bottle")
+        items.add("Glass", "Bottles", "Other test bottle")
+        assert db_accessor.pool_stats()["in_use"] == 1
+        assert rows(_COUNT_ITEMS) == [(before,)]
+        assert generations.current("item") == generation
+
+        assert db_accessor.finish_request(True)
+
+    assert rows(_COUNT_ITEMS) == [(before + 2,)]
+    assert generations.current("item") > generation
+    assert db_accessor.pool_stats()["in_use"] == 0
+
+
+def test_failed_block_rolls_back_request(rows):
+    """
+    A request with a failed Accessor block is rolled back as a whole, even
+    if the request itself is reported as a success.
+    """
+    ((before,),) = rows(_COUNT_ITEMS)
+    generation = generations.current("item")
+
+    with APP.test_request_context("/items/add"):
+        items.add("Glass", "Bottles", "Test bottle")
+        with pytest.raises(sqlite3.OperationalError):
+            with db_accessor.Accessor() as db_handle:
+                db_handle.execute("SELECT * FROM coa_data.missing")
+
+        assert not db_accessor.finish_request(True)
+
+    assert rows(_COUNT_ITEMS) == [(before,)]
+    assert generations.current("item") == generation
+    assert db_accessor.pool_stats()["in_use"] == 0
+
+
+def test_failed_request_rolls_back(rows):
+    """
+    A request answered with an error leaves nothing behind.
+    """
+    ((before,),) = rows(_COUNT_ITEMS)
+
+    with APP.test_request_context("/items/add"):
+        items.add("Glass", "Bottles", "Test bottle")
+        assert not db_accessor.finish_request(False)
+
+    assert rows(_COUNT_ITEMS) == [(before,)]
+
+
+def test_on_commit_waits_for_commit(database):
+    """
+    Callbacks run after the request's commit, and not at all if it is
+    rolled back.
+    """
+    _ = database
+    calls = []
+    with APP.test_request_context("/"):
+        with db_accessor.Accessor() as db_handle:
+            db_handle.execute(_COUNT_ITEMS)
+        db_accessor.on_commit(lambda: calls.append("committed"))
+        assert not calls
+        db_accessor.finish_request(True)
+    assert calls == ["committed"]
+
+    with APP.test_request_context("/"):
+        with db_accessor.Accessor() as db_handle:
+            db_handle.execute(_COUNT_ITEMS)
+        db_accessor.on_commit(lambda: calls.append("rolled back"))
+        db_accessor.finish_request(False)
+    assert calls == ["committed"]
+
+
+def test_on_commit_outside_of_request():
+    """
+    Outside of a request the changes are already committed, so callbacks
+    run straight away.
+    """
+    calls = []
+    db_accessor.on_commit(lambda: calls.append("now"))
+    assert calls == ["now"]
+
+
+def test_finish_without_unit_of_work():
+    """
+    Finishing a request that never used the database does nothing.
+    """
+    with APP.test_request_context("/"):
+        assert not db_accessor.finish_request(True)
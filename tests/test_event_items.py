@@ -0,0 +1,339 @@
+"""
+The tests of the event items and their bulk changes.
+"""
+
+import pytest
+from starlette.testclient import TestClient
+
+from coa_flask_app.asgi import APP
+from coa_flask_app.event_items import _deltas, _insert, _outcomes
+
+_EVENT_TOTALS = """
+    SELECT event.event_id, event.trash_items_cnt, SUM(event_items.quantity)
+    FROM coa_data.event
+    JOIN coa_data.event_items ON event_items.event_id = event.event_id
+    GROUP BY event.event_id
+    HAVING event.trash_items_cnt <> SUM(event_items.quantity)
+"""
+
+
+def _stored(record_id: int, event_id: int, item_id: int, quantity: int):
+    """
+    Builds a locked record, as read before a batch is applied.
+
+    Args:
+        record_id: The ID of the record.
+        event_id: The ID of its event.
+        item_id: The ID of its item.
+        quantity: Its quantity.
+
+    Returns:
+        The record.
+    """
+    return {
+        "record_id": record_id,
+        "event_id": event_id,
+        "item_id": item_id,
+        "quantity": quantity,
+    }
+
+
+def test_deltas_of_adds():
+    """
+    Adds count towards their event and item.
+    """
+    changes = [
+        ("add", (1, 2, 5, "x")),
+        ("add", (1, 2, 3, "x")),
+        ("add", (4, 2, 1, "x")),
+    ]
+
+    deltas, found, written = _deltas(changes, [])
+
+    assert deltas == {(1, 2): [8, 2], (4, 2): [1, 1]}
+    assert found == [True, True, True]
+    assert not written
+
+
+def test_deltas_use_stored_records():
+    """
+    Updates move what is stored to where the record goes, and records that
+    are not stored are not counted.
+    """
+    changes = [("update", (1, 4, 7, "x", 10)), ("update", (1, 4, 7, "x", 11))]
+    locked = [_stored(10, 1, 2, 3)]
+
+    deltas, found, written = _deltas(changes, locked)
+
+    assert deltas == {(1, 2): [-3, -1], (1, 4): [7, 1]}
+    assert found == [True, False]
+    assert written == {10: (1, 4, 7, "x", 10)}
+
+
+def test_deltas_update_then_remove():
+    """
+    A record updated and removed in the same batch is taken out where it
+    was stored, and a second remove of it finds nothing.
+    """
+    changes = [
+        ("update", (1, 4, 7, "x", 10)),
+        ("remove", (10,)),
+        ("remove", (10,)),
+    ]
+    locked = [_stored(10, 1, 2, 3)]
+
+    deltas, found, written = _deltas(changes, locked)
+
+    assert deltas == {(1, 2): [-3, -1]}
+    assert found == [True, True, False]
+    assert written == {10: None}
+
+
+def test_deltas_remove_then_update():
+    """
+    A record removed and then updated stays removed, and the update finds
+    nothing.
+    """
+    changes = [("remove", (10,)), ("update", (1, 4, 7, "x", 10))]
+
+    deltas, found, written = _deltas(changes, [_stored(10, 1, 2, 3)])
+
+    assert deltas == {(1, 2): [-3, -1]}
+    assert found == [True, False]
+    assert written == {10: None}
+
+
+def test_deltas_keep_last_update():
+    """
+    A record updated twice is written once, with its last update, and an
+    update that changes nothing counted leaves no delta.
+    """
+    changes = [("update", (1, 4, 7, "x", 10)), ("update", (1, 2, 3, "y", 10))]
+
+    deltas, found, written = _deltas(changes, [_stored(10, 1, 2, 3)])
+
+    assert not deltas
+    assert found == [True, True]
+    assert written == {10: (1, 2, 3, "y", 10)}
+
+
+def test_adds_are_one_insert():
+    """
+    The adds are inserted by one statement and numbered from the first ID
+    it reports.
+    """
+    query, params = _insert([(1, 2, 5, "x"), (4, 2, 1, "y")])
+    changes = [
+        ("add", (1, 2, 5, "x")),
+        ("remove", (10,)),
+        ("add", (4, 2, 1, "y")),
+    ]
+
+    assert query.count("%s") == len(params) == 8
+    assert "VALUES (%s, %s, %s, %s), (%s, %s, %s, %s)" in query
+    assert params == [1, 2, 5, "x", 4, 2, 1, "y"]
+    assert _outcomes(changes, [True, False, True], 41) == [41, False, 42]
+
+
+def test_bulk_reports_every_operation(client, rows):
+    """
+    The bulk route applies every change and reports each in the order given.
+    """
+    ((record_id, event_id),) = rows(
+        "SELECT record_id, event_id FROM coa_data.event_items"
+        " ORDER BY record_id LIMIT 1"
+    )
+    ((last_id,),) = rows("SELECT MAX(record_id) FROM coa_data.event_items")
+    operations = [
+        {"op": "remove", "record_id": record_id + 1},
+        {"op": "add", "event_id": event_id, "item_id": 2, "quantity": 5},
+        {"op": "update", "record_id": last_id + 100, "event_id": 1, "item_id": 1},
+        {"op": "update", "record_id": record_id, "event_id": event_id, "item_id": 3},
+        {"op": "remove", "record_id": record_id + 1},
+    ]
+    for operation in operations:
+        operation.setdefault("quantity", 2)
+        operation.setdefault("updated_by", "tester")
+
+    response = client.post("/event-items/bulk", json={"operations": operations})
+
+    assert response.status_code == 200
+    results = response.get_json()["results"]
+    assert [result["index"] for result in results] == list(range(5))
+    assert [result["status"] for result in results] == [
+        "applied",
+        "applied",
+        "not_found",
+        "applied",
+        "not_found",
+    ]
+    assert results[1]["record_id"] > last_id
+    assert rows(
+        "SELECT event_id, item_id, quantity FROM coa_data.event_items"
+        " WHERE record_id IN (?, ?, ?) ORDER BY record_id",
+        record_id,
+        record_id + 1,
+        results[1]["record_id"],
+    ) == [(event_id, 3, 2), (event_id, 2, 5)]
+    assert not rows(_EVENT_TOTALS)
+
+
+def test_bulk_is_all_or_nothing(client, rows):
+    """
+    A batch with a malformed operation is rejected without applying any of
+    it.
+    """
+    before = rows("SELECT COUNT(*), SUM(quantity) FROM coa_data.event_items")
+    operations = [
+        {"op": "add", "event_id": 1, "item_id": 2, "quantity": 5, "updated_by": "x"},
+        {"op": "update", "record_id": 1},
+    ]
+
+    response = client.post("/event-items/bulk", json={"operations": operations})
+
+    assert response.status_code == 400
+    assert rows("SELECT COUNT(*), SUM(quantity) FROM coa_data.event_items") == before
+
+
+@pytest.mark.parametrize("asgi", [False, True])
+def test_bulk_applies_in_order(client, aio_database, rows, asgi):
+    """
+    The changes take effect in the order given, and the adds get the IDs of
+    the records they inserted, in both apps.
+    """
+    _ = aio_database
+    poster = TestClient(APP).post if asgi else client.post
+    removed, updated = [
+        record_id
+        for (record_id,) in rows(
+            "SELECT record_id FROM coa_data.event_items ORDER BY record_id LIMIT 2"
+        )
+    ]
+    operations = [
+        {"op": "remove", "record_id": removed},
+        {"op": "update", "record_id": removed, "event_id": 1, "item_id": 1},
+        {"op": "add", "event_id": 2, "item_id": 4, "quantity": 6},
+        {"op": "update", "record_id": updated, "event_id": 2, "item_id": 5},
+        {"op": "add", "event_id": 3, "item_id": 5, "quantity": 7},
+        {"op": "remove", "record_id": updated},
+        {"op": "add", "event_id": 2, "item_id": 6, "quantity": 8},
+    ]
+    for operation in operations:
+        operation.setdefault("quantity", 2)
+        operation.setdefault("updated_by", "ordered")
+
+    response = poster("/event-items/bulk", json={"operations": operations})
+
+    results = (response.json() if asgi else response.get_json())["results"]
+    assert [result["status"] for result in results] == [
+        "applied",
+        "not_found",
+        "applied",
+        "applied",
+        "applied",
+        "applied",
+        "applied",
+    ]
+    assert not rows(
+        "SELECT record_id FROM coa_data.event_items WHERE record_id IN (?, ?)",
+        removed,
+        updated,
+    )
+    added = [results[index]["record_id"] for index in (2, 4, 6)]
+    assert rows(
+        "SELECT record_id, event_id, item_id, quantity FROM coa_data.event_items"
+        " WHERE updated_by = 'ordered' ORDER BY record_id"
+    ) == [
+        (added[0], 2, 4, 6),
+        (added[1], 3, 5, 7),
+        (added[2], 2, 6, 8),
+    ]
+    assert not rows(_EVENT_TOTALS)
+
+
+def test_get_many_groups_by_event(client, rows):
+    """
+    The event items of many events are grouped by their event.
+    """
+    expected = {}
+    for record_id, event_id in rows(
+        "SELECT record_id, event_id FROM coa_data.event_items"
+        " WHERE event_id IN (1, 2, 3) ORDER BY record_id"
+    ):
+        expected.setdefault(str(event_id), []).append(record_id)
+
+    response = client.get("/event-items?event_ids=1,2&event_ids=3")
+
+    grouped = response.get_json()["event_items"]
+    assert {
+        event_id: [record["record_id"] for record in records]
+        for event_id, records in grouped.items()
+        if records
+    } == expected
+
+
+def test_routes_take_numbers_as_strings(client, rows):
+    """
+    IDs and quantities sent as strings are stored and matched as numbers.
+    """
+    ((record_id, event_id),) = rows(
+        "SELECT record_id, event_id FROM coa_data.event_items"
+        " ORDER BY record_id LIMIT 1"
+    )
+
+    added = client.post(
+        "/event-items/add",
+        json={
+            "event_id": str(event_id),
+            "item_id": "2",
+            "quantity": "5",
+            "updated_by": "strings",
+        },
+    )
+    updated = client.post(
+        "/event-items/update",
+        json={
+            "record_id": str(record_id),
+            "event_id": event_id,
+            "item_id": 3,
+            "quantity": "4",
+            "updated_by": "strings",
+        },
+    )
+
+    assert added.status_code == updated.status_code == 200
+    assert rows(
+        "SELECT record_id, event_id, item_id, quantity FROM coa_data.event_items"
+        " WHERE updated_by = 'strings' ORDER BY record_id"
+    )[0] == (record_id, event_id, 3, 4)
+    assert (event_id, 2, 5) in rows(
+        "SELECT event_id, item_id, quantity FROM coa_data.event_items"
+        " WHERE updated_by = 'strings'"
+    )
+    assert not rows(_EVENT_TOTALS)
+
+
+def test_routes_reject_bad_numbers(client, rows):
+    """
+    IDs and quantities that are not integers are rejected.
+    """
+    before = rows("SELECT COUNT(*), SUM(quantity) FROM coa_data.event_items")
+    add = {"event_id": 1, "item_id": 2, "quantity": 5, "updated_by": "x"}
+
+    for path, body in [
+        ("/event-items/add", dict(add, quantity="five")),
+        ("/event-items/add", dict(add, quantity=1.5)),
+        ("/event-items/update", dict(add, record_id=None)),
+        ("/event-items/remove", {"record_id": True}),
+        ("/event-items/bulk", {"operations": [dict(add, op="add", item_id="x")]}),
+    ]:
+        assert client.post(path, json=body).status_code == 400
+
+    bulk = client.post(
+        "/event-items/bulk",
+        json={"operations": [{"op": "remove", "record_id": "1"}]},
+    )
+    assert bulk.get_json()["results"] == [
+        {"index": 0, "op": "remove", "record_id": 1, "status": "applied"}
+    ]
+    assert rows("SELECT COUNT(*) FROM coa_data.event_items")[0][0] == before[0][0] - 1
@@ -0,0 +1,77 @@
+"""
+The tests of the events and the seasons they are held in.
+"""
+
+from datetime import date
+
+import pytest
+
+from coa_flask_app import events
+
+
+@pytest.mark.parametrize("season", events.SEASONS)
+def test_season_range_holds_volunteer_date(season):
+    """
+    The date an event is stored under falls inside the range of its season.
+    """
+    start, end = events.season_range(2021, season)
+
+    assert start <= events.volunteer_date(2021, season) < end
+
+
+def test_season_ranges_cover_year():
+    """
+    The seasons of a year follow each other without a gap.
+    """
+    spring = events.season_range(2021, "Spring")
+    fall = events.season_range(2021, "Fall")
+
+    assert spring == (date(2021, 1, 1), date(2021, 7, 1))
+    assert fall == (date(2021, 7, 1), date(2022, 1, 1))
+    assert events.season_range(2022, "Spring")[0] == fall[1]
+
+
+@pytest.mark.parametrize("season", ["Summer", "spring", None])
+def test_season_range_rejects_unknown(season):
+    """
+    A season that is not one of SEASONS is rejected.
+    """
+    with pytest.raises(ValueError):
+        events.season_range(2021, season)
+
+
+def test_events_route_ranges(client):
+    """
+    The events route takes a season or a range of dates, and rejects
+    requests with neither or with an unknown season.
+    """
+    by_season = client.get("/events?volunteer_year=2021&volunteer_season=Fall")
+    by_dates = client.get("/events?start_date=2021-07-01&end_date=2022-01-01")
+
+    assert by_season.get_json() == by_dates.get_json()
+    assert client.get("/events").status_code == 400
+    assert (
+        client.get("/events?volunteer_year=2021&volunteer_season=Summer").status_code
+        == 400
+    )
+
+
+def test_events_with_items(client, rows):
+    """
+    The events route can include the event items of every event.
+    """
+    ((year,),) = rows("SELECT MAX(strftime('%Y', volunteer_date)) FROM coa_data.event")
+    path = f"/events?volunteer_year={year}&volunteer_season=Spring&include=items"
+
+    listed = client.get(path).get_json()["events"]
+
+    for event in listed[:3]:
+        expected = [
+            record_id
+            for (record_id,) in rows(
+                "SELECT record_id FROM coa_data.event_items WHERE event_id = ?"
+                " ORDER BY record_id",
+                event["event_id"],
+            )
+        ]
+        assert [record["record_id"] for record in event["event_items"]] == expected
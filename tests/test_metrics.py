@@ -0,0 +1,97 @@
+"""
+The tests of the instrumentation of the app.
+"""
+
+from prometheus_client import REGISTRY
+
+from coa_flask_app import metrics
+
+from benchmarks import sqlite_db
+
+
+def _sample(name: str, **labels) -> float:
+    """
+    Reads the current value of a sample of the default registry.
+
+    Args:
+        name: The name of the sample.
+        labels: The labels of the sample.
+
+    Returns:
+        The value, 0 if nothing was recorded yet.
+    """
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def _label() -> str:
+    """
+    Gets the label of this function, the way a data function gets its own.
+
+    Returns:
+        The label.
+    """
+    return metrics.caller_label(1)
+
+
+def test_caller_label():
+    """
+    Queries are labelled by the module and function running them.
+    """
+    assert _label() == "test_metrics._label"
+
+
+def test_cursor_records_queries(database):
+    """
+    The wrapped cursor times every execute and fetch and counts the rows.
+    """
+    connection = sqlite_db.SQLiteConnection(database)
+    cursor = metrics.InstrumentedCursor(connection.cursor(), "tests.records")
+    executes = _sample(
+        "coa_db_query_seconds_count", query="tests.records", operation="execute"
+    )
+    fetched = _sample("coa_db_query_rows_sum", query="tests.records")
+
+    cursor.execute("SELECT item_id FROM coa_data.item WHERE item_id <= 3")
+    assert len(cursor.fetchall()) == 3
+
+    assert (
+        _sample(
+            "coa_db_query_seconds_count", query="tests.records", operation="execute"
+        )
+        == executes + 1
+    )
+    assert _sample("coa_db_query_rows_sum", query="tests.records") == fetched + 3
+    connection.close()
+
+
+def test_cursor_records_iterated_rows(database):
+    """
+    Rows read by iterating the cursor are counted once they run out.
+    """
+    connection = sqlite_db.SQLiteConnection(database)
+    cursor = metrics.InstrumentedCursor(connection.cursor(), "tests.iterated")
+
+    cursor.execute("SELECT item_id FROM coa_data.item WHERE item_id <= 5")
+    assert len(list(cursor)) == 5
+
+    assert _sample("coa_db_query_rows_sum", query="tests.iterated") == 5
+    assert (
+        _sample("coa_db_query_seconds_count", query="tests.iterated", operation="fetch")
+        == 1
+    )
+    connection.close()
+
+
+def test_metrics_route(client):
+    """
+    The metrics route reports the requests handled and the queries they ran.
+    """
+    client.get("/items")
+
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.content_type.startswith("text/plain")
+    body = response.get_data(as_text=True)
+    assert 'coa_http_request_seconds_count{endpoint="get_items"' in body
+    assert 'coa_db_query_seconds_count{operation="execute",query="items.get"}' in body
@@ -0,0 +1,145 @@
+"""
+The tests of the keyset cursors of the listing routes.
+"""
+
+import json
+
+import pytest
+from werkzeug.exceptions import BadRequest
+
+from coa_flask_app import events, pagination
+
+
+def _season(rows):
+    """
+    Picks a season with enough events to page through.
+
+    Args:
+        rows: The fixture running queries against the database.
+
+    Returns:
+        The query string of the season and the IDs of its events in order.
+    """
+    ((year,),) = rows("SELECT MIN(strftime('%Y', volunteer_date)) FROM coa_data.event")
+    start, end = events.season_range(int(year), "Spring")
+    ids = [
+        event_id
+        for (event_id,) in rows(
+            "SELECT event_id FROM coa_data.event"
+            " WHERE volunteer_date >= ? AND volunteer_date < ? ORDER BY event_id",
+            start,
+            end,
+        )
+    ]
+    return f"volunteer_year={year}&volunteer_season=Spring", ids
+
+
+def test_cursor_round_trip():
+    """
+    A cursor points past the ID it was made from.
+    """
+    assert pagination.decode_cursor(pagination.encode_cursor(42)) == 42
+    assert pagination.decode_cursor(None) == 0
+    assert pagination.decode_cursor("") == 0
+
+
+@pytest.mark.parametrize(
+    "cursor", ["not a cursor", "e30=", "WzFd", "eyJhZnRlciI6IngifQ"]
+)
+def test_malformed_cursor(cursor):
+    """
+    A cursor that was not made by encode_cursor is rejected.
+    """
+    with pytest.raises(BadRequest):
+        pagination.decode_cursor(cursor)
+
+
+def test_malformed_cursor_route(client):
+    """
+    The routes answer a malformed cursor with a bad request.
+    """
+    response = client.get("/event-items?event_id=1&limit=2&cursor=bogus")
+
+    assert response.status_code == 400
+
+
+def test_events_pages(client, rows):
+    """
+    Following the cursors of the events route visits every event of the
+    season once, in order.
+    """
+    season, expected = _season(rows)
+    assert len(expected) > 3
+
+    seen = []
+    path = f"/events?{season}&limit=3"
+    while path is not None:
+        body = client.get(path).get_json()
+        assert len(body["events"]) <= 3
+        seen.extend(event["event_id"] for event in body["events"])
+        cursor = body["next_cursor"]
+        path = None if cursor is None else f"/events?{season}&limit=3&cursor={cursor}"
+
+    assert seen == expected
+    whole = client.get(f"/events?{season}").get_json()["events"]
+    assert [event["event_id"] for event in whole] == expected
+
+
+def test_page_survives_writes(client, rows):
+    """
+    A page resumes after the last event sent even if earlier events were
+    removed in between, where an offset would skip events.
+    """
+    season, expected = _season(rows)
+    first = client.get(f"/events?{season}&limit=2").get_json()
+
+    for event_id in expected[:2]:
+        response = client.post("/events/remove", json={"event_id": event_id})
+        assert response.status_code == 200
+    cursor = first["next_cursor"]
+    second = client.get(f"/events?{season}&limit=2&cursor={cursor}").get_json()
+
+    assert [event["event_id"] for event in second["events"]] == expected[2:4]
+
+
+def test_event_items_pages(client, rows):
+    """
+    Following the cursors of the event items route visits every event item
+    of the event once, and the last page has no cursor.
+    """
+    ((event_id, count),) = rows(
+        "SELECT event_id, COUNT(*) FROM coa_data.event_items"
+        " GROUP BY event_id ORDER BY COUNT(*) DESC, event_id LIMIT 1"
+    )
+    expected = [
+        record_id
+        for (record_id,) in rows(
+            "SELECT record_id FROM coa_data.event_items"
+            " WHERE event_id = ? ORDER BY record_id",
+            event_id,
+        )
+    ]
+
+    seen, cursor = [], ""
+    for _ in range(count):
+        body = client.get(
+            f"/event-items?event_id={event_id}&limit=2&cursor={cursor}"
+        ).get_json()
+        seen.extend(record["record_id"] for record in body["event_items"])
+        cursor = body["next_cursor"]
+        if cursor is None:
+            break
+
+    assert seen == expected
+
+
+def test_stream_matches_listing(client, rows):
+    """
+    A streamed listing holds the same events as the plain one.
+    """
+    season, _ = _season(rows)
+
+    streamed = client.get(f"/events?{season}&stream=1")
+    listed = client.get(f"/events?{season}")
+
+    assert json.loads(streamed.get_data()) == listed.get_json()
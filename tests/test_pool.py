@@ -0,0 +1,168 @@
+"""
+The tests of the connection pool.
+"""
+
+import os
+import threading
+import time
+
+import pymysql
+import pytest
+
+from coa_flask_app import db_accessor
+from coa_flask_app.pool import ConnectionPool, PoolSettings, PoolTimeout
+
+
+class FakeConnection:
+    """
+    A connection that can be made to fail its ping.
+    """
+
+    def __init__(self) -> None:
+        """
+        The constructor of the FakeConnection class.
+        """
+        self.alive = True
+        self.closed = False
+
+    def ping(self, reconnect: bool = False) -> None:
+        """
+        Checks the connection.
+
+        Args:
+            reconnect: Whether to reconnect, which must not be asked for.
+
+        Raises:
+            OperationalError: If the connection has been dropped.
+        """
+        assert not reconnect
+        if not self.alive:
+            raise pymysql.err.OperationalError(2006, "MySQL server has gone away")
+
+    def close(self) -> None:
+        """
+        Closes the connection.
+        """
+        self.closed = True
+
+
+def _pool(
+    max_size: int = 2, max_age: float = 60.0, timeout: float = 1.0
+) -> ConnectionPool:
+    """
+    Creates a pool of fake connections with one opened up front.
+
+    Args:
+        max_size: The maximum number of connections open at once.
+        max_age: The number of seconds a connection may live for.
+        timeout: The number of seconds to wait for a free connection.
+
+    Returns:
+        The pool.
+    """
+    return ConnectionPool(PoolSettings(FakeConnection, 1, max_size, max_age, timeout))
+
+
+def test_reuses_idle_connection():
+    """
+    A released connection is handed out again.
+    """
+    pool = _pool()
+    connection = pool.acquire()
+    pool.release(connection)
+
+    assert pool.acquire() is connection
+    assert pool.stats()["connects"] == 1
+
+
+def test_replaces_connection_failing_ping():
+    """
+    An idle connection dropped by the server is closed and replaced.
+    """
+    pool = _pool()
+    connection = pool.acquire()
+    pool.release(connection)
+    connection.alive = False
+
+    replacement = pool.acquire()
+
+    assert replacement is not connection
+    assert connection.closed
+    assert pool.stats()["discards"] == 1
+
+
+def test_retires_old_connections():
+    """
+    Connections older than the max age are closed rather than reused.
+    """
+    pool = _pool(max_age=0.05)
+    connection = pool.acquire()
+    time.sleep(0.1)
+    pool.release(connection)
+
+    assert connection.closed
+    assert pool.stats()["idle"] == 0
+    assert pool.acquire() is not connection
+
+
+def test_discarded_connections_are_closed():
+    """
+    A connection released as broken is not handed out again.
+    """
+    pool = _pool()
+    connection = pool.acquire()
+    pool.release(connection, discard=True)
+
+    assert connection.closed
+    assert pool.acquire() is not connection
+
+
+def test_times_out_when_exhausted():
+    """
+    A checkout gives up once the pool stays full for the timeout.
+    """
+    pool = _pool(max_size=1, timeout=0.05)
+    pool.acquire()
+
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+
+    stats = pool.stats()
+    assert stats["timeouts"] == 1
+    assert stats["in_use"] == 1
+
+
+def test_waits_for_a_release():
+    """
+    A checkout of a full pool gets the next connection released.
+    """
+    pool = _pool(max_size=1, timeout=5.0)
+    connection = pool.acquire()
+    timer = threading.Timer(0.05, pool.release, (connection,))
+    timer.start()
+
+    assert pool.acquire() is connection
+    timer.join()
+    stats = pool.stats()
+    assert stats["waits"] == 1
+    assert stats["wait_time_max"] > 0
+
+
+def test_forked_process_gets_own_pool(monkeypatch):
+    """
+    A process forked from one with a pool opens a pool of its own, and does
+    not report the parent's.
+    """
+    db_accessor.set_connect(FakeConnection)
+    parent = db_accessor.get_pool()
+    assert db_accessor.get_pool() is parent
+
+    child_pid = parent.pid + 1
+    monkeypatch.setattr(os, "getpid", lambda: child_pid)
+    assert db_accessor.pool_stats() is None
+
+    child = db_accessor.get_pool()
+    assert child is not parent
+    assert child.pid == child_pid
+    assert db_accessor.get_pool() is child
+    assert db_accessor.pool_stats()["pid"] == child_pid
@@ -0,0 +1,195 @@
+"""
+The tests of the checking of the query plans.
+"""
+
+import json
+from typing import Any, List, Tuple
+
+from coa_flask_app import query_plans
+from coa_flask_app.query_plans import PlanRow
+
+_QUERY = """
+    SELECT e.event_id, e.volunteer_date FROM coa_data.event AS e
+    JOIN coa_data.site ON site.site_id = e.site_id
+    WHERE e.site_id = %s AND e.volunteer_date >= %s
+    ORDER BY e.volunteer_date
+"""
+
+
+def _row(table: str, access_type: str, key=None, flags=()) -> PlanRow:
+    """
+    Builds a row of a plan.
+
+    Args:
+        table: The name EXPLAIN reports the table under.
+        access_type: The access type of the table.
+        key: The index used, if any.
+        flags: The filesorts and temporary tables of the row.
+
+    Returns:
+        The row.
+    """
+    return {
+        "table": table,
+        "type": access_type,
+        "key": key,
+        "rows": 100,
+        "flags": list(flags),
+    }
+
+
+class FakeExplainer:
+    """
+    An accessor answering every EXPLAIN with a full scan of the event table.
+    """
+
+    def __init__(self, join: bool = True) -> None:
+        """
+        The constructor of the FakeExplainer class.
+
+        Args:
+            join: Whether the accessor would join the request's transaction.
+        """
+        assert not join
+        self.explained: List[Tuple[str, Any]] = []
+
+    def __enter__(self) -> "FakeExplainer":
+        """
+        Opens the accessor.
+
+        Returns:
+            The accessor, as its own cursor.
+        """
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        """
+        Closes the accessor.
+        """
+
+    def execute(self, query: str, params) -> None:
+        """
+        Records a statement.
+
+        Args:
+            query: The statement.
+            params: Its parameters.
+        """
+        self.explained.append((query, params))
+
+    @staticmethod
+    def fetchall():
+        """
+        Gets the plan of the last statement.
+
+        Returns:
+            The rows of the plan.
+        """
+        return [
+            {
+                "table": "event",
+                "type": "ALL",
+                "key": None,
+                "rows": 10,
+                "Extra": "Using where; Using filesort",
+            }
+        ]
+
+
+def test_collect_leaves_out_inserts_and_fills_templates():
+    """
+    Every query but the inserts is collected, with templates filled in.
+    """
+    queries = query_plans.collect()
+
+    assert "events._GET_QUERY" in queries
+    assert not any(
+        query.lstrip().upper().startswith("INSERT") for query in queries.values()
+    )
+    assert "{" not in queries["rollups._TOTALS_QUERY"]
+
+
+def test_sample_params():
+    """
+    Every placeholder is given 1, or a one value list in IN clauses, unless
+    the query has sample parameters of its own.
+    """
+    query = "SELECT 1 FROM coa_data.event WHERE a = %s AND b IN %s"
+
+    assert query_plans.sample_params("x._QUERY", query) == (1, (1,))
+    assert (
+        query_plans.sample_params("auth._LOGIN_QUERY", query)
+        == query_plans.SAMPLE_PARAMS["auth._LOGIN_QUERY"]
+    )
+
+
+def test_problems_and_suggestions():
+    """
+    A filtered full scan with a filesort is reported, and an index is
+    suggested with the equality column first and the ordering one after.
+    """
+    plan = [_row("e", "ALL", flags=["filesort"]), _row("site", "eq_ref", "PRIMARY")]
+
+    assert query_plans.problems(_QUERY, plan) == [
+        "full scan of coa_data.event (~100 rows)",
+        "filesort on coa_data.event",
+    ]
+    assert query_plans.suggest_indexes(_QUERY, plan) == [
+        "ALTER TABLE coa_data.event ADD INDEX"
+        " event_site_id_volunteer_date_idx (site_id, volunteer_date);"
+    ]
+
+
+def test_no_suggestion_for_good_plans():
+    """
+    Plans using an index without sorting are left alone.
+    """
+    plan = [_row("e", "ref", "event_site_idx"), _row("site", "eq_ref", "PRIMARY")]
+
+    assert not query_plans.problems(_QUERY, plan)
+    assert not query_plans.suggest_indexes(_QUERY, plan)
+
+
+def test_regressions():
+    """
+    A worse access type or a new filesort is a regression, while a better
+    access type or a table missing from the baseline is not.
+    """
+    baseline = [_row("e", "ref", "event_site_idx"), _row("site", "ALL")]
+    plan = [
+        _row("e", "ALL", flags=["filesort"]),
+        _row("site", "eq_ref", "PRIMARY"),
+        _row("item", "ALL"),
+    ]
+
+    assert query_plans.regressions(baseline, plan) == [
+        "e went from ref (event_site_idx) to ALL (None)",
+        "e now needs a filesort",
+    ]
+
+
+def test_check_saves_and_compares_baseline(monkeypatch, tmp_path):
+    """
+    Checking against a saved baseline of the same plans finds no regression,
+    and a baseline of better plans flags every query.
+    """
+    monkeypatch.setattr(query_plans, "Accessor", FakeExplainer)
+    baseline_path = str(tmp_path / "plans.json")
+
+    reports, regressed = query_plans.check(baseline_path, save=True)
+
+    assert not regressed
+    assert set(reports) == set(query_plans.collect())
+    assert query_plans.check(baseline_path)[1] is False
+
+    with open(baseline_path, encoding="utf-8") as baseline_file:
+        baseline = json.load(baseline_file)
+    for plan in baseline.values():
+        plan[0]["type"] = "ref"
+    with open(baseline_path, "w", encoding="utf-8") as baseline_file:
+        json.dump(baseline, baseline_file)
+
+    reports, regressed = query_plans.check(baseline_path)
+
+    assert regressed
+    assert all(report["regressions"] for report in reports.values())
@@ -0,0 +1,101 @@
+"""
+The tests of the response cache shared by the workers.
+"""
+
+import time
+
+from coa_flask_app import generations, response_cache
+
+
+def test_local_store_evicts_least_recently_used():
+    """
+    The store keeps to its size, dropping what was used longest ago.
+    """
+    store = response_cache.LocalStore(max_bytes=10, ttl=60)
+    store.set("a", b"1234")
+    store.set("b", b"1234")
+    assert store.get("a") == b"1234"
+
+    store.set("c", b"1234")
+
+    assert store.get("b") is None
+    assert store.get("a") == b"1234"
+    assert store.get("c") == b"1234"
+    assert store.stats()["bytes"] == 8
+    assert store.stats()["evictions"] == 1
+
+
+def test_local_store_skips_large_values():
+    """
+    A value larger than the whole store is not stored.
+    """
+    store = response_cache.LocalStore(max_bytes=4, ttl=60)
+    store.set("a", b"12345")
+
+    assert store.get("a") is None
+    assert store.stats()["size"] == 0
+
+
+def test_local_store_expires():
+    """
+    Values are dropped once they are older than the TTL.
+    """
+    store = response_cache.LocalStore(max_bytes=10, ttl=0.05)
+    store.set("a", b"1")
+    time.sleep(0.1)
+
+    assert store.get("a") is None
+    assert store.stats()["bytes"] == 0
+
+
+def test_key_for_follows_generations():
+    """
+    Keys ignore the order of the query arguments and change with the
+    generation of the tables.
+    """
+    first = response_cache.key_for("/events", [("b", "2"), ("a", "1")], "event")
+    assert first == response_cache.key_for("/events", [("a", "1"), ("b", "2")], "event")
+    assert first != response_cache.key_for("/events", [("a", "1")], "event")
+
+    generations.bump("event")
+
+    assert first != response_cache.key_for("/events", [("a", "1"), ("b", "2")], "event")
+
+
+def test_route_is_shared(client):
+    """
+    A route answered from the cache returns the same body until a write to
+    its tables.
+    """
+    path = "/event-items?event_id=1"
+    before = response_cache.stats()
+
+    first = client.get(path)
+    second = client.get(path)
+
+    after = response_cache.stats()
+    assert first.get_data() == second.get_data()
+    assert after["misses"] - before["misses"] == 1
+    assert after["hits"] - before["hits"] == 1
+
+    response = client.post(
+        "/event-items/add",
+        json={"event_id": 1, "item_id": 2, "quantity": 3, "updated_by": "x"},
+    )
+    assert response.status_code == 200
+    third = client.get(path).get_json()["event_items"]
+
+    assert len(third) == len(first.get_json()["event_items"]) + 1
+    assert response_cache.stats()["misses"] - after["misses"] == 1
+
+
+def test_other_params_skip_cache(client):
+    """
+    A request with query arguments the route is not cached by runs as usual.
+    """
+    before = response_cache.stats()
+
+    client.get("/event-items?event_id=1&limit=2")
+
+    after = response_cache.stats()
+    assert (after["hits"], after["misses"]) == (before["hits"], before["misses"])
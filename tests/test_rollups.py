@@ -0,0 +1,137 @@
+"""
+The tests of the rollups kept up to date by the writes.
+"""
+
+from datetime import date
+
+from coa_flask_app import rollups
+
+_ROLLUP_ROWS = """
+    SELECT * FROM coa_data.item_rollup
+    WHERE quantity <> 0 OR event_items_cnt <> 0
+    ORDER BY 1, 2, 3, 4, 5
+"""
+
+
+def test_adjustments_sum_by_rollup_row():
+    """
+    Changes falling in the same rollup row are summed, and those that cancel
+    out or belong to missing events or items are left out.
+    """
+    deltas = {
+        (1, 10): [5, 1],
+        (2, 10): [-5, -1],
+        (1, 11): [3, 1],
+        (2, 11): [4, 2],
+        (3, 10): [7, 1],
+        (1, 12): [9, 1],
+    }
+    event_keys = {1: (2020, "Spring", 1), 2: (2020, "Spring", 1)}
+    item_keys = {10: ("Glass", "Bottles"), 11: ("Plastic", "Bags")}
+
+    assert rollups.adjustments(deltas, event_keys, item_keys) == [
+        (2020, "Spring", 1, "Plastic", "Bags", 7, 3),
+    ]
+
+
+def test_adjustments_in_primary_key_order():
+    """
+    The rows are adjusted in the order of the primary key.
+    """
+    deltas = {(2, 10): [1, 1], (1, 11): [1, 1], (1, 10): [1, 1]}
+    event_keys = {1: (2021, "Spring", 2), 2: (2020, "Fall", 5)}
+    item_keys = {10: ("Metal", "Cans"), 11: ("Glass", "Bottles")}
+
+    assert [row[:5] for row in rollups.adjustments(deltas, event_keys, item_keys)] == [
+        (2020, "Fall", 5, "Metal", "Cans"),
+        (2021, "Spring", 2, "Glass", "Bottles"),
+        (2021, "Spring", 2, "Metal", "Cans"),
+    ]
+
+
+def test_event_update_shifts_rollups(client, rows):
+    """
+    Moving an event to another season and site moves its event items along.
+    """
+    event_id, site_id, volunteer_date = rows(
+        "SELECT event_id, site_id, volunteer_date FROM coa_data.event"
+        " WHERE strftime('%m', volunteer_date) < '07' ORDER BY event_id LIMIT 1"
+    )[0]
+    ((quantity,),) = rows(
+        "SELECT SUM(quantity) FROM coa_data.event_items WHERE event_id = ?",
+        event_id,
+    )
+    new_site_id = site_id % 20 + 1
+    year = date.fromisoformat(str(volunteer_date)).year
+
+    response = client.post(
+        "/events/update",
+        json={
+            "event_id": event_id,
+            "updated_by": "tester",
+            "site_id": new_site_id,
+            "volunteer_year": year,
+            "volunteer_season": "Fall",
+        },
+    )
+
+    assert response.status_code == 200
+    moved = rows(
+        "SELECT SUM(quantity) FROM coa_data.item_rollup"
+        " WHERE volunteer_year = ? AND volunteer_season = 'Fall' AND site_id = ?",
+        year,
+        new_site_id,
+    )
+    assert moved[0][0] >= quantity
+    incremental = rows(_ROLLUP_ROWS)
+    rollups.rebuild()
+    assert incremental == rows(_ROLLUP_ROWS)
+
+
+def test_incremental_rollups_match_rebuild(client, rows):
+    """
+    The rollups kept up to date by every kind of write match the rollups
+    built again from scratch.
+    """
+    writes = [
+        ("/event-items/add", {"event_id": 1, "item_id": 3, "quantity": 4}),
+        ("/event-items/add", {"event_id": 2, "item_id": 90, "quantity": 1}),
+        (
+            "/event-items/update",
+            {"record_id": 5, "event_id": 3, "item_id": 7, "quantity": 11},
+        ),
+        ("/event-items/remove", {"record_id": 9}),
+        ("/items/update", {"item_id": 3, "material": "New", "category": "Odd"}),
+        ("/items/remove", {"item_id": 7}),
+        ("/events/remove", {"event_id": 4}),
+    ]
+    for path, args in writes:
+        response = client.post(
+            path, json=dict(args, updated_by="tester", item_name="Thing")
+        )
+        assert response.status_code == 200, path
+
+    incremental = rows(_ROLLUP_ROWS)
+    assert any(row[3] == "New" for row in incremental)
+    rollups.rebuild()
+    assert incremental == rows(_ROLLUP_ROWS)
+
+
+def test_stats_follow_writes(client, rows):
+    """
+    The stats routes total the rollups and see writes straight away.
+    """
+    ((material,),) = rows("SELECT material FROM coa_data.item WHERE item_id = 1")
+    path = f"/stats/materials?material={material}"
+    before = client.get(path).get_json()["stats"]
+    response = client.post(
+        "/event-items/add",
+        json={"event_id": 1, "item_id": 1, "quantity": 1000, "updated_by": "x"},
+    )
+    assert response.status_code == 200
+
+    after = client.get(path).get_json()["stats"]
+    assert {row["category"] for row in after} == {row["category"] for row in before}
+    assert sum(row["quantity"] for row in after) == 1000 + sum(
+        row["quantity"] for row in before
+    )
@@ -0,0 +1,108 @@
+"""
+The tests of the JSON serialization of the responses.
+"""
+
+from datetime import date, datetime
+from decimal import Decimal
+import json
+
+import pytest
+
+from coa_flask_app import APP, serialization
+from coa_flask_app.serialization import _BACKENDS
+
+RECORD = {
+    "site_name": "Sandy Hook – North",
+    "trash_weight": Decimal("12.50"),
+    "walking_distance": None,
+    "event_id": 7,
+    "tags": ["a", "b"],
+}
+
+
+@pytest.mark.parametrize("backend", sorted(_BACKENDS))
+def test_backends_write_the_same_text(backend):
+    """
+    Every backend writes compact JSON with sorted keys and UTF-8 text.
+    """
+    assert (
+        _BACKENDS[backend](RECORD)
+        == (
+            '{"event_id":7,"site_name":"Sandy Hook – North","tags":["a","b"],'
+            '"trash_weight":12.5,"walking_distance":null}'
+        ).encode()
+    )
+
+
+@pytest.mark.parametrize("backend", sorted(_BACKENDS))
+def test_backends_reject_unknown_types(backend):
+    """
+    Values that are not JSON are still rejected.
+    """
+    with pytest.raises(TypeError):
+        _BACKENDS[backend]({"value": object()})
+
+
+def test_orjson_is_used_when_installed():
+    """
+    orjson is the default backend when it is installed.
+    """
+    pytest.importorskip("orjson")
+
+    assert "orjson" in _BACKENDS
+    assert serialization.dumps({"b": 1, "a": Decimal("0.1")}) == b'{"a":0.1,"b":1}'
+
+
+def test_jsonify_matches_flask():
+    """
+    The responses parse to the same value jsonify gives.
+    """
+    record = dict(RECORD, trash_weight=12.5)
+    with APP.app_context():
+        response = serialization.jsonify(events=[record])
+
+    assert response.mimetype == "application/json"
+    assert json.loads(response.get_data()) == {"events": [record]}
+    with pytest.raises(TypeError):
+        serialization.jsonify([1], key=2)
+
+
+def test_row_mapper_converts_columns():
+    """
+    Rows become dictionaries with their conversions applied, except to NULLs.
+    """
+    mapper = serialization.RowMapper(
+        ("event_id", None),
+        ("volunteer_date", serialization.day),
+        ("updated_at", serialization.minute),
+    )
+
+    assert mapper.to_dicts(
+        [
+            (1, date(2021, 4, 3), datetime(2021, 4, 3, 10, 5, 59)),
+            (2, None, None),
+        ]
+    ) == [
+        {
+            "event_id": 1,
+            "volunteer_date": "2021-04-03",
+            "updated_at": "2021-04-03 10:05",
+        },
+        {"event_id": 2, "volunteer_date": None, "updated_at": None},
+    ]
+    assert serialization.RowMapper(("a", None), ("b", None)).to_dicts([(1, 2)]) == [
+        {"a": 1, "b": 2}
+    ]
+
+
+def test_events_route_serializes_rows(client, rows):
+    """
+    The events route writes the stored events through the row mappers.
+    """
+    ((year,),) = rows("SELECT MIN(strftime('%Y', volunteer_date)) FROM coa_data.event")
+
+    listed = client.get(f"/events?volunteer_year={year}&volunteer_season=Spring")
+
+    event = listed.get_json()["events"][0]
+    assert set(event) >= {"event_id", "volunteer_date", "trash_weight"}
+    assert date.fromisoformat(event["volunteer_date"]).year == int(year)
@@ -0,0 +1,184 @@
+"""
+The tests of the grid index of the sites.
+"""
+
+import random
+
+import pytest
+
+from coa_flask_app import spatial
+
+
+def _points(count: int):
+    """
+    Makes up points spread over New Jersey, some without coordinates.
+
+    Args:
+        count: The number of points.
+
+    Returns:
+        The points.
+    """
+    rand = random.Random(7)
+    return [
+        {
+            "id": point_id,
+            "lat": None if point_id % 10 == 0 else 38.9 + rand.random() * 2.5,
+            "long": -75.5 + rand.random() * 1.8,
+        }
+        for point_id in range(1, count + 1)
+    ]
+
+
+def _located(points):
+    """
+    Picks the points with coordinates.
+
+    Args:
+        points: The points.
+
+    Returns:
+        The points with both a latitude and a longitude.
+    """
+    return [point for point in points if point["lat"] is not None]
+
+
+@pytest.fixture(name="index")
+def fixture_index():
+    """
+    Builds an index of 300 points.
+
+    Returns:
+        The index.
+    """
+    index = spatial.GridIndex(0.1)
+    index.rebuild(_points(300), 1)
+    return index
+
+
+def test_haversine():
+    """
+    The distance between two coordinates is given in kilometers.
+    """
+    assert spatial.haversine(40.0, -74.0, 40.0, -74.0) == 0
+    assert spatial.haversine(0.0, 0.0, 1.0, 0.0) == pytest.approx(111.19, abs=0.01)
+    assert spatial.haversine(40.0, -74.0, 41.0, -73.0) == pytest.approx(
+        spatial.haversine(41.0, -73.0, 40.0, -74.0)
+    )
+
+
+@pytest.mark.parametrize(
+    "box",
+    [
+        (39.5, -75.0, 40.0, -74.5),
+        (38.0, -76.0, 42.0, -73.0),
+        (39.95, -74.55, 39.96, -74.54),
+        (45.0, -70.0, 46.0, -69.0),
+    ],
+)
+def test_within_matches_scan(index, box):
+    """
+    The points inside a box are the ones a full scan finds.
+    """
+    min_lat, min_long, max_lat, max_long = box
+    expected = [
+        point
+        for point in _located(_points(300))
+        if min_lat <= point["lat"] <= max_lat and min_long <= point["long"] <= max_long
+    ]
+
+    assert index.within(*box) == expected
+
+
+@pytest.mark.parametrize(
+    "lat, long_f, limit",
+    [(39.5, -74.5, 5), (40.0, -75.0, 1), (45.0, -70.0, 3), (39.0, -74.0, 400)],
+)
+def test_near_matches_scan(index, lat, long_f, limit):
+    """
+    The closest points are the ones a full scan finds, closest first.
+    """
+    expected = sorted(
+        (spatial.haversine(lat, long_f, point["lat"], point["long"]), point["id"])
+        for point in _located(_points(300))
+    )[:limit]
+
+    found = index.near(lat, long_f, limit)
+
+    assert [point["id"] for _, point in found] == [point_id for _, point_id in expected]
+    assert [distance for distance, _ in found] == pytest.approx(
+        [distance for distance, _ in expected]
+    )
+
+
+def test_near_nothing(index):
+    """
+    Asking for no points, or of an empty index, finds none.
+    """
+    assert not index.near(40.0, -74.0, 0)
+    assert not spatial.GridIndex(0.1).near(40.0, -74.0, 5)
+
+
+def test_change_moves_points(index):
+    """
+    Writes move, add and remove single points and advance the version.
+    """
+    index.change(1, {"id": 1, "lat": 45.5, "long": -69.5}, 1, 2)
+    index.change(2, None, 2, 3)
+    index.change(10, {"id": 10, "lat": 45.6, "long": -69.6}, 3, 4)
+
+    assert [point["id"] for point in index.within(45.0, -70.0, 46.0, -69.0)] == [
+        1,
+        10,
+    ]
+    assert all(point["id"] != 2 for point in index.within(38.0, -76.0, 42.0, -73.0))
+    assert index.version == 4
+    assert index.stats()["points"] == len(_located(_points(300)))
+
+
+def test_change_keeps_version_after_missed_write(index):
+    """
+    A write following a version the index never saw leaves the version as
+    is, so the index is rebuilt.
+    """
+    index.change(1, None, 5, 6)
+
+    assert index.version == 1
+    assert index.stats()["points"] == len(_located(_points(300))) - 1
+
+
+def test_sites_routes(client, rows):
+    """
+    The sites routes answer from the index built from the sites table.
+    """
+    located = rows(
+        "SELECT site_id, lat, `long` FROM coa_data.site"
+        " WHERE lat IS NOT NULL AND `long` IS NOT NULL ORDER BY site_id"
+    )
+
+    response = client.get("/sites/within?bbox=-180,-90,180,90")
+    nearest = client.get("/sites/near?lat=39.5&long=-74.5&k=3").get_json()["sites"]
+
+    assert [site["site_id"] for site in response.get_json()["sites"]] == [
+        site_id for site_id, _, _ in located
+    ]
+    expected = sorted(
+        (spatial.haversine(39.5, -74.5, lat, long_f), site_id)
+        for site_id, lat, long_f in located
+    )[:3]
+    assert [site["site_id"] for site in nearest] == [site_id for _, site_id in expected]
+    assert client.get("/sites/near?lat=95&long=0").status_code == 400
+
+
+def test_sites_index_follows_writes(client):
+    """
+    A removed site drops out of the index straight away.
+    """
+    path = "/sites/within?bbox=-180,-90,180,90"
+    before = [site["site_id"] for site in client.get(path).get_json()["sites"]]
+
+    response = client.post("/sites/remove", json={"site_id": before[0]})
+    assert response.status_code == 200
+
+    after = [site["site_id"] for site in client.get(path).get_json()["sites"]]
+    assert after == before[1:]
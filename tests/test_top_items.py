@@ -0,0 +1,135 @@
+"""
+The tests of the top items of every season.
+"""
+
+from collections import defaultdict
+from datetime import date
+from typing import List
+
+import pytest
+
+from coa_flask_app import analytics, events, items, sites, top_items
+
+CATALOG: List[items.Item] = [
+    items.Item(item_id=item_id, material="Plastic", category="Bags", item_name="Bag")
+    for item_id in (100, 101, 103)
+]
+
+SITES: List[sites.Site] = [
+    sites.Site(
+        site_id=site_id,
+        site_name=f"Beach {site_id}",
+        state="NJ",
+        county="Ocean",
+        town="Town",
+        street=None,
+        zipcode=None,
+        lat=None,
+        long=None,
+    )
+    for site_id in (1, 3)
+]
+
+
+@pytest.fixture(name="report")
+def fixture_report() -> top_items.Report:
+    """
+    Builds the report of a few events, with a tally of an item missing from
+    the catalog and an event at a site missing from the sites.
+
+    Returns:
+        The report.
+    """
+    dataset = analytics.Dataset(
+        [
+            (1, 1, date(2020, 4, 1), 10, 1.0, 1.0, 1),
+            (2, 2, date(2020, 5, 1), 10, 1.0, 1.0, 1),
+            (3, 3, date(2020, 10, 1), 10, 1.0, 1.0, 1),
+        ],
+        [
+            (1, 101, 10),
+            (1, 100, 20),
+            (1, 102, 90),
+            (1, 103, 10),
+            (2, 101, 15),
+            (3, 100, 7),
+        ],
+    )
+    return top_items.build(dataset, CATALOG, SITES, depth=2)
+
+
+def _ranked(found):
+    """
+    Gets the item IDs and quantities of some top items.
+
+    Args:
+        found: The top items.
+
+    Returns:
+        The item ID and quantity of every top item.
+    """
+    return [(item["item_id"], item["quantity"]) for item in found]
+
+
+def test_top_of_season(report):
+    """
+    The items are ranked by their quantity and then by their ID, keeping
+    only catalogued items and as many as the depth.
+    """
+    assert _ranked(top_items.top(report, 2020, "Spring", None, None, 5)) == [
+        (101, 25),
+        (100, 20),
+    ]
+    assert _ranked(top_items.top(report, 2020, "Fall", None, None, 5)) == [(100, 7)]
+    assert not top_items.top(report, 2021, "Spring", None, None, 5)
+
+
+def test_top_limit(report):
+    """
+    Only as many items as asked for are returned.
+    """
+    assert _ranked(top_items.top(report, 2020, "Spring", None, None, 1)) == [(101, 25)]
+    assert not top_items.top(report, 2020, "Spring", None, None, 0)
+    assert not top_items.top(report, 2020, "Spring", None, None, -1)
+
+
+def test_top_of_scopes(report):
+    """
+    The items are ranked within a site, which wins over a county, and within
+    a county, which leaves out sites missing from the sites.
+    """
+    assert _ranked(top_items.top(report, 2020, "Spring", "Ocean", 1, 5)) == [
+        (100, 20),
+        (101, 10),
+    ]
+    assert _ranked(top_items.top(report, 2020, "Spring", None, 2, 5)) == [(101, 15)]
+    assert _ranked(top_items.top(report, 2020, "Spring", "Ocean", None, 5)) == [
+        (100, 20),
+        (101, 10),
+    ]
+    assert not top_items.top(report, 2020, "Spring", "Atlantic", None, 5)
+
+
+def test_top_items_route(client, rows):
+    """
+    The top items route ranks the seeded event items of a season.
+    """
+    ((year,),) = rows("SELECT MAX(strftime('%Y', volunteer_date)) FROM coa_data.event")
+    start, end = events.season_range(int(year), "Spring")
+    totals = defaultdict(int)
+    for item_id, quantity in rows(
+        "SELECT item_id, quantity FROM coa_data.event_items"
+        " JOIN coa_data.event ON event.event_id = event_items.event_id"
+        " WHERE volunteer_date >= ? AND volunteer_date < ?",
+        start,
+        end,
+    ):
+        totals[item_id] += quantity
+    expected = sorted(totals.items(), key=lambda total: (-total[1], total[0]))[:5]
+
+    response = client.get(
+        f"/stats/top-items?volunteer_year={year}&volunteer_season=Spring&n=5"
+    )
+
+    assert _ranked(response.get_json()["top_items"]) == expected
+    assert client.get("/stats/top-items?volunteer_year=2020").status_code == 400